@@ -0,0 +1,251 @@
+# ---------------------------- audio_cache.py ----------------------------
+# کش صوتی TTS با آدرس‌دهی محتوا.
+# کلید هر فایل هش (متن نرمال‌شده، صدا، نرخ نمونه) است. دو لایه دارد:
+#   - حافظه: LRU محدود به حجم، برای پاسخ‌های پرتکرار
+#   - دیسک: فایل‌های WAV کامل با حذف LRU بر اساس حجم کل پوشه (مشترک بین workerها)
+# پاسخ‌ها از روی فایل memory-map شده با ETag و Range سرو می‌شوند تا پخش‌کننده بتواند جابه‌جا شود.
+
+import asyncio
+import hashlib
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from .metrics import audio_bytes
+from .settings import get_settings
+
+try:
+    import fcntl
+except ImportError:  # ویندوز: قفل بین‌پروسه‌ای نداریم
+    fcntl = None
+
+# --------------------------- تنظیمات ---------------------------
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".cache/tts")
+# سقف حافظه و دیسک (TTS_CACHE_MEMORY_MB، TTS_CACHE_DISK_MB) در settings.py هستند
+
+# اندازه‌ی هر تکه هنگام سرو فایل از دیسک
+SERVE_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def cache_key(text: str, voice: str, sample_rate: int, codec: str = "pcm") -> str:
+    # کلید PCM بدون نام کدگذاری ساخته می‌شود تا فایل‌های کش قبلی معتبر بمانند
+    prefix = str(sample_rate) if codec == "pcm" else f"{sample_rate}/{codec}"
+    raw = f"{prefix}\x00{voice}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+# --------------------------- کش ---------------------------
+
+class AudioCache:
+    """
+    کش دو لایه‌ی فایل‌های WAV کامل؛ کلیدها hex هستند و مستقیم نام فایل می‌شوند.
+    لایه‌ی دیسک بین workerها مشترک است، پس خود پوشه مرجع است: وجود فایل با stat و
+    ترتیب LRU با mtime مشخص می‌شود و سقف حجم بعد از هر نوشتن با پیمایش پوشه اعمال می‌شود.
+    همه‌ی متدهای دیسک blocking هستند و باید در thread اجرا شوند.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, memory_bytes=None, disk_bytes=None):
+        settings = get_settings()
+        self.directory = directory
+        self.memory_bytes = (int(settings.tts_cache_memory_mb * 1024 * 1024)
+                             if memory_bytes is None else memory_bytes)
+        self.disk_bytes = (int(settings.tts_cache_disk_mb * 1024 * 1024)
+                           if disk_bytes is None else disk_bytes)
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    # ---- لایه‌ی حافظه ----
+
+    def _memory_put(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get_memory(self, key: str):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            return data
+
+    # ---- لایه‌ی دیسک ----
+
+    def disk_entry(self, key: str):
+        """(مسیر، حجم) فایل کش‌شده یا None؛ mtime آن را تازه می‌کند تا در LRU جلو بیفتد."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return path, os.stat(path).st_size
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, wav: bytes):
+        """فایل WAV کامل را در هر دو لایه ذخیره می‌کند (blocking؛ از thread صدا زده شود)."""
+        with self._lock:
+            self._memory_put(key, wav)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(wav)
+        os.replace(tmp, path)
+        self.enforce_disk_limit(keep=key)
+
+    def enforce_disk_limit(self, keep: str = None):
+        """
+        حجم کل پوشه را با پیمایش آن حساب می‌کند و قدیمی‌ترین فایل‌ها (بر اساس mtime) را
+        تا رسیدن به سقف حذف می‌کند. اگر پروسه‌ی دیگری همین حالا مشغول این کار باشد رد می‌شود.
+        """
+        with _directory_lock(self.directory) as acquired:
+            if not acquired:
+                return
+            entries, total = [], 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(".wav"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, entry.name[:-4], st.st_size))
+                    total += st.st_size
+            entries.sort()
+            for _, key, size in entries:
+                if total <= self.disk_bytes:
+                    break
+                if key == keep:
+                    continue
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    async def put_async(self, key: str, wav: bytes):
+        await asyncio.to_thread(self.put, key, wav)
+
+
+@contextmanager
+def _directory_lock(directory: str):
+    """قفل بین‌پروسه‌ای غیرمسدودکننده روی پوشه‌ی کش (فقط جایی که fcntl هست)."""
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(directory, ".lock"), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+audio_cache = AudioCache()
+
+# --------------------------- سرو با ETag و Range ---------------------------
+
+def _parse_range(header: str, size: int):
+    """فقط یک بازه‌ی bytes=start-end را پشتیبانی می‌کند؛ در غیر این صورت None."""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    start, end = match.group(1), match.group(2)
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    else:
+        # بازه‌ی انتهایی: bytes=-N
+        start = max(size - int(end), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _iter_mmap(path: str, start: int, end: int):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            pos = start
+            while pos <= end:
+                stop = min(pos + SERVE_CHUNK_SIZE, end + 1)
+                yield bytes(view[pos:stop])
+                pos = stop
+        finally:
+            view.release()
+
+
+async def cached_audio_response(request: Request, key: str):
+    """
+    پاسخ HTTP برای یک فایل کش‌شده، یا None اگر کلید در کش نباشد.
+    از If-None-Match (304) و Range (206) پشتیبانی می‌کند.
+    """
+    data = audio_cache.get_memory(key)
+    path = None
+    if data is None:
+        # stat و utime روی دیسک در thread، تا حلقه‌ی رویداد پشت فایل‌سیستم نماند
+        entry = await asyncio.to_thread(audio_cache.disk_entry, key)
+        if entry is None:
+            return None
+        path, size = entry
+    else:
+        size = len(data)
+
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "X-TTS-Audio-Id": key,
+        "X-TTS-Cache": "hit",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    start, end, status = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, size)
+        if byte_range is False:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    audio_bytes.inc("cache", amount=end - start + 1)
+    if data is not None:
+        return Response(content=data[start:end + 1], status_code=status,
+                        headers=headers, media_type="audio/wav")
+    return StreamingResponse(_iter_mmap(path, start, end), status_code=status,
+                             headers=headers, media_type="audio/wav")
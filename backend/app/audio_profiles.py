@@ -0,0 +1,262 @@
+# ---------------------------- audio_profiles.py ----------------------------
+# پروفایل‌های خروجی کم‌حجم برای TTS.
+# خروجی Gemini همیشه PCM 16 بیتی 24kHz است (حدود 48KB در ثانیه)؛ این ماژول آن را به
+# صورت استریم و تکه‌به‌تکه به نرخ نمونه‌ی کمتر و کدگذاری فشرده‌تر تبدیل می‌کند:
+#   - تغییر نرخ نمونه به 16/8kHz با فیلتر پایین‌گذر polyphase
+#   - μ-law و A-law هشت بیتی (G.711)
+#   - IMA-ADPCM چهار بیتی (فرمت استاندارد WAV، بلوک‌های مستقل)
+# همه‌ی تبدیل‌ها با NumPy روی کل تکه انجام می‌شوند، نه نمونه‌به‌نمونه در پایتون.
+
+import math
+import struct
+
+import numpy as np
+
+from .tts import SAMPLE_RATE, STREAMING_DATA_SIZE
+
+# --------------------------- پروفایل‌ها ---------------------------
+
+# نام پروفایل: (نرخ نمونه، کدگذاری)
+PROFILES = {
+    "pcm24k": (24000, "pcm"),
+    "pcm16k": (16000, "pcm"),
+    "pcm8k": (8000, "pcm"),
+    "mulaw8k": (8000, "mulaw"),
+    "alaw8k": (8000, "alaw"),
+    "adpcm16k": (16000, "adpcm"),
+    "adpcm8k": (8000, "adpcm"),
+}
+DEFAULT_PROFILE = "pcm24k"
+
+# wFormatTag هدر WAV برای هر کدگذاری
+_FORMAT_TAGS = {"pcm": 1, "alaw": 6, "mulaw": 7, "adpcm": 0x11}
+
+# --------------------------- تغییر نرخ نمونه ---------------------------
+
+# تعداد ضرایب فیلتر به ازای هر فاز
+RESAMPLE_TAPS = 32
+
+
+class Resampler:
+    """
+    تغییر نرخ نمونه‌ی استریم با نسبت گویا up/down (فیلتر polyphase با پنجره‌ی Kaiser).
+    هر تکه با تاریخچه‌ی تکه‌ی قبلی فیلتر می‌شود تا مرز تکه‌ها صدای اضافه نسازد.
+    """
+
+    def __init__(self, source_rate: int, target_rate: int, taps: int = RESAMPLE_TAPS):
+        g = math.gcd(source_rate, target_rate)
+        self.up, self.down = target_rate // g, source_rate // g
+        self.taps = taps
+        n = self.up * taps
+        # فرکانس قطع کمی پایین‌تر از نایکوئیست خروجی (نسبت به نرخ بالابرده‌شده)
+        cutoff = 0.45 / max(self.up, self.down)
+        t = np.arange(n) - (n - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, 8.0) * self.up
+        # ضرایب هر فاز، معکوس‌شده تا ضرب در پنجره‌ی ورودی همان کانولوشن باشد
+        self.phases = np.stack([h[p::self.up][::-1] for p in range(self.up)]).astype(np.float32)
+        self._buffer = np.zeros(taps - 1, dtype=np.float32)
+        self._start = -(taps - 1)  # اندیس مطلق اولین نمونه‌ی بافر
+        self._next = 0             # اندیس مطلق نمونه‌ی خروجی بعدی
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        buffer = np.concatenate((self._buffer, samples.astype(np.float32)))
+        end = self._start + len(buffer)
+        # خروجی n از نمونه‌ی ورودی (n*down)//up به عقب استفاده می‌کند
+        last = (end * self.up - 1) // self.down
+        n = np.arange(self._next, last + 1)
+        base = (n * self.down) // self.up
+        phase = (n * self.down) % self.up
+
+        out = np.empty(len(n), dtype=np.float32)
+        if len(n):
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)
+            rows = base - self._start - (self.taps - 1)
+            for p in range(self.up):
+                mask = phase == p
+                out[mask] = windows[rows[mask]] @ self.phases[p]
+            self._next = last + 1
+
+        keep_from = (self._next * self.down) // self.up - (self.taps - 1)
+        self._buffer = buffer[keep_from - self._start:]
+        self._start = keep_from
+        return out
+
+# --------------------------- G.711 ---------------------------
+
+_ULAW_SEG_END = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_ALAW_SEG_END = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+
+def encode_mulaw(pcm: np.ndarray) -> bytes:
+    """PCM 16 بیتی به μ-law هشت بیتی (همان الگوریتم g711.c)."""
+    value = pcm.astype(np.int32) >> 2
+    mask = np.where(value < 0, 0x7F, 0xFF)
+    value = np.minimum(np.abs(value), 8159) + 0x21
+    seg = np.searchsorted(_ULAW_SEG_END, value)
+    code = (np.minimum(seg, 7) << 4) | ((value >> (np.minimum(seg, 7) + 1)) & 0x0F)
+    code = np.where(seg >= 8, 0x7F, code)
+    return (code ^ mask).astype(np.uint8).tobytes()
+
+
+def encode_alaw(pcm: np.ndarray) -> bytes:
+    """PCM 16 بیتی به A-law هشت بیتی (همان الگوریتم g711.c)."""
+    value = pcm.astype(np.int32) >> 3
+    mask = np.where(value >= 0, 0xD5, 0x55)
+    value = np.where(value >= 0, value, -value - 1)
+    seg = np.searchsorted(_ALAW_SEG_END, value)
+    shift = np.where(seg < 2, 1, np.minimum(seg, 7))
+    code = (np.minimum(seg, 7) << 4) | ((value >> shift) & 0x0F)
+    code = np.where(seg >= 8, 0x7F, code)
+    return (code ^ mask).astype(np.uint8).tobytes()
+
+# --------------------------- IMA-ADPCM ---------------------------
+
+_STEP_TABLE = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+], dtype=np.int32)
+_INDEX_TABLE = np.array([-1, -1, -1, -1, 2, 4, 6, 8], dtype=np.int32)
+# جدول‌های [اندیس گام، کد]: مقدار بازسازی‌شده (دقیقاً مثل دیکودر استاندارد) و اندیس بعدی
+_VPDIFF = np.array([
+    [(s >> 3) + (s if c & 4 else 0) + (s >> 1 if c & 2 else 0) + (s >> 2 if c & 1 else 0)
+     for c in range(8)]
+    for s in _STEP_TABLE.tolist()
+], dtype=np.int32)
+_NEXT_INDEX = np.clip(np.arange(89)[:, None] + _INDEX_TABLE[None, :], 0, 88).astype(np.intp)
+
+# اندازه‌ی هر بلوک (بایت) و تعداد نمونه‌ی آن: 4 بایت هدر + دو نمونه در هر بایت.
+# بلوک کوچک یعنی حلقه‌ی کوتاه‌تر در انکودر، به قیمت حدود 6٪ سربار هدر.
+ADPCM_BLOCK_ALIGN = 64
+ADPCM_BLOCK_SAMPLES = (ADPCM_BLOCK_ALIGN - 4) * 2 + 1
+# هر فراخوانی انکودر حدود 3ms هزینه‌ی ثابت دارد (حلقه روی طول بلوک، مستقل از تعداد بلوک‌ها)،
+# پس استریم بافر و دسته‌ای کد می‌شود: دسته‌ی اول یک بلوک است (شروع سریع پخش) و هر دسته
+# دو برابر قبلی می‌شود تا به این سقف برسد؛ صدای ارسال‌شده همیشه جلوتر از پخش می‌ماند
+ADPCM_MAX_BATCH_MS = 500
+
+
+def encode_adpcm_blocks(pcm: np.ndarray) -> bytes:
+    """
+    بلوک‌های کامل IMA-ADPCM (هر ADPCM_BLOCK_SAMPLES نمونه یک بلوک).
+    پیش‌بین هر بلوک از هدر خودش شروع می‌شود، پس همه‌ی بلوک‌ها هم‌زمان (برداری)
+    کد می‌شوند و حلقه فقط روی طول یک بلوک است، نه طول صدا.
+    """
+    blocks = pcm.astype(np.int32).reshape(-1, ADPCM_BLOCK_SAMPLES)
+    count = len(blocks)
+    columns = np.ascontiguousarray(blocks.T)
+    predictor = columns[0].copy()
+    # اندیس گام اولیه در هدر ذخیره می‌شود، پس به جای صفر از دامنه‌ی تغییرات همان بلوک
+    # تخمین زده می‌شود تا بلوک‌های کوتاه زمان تطبیق را هدر ندهند
+    spread = np.abs(np.diff(blocks[:, :17], axis=1)).mean(axis=1)
+    index = np.searchsorted(_STEP_TABLE, spread).clip(0, 88).astype(np.intp)
+    initial_index = index.copy()
+    codes = np.empty((ADPCM_BLOCK_SAMPLES - 1, count), dtype=np.int32)
+    for i in range(1, ADPCM_BLOCK_SAMPLES):
+        diff = columns[i] - predictor
+        sign = diff >> 31                  # 0 یا -1
+        magnitude = (diff ^ sign) - sign
+        code = np.minimum((magnitude << 2) // _STEP_TABLE[index], 7)
+        vpdiff = _VPDIFF[index, code]
+        predictor += (vpdiff ^ sign) - sign
+        np.clip(predictor, -32768, 32767, out=predictor)
+        index = _NEXT_INDEX[index, code]
+        codes[i - 1] = code | (sign & 8)
+
+    codes = codes.T.astype(np.uint8)
+    header = np.zeros((count, 4), dtype=np.uint8)
+    header[:, 0:2] = blocks[:, 0].astype("<i2").view(np.uint8).reshape(count, 2)
+    header[:, 2] = initial_index
+    # نمونه‌ی اول هر بایت در نیم‌بایت پایین
+    data = codes[:, 0::2] | (codes[:, 1::2] << 4)
+    return np.concatenate((header, data), axis=1).tobytes()
+
+# --------------------------- هدر WAV ---------------------------
+
+def profile_wav_header(sample_rate: int, codec: str, data_size: int = STREAMING_DATA_SIZE) -> bytes:
+    """هدر WAV برای PCM، G.711 یا IMA-ADPCM (با اندازه‌ی نامعلوم برای استریم)."""
+    tag = _FORMAT_TAGS[codec]
+    if codec == "pcm":
+        fmt = struct.pack('<HHIIHH', tag, 1, sample_rate, sample_rate * 2, 2, 16)
+    elif codec == "adpcm":
+        byte_rate = sample_rate * ADPCM_BLOCK_ALIGN // ADPCM_BLOCK_SAMPLES
+        fmt = struct.pack('<HHIIHHHH', tag, 1, sample_rate, byte_rate,
+                          ADPCM_BLOCK_ALIGN, 4, 2, ADPCM_BLOCK_SAMPLES)
+    else:
+        fmt = struct.pack('<HHIIHHH', tag, 1, sample_rate, sample_rate, 1, 8, 0)
+    riff_size = min(4 + 8 + len(fmt) + 8 + data_size, 0xFFFFFFFF)
+    return b''.join((
+        b'RIFF', struct.pack('<I', riff_size), b'WAVE',
+        b'fmt ', struct.pack('<I', len(fmt)), fmt,
+        b'data', struct.pack('<I', data_size),
+    ))
+
+# --------------------------- انکودر استریم ---------------------------
+
+class AudioEncoder:
+    """
+    تبدیل استریم PCM 24kHz به یک پروفایل: encode برای هر تکه و flush در پایان.
+    هر استریم انکودر خودش را دارد (وضعیت فیلتر و بلوک ناقص ADPCM).
+    """
+
+    def __init__(self, profile: str = DEFAULT_PROFILE, source_rate: int = SAMPLE_RATE):
+        self.profile = profile
+        self.sample_rate, self.codec = PROFILES[profile]
+        self._resampler = (Resampler(source_rate, self.sample_rate)
+                           if self.sample_rate != source_rate else None)
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._odd = b""
+        blocks = math.ceil(self.sample_rate * ADPCM_MAX_BATCH_MS / 1000 / ADPCM_BLOCK_SAMPLES)
+        self._max_batch = max(1, blocks) * ADPCM_BLOCK_SAMPLES
+        self._batch = ADPCM_BLOCK_SAMPLES
+
+    @property
+    def passthrough(self) -> bool:
+        return self._resampler is None and self.codec == "pcm"
+
+    def header(self, data_size: int = STREAMING_DATA_SIZE) -> bytes:
+        return profile_wav_header(self.sample_rate, self.codec, data_size)
+
+    def to_wav(self, data: bytes) -> bytes:
+        return self.header(len(data)) + data
+
+    def encode(self, pcm: bytes) -> bytes:
+        if self.passthrough:
+            return pcm
+        # تکه‌های Gemini ممکن است وسط یک نمونه‌ی دوبایتی قطع شوند
+        pcm = self._odd + pcm
+        cut = len(pcm) - len(pcm) % 2
+        self._odd = pcm[cut:]
+        samples = np.frombuffer(pcm[:cut], dtype="<i2")
+        if self._resampler is not None:
+            samples = np.clip(np.rint(self._resampler.process(samples)), -32768, 32767)
+            samples = samples.astype(np.int16)
+        return self._encode_samples(samples)
+
+    def flush(self) -> bytes:
+        if self.codec != "adpcm" or not len(self._pending):
+            return b""
+        # بلوک ناقص آخر با سکوت کامل می‌شود
+        pad = -len(self._pending) % ADPCM_BLOCK_SAMPLES
+        samples = np.concatenate((self._pending, np.zeros(pad, dtype=np.int16)))
+        self._pending = np.zeros(0, dtype=np.int16)
+        return encode_adpcm_blocks(samples)
+
+    def _encode_samples(self, samples: np.ndarray) -> bytes:
+        if self.codec == "pcm":
+            return samples.astype("<i2").tobytes()
+        if self.codec == "mulaw":
+            return encode_mulaw(samples)
+        if self.codec == "alaw":
+            return encode_alaw(samples)
+        samples = np.concatenate((self._pending, samples))
+        if len(samples) < self._batch:
+            self._pending = samples
+            return b""
+        whole = len(samples) - len(samples) % ADPCM_BLOCK_SAMPLES
+        self._pending = samples[whole:]
+        self._batch = min(self._batch * 2, self._max_batch)
+        return encode_adpcm_blocks(samples[:whole])
@@ -0,0 +1,204 @@
+# ---------------------------- fake_gemini.py ----------------------------
+# جایگزین محلی و قطعی برای GenerativeModel، برای اندازه‌گیری و تست بدون مصرف سهمیه.
+# همان شکل پاسخ‌های SDK (candidates / content.parts / finish_reason / text) را برمی‌گرداند:
+#   - متن: پاسخ قطعی بر اساس هش پرامپت با تأخیر اولیه و نرخ توکن قابل تنظیم
+#   - صدا: PCM مصنوعی 24kHz (بوق سینوسی) با آهنگ تکه‌ها متناسب با طول متن
+#   - خطا: تزریق تصادفی (ولی قابل تکرار) 429/503/500 یا گیر کردن
+# با GEMINI_BACKEND=fake فعال می‌شود (model_backend.py).
+
+import asyncio
+import base64
+import hashlib
+import math
+import os
+import random
+import struct
+from types import SimpleNamespace
+
+from google.api_core import exceptions as google_exceptions
+
+# --------------------------- تنظیمات ---------------------------
+
+# تأخیر تا اولین تکه (ثانیه)
+FAKE_GEMINI_LATENCY = float(os.getenv("FAKE_GEMINI_LATENCY", "0.3"))
+# سرعت تولید متن (توکن در ثانیه) و اندازه‌ی هر تکه‌ی استریم (توکن)
+FAKE_GEMINI_TOKENS_PER_SEC = float(os.getenv("FAKE_GEMINI_TOKENS_PER_SEC", "200"))
+FAKE_GEMINI_CHUNK_TOKENS = int(os.getenv("FAKE_GEMINI_CHUNK_TOKENS", "20"))
+# طول پاسخ متنی (توکن)
+FAKE_GEMINI_REPLY_TOKENS = int(os.getenv("FAKE_GEMINI_REPLY_TOKENS", "300"))
+# صدا: ثانیه‌ی صوت به ازای هر کاراکتر، طول هر تکه (میلی‌ثانیه) و چند برابر سریع‌تر از زمان واقعی
+FAKE_GEMINI_AUDIO_SEC_PER_CHAR = float(os.getenv("FAKE_GEMINI_AUDIO_SEC_PER_CHAR", "0.06"))
+FAKE_GEMINI_AUDIO_CHUNK_MS = int(os.getenv("FAKE_GEMINI_AUDIO_CHUNK_MS", "500"))
+FAKE_GEMINI_AUDIO_SPEEDUP = float(os.getenv("FAKE_GEMINI_AUDIO_SPEEDUP", "4"))
+# تزریق خطا: احتمال و نوع (429، 503، 500 یا hang)
+FAKE_GEMINI_ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0"))
+FAKE_GEMINI_ERROR_KIND = os.getenv("FAKE_GEMINI_ERROR_KIND", "429")
+FAKE_GEMINI_SEED = int(os.getenv("FAKE_GEMINI_SEED", "0"))
+# پرامپت‌های شامل این عبارت به عنوان SAFETY مسدود می‌شوند
+FAKE_GEMINI_SAFETY_TRIGGER = os.getenv("FAKE_GEMINI_SAFETY_TRIGGER", "[[unsafe]]")
+
+SAMPLE_RATE = 24000
+
+_WORDS = (
+    "دانشجو", "الگوریتم", "داده", "ساختار", "تحلیل", "پروژه", "برنامه", "مسئله",
+    "روش", "نتیجه", "مثال", "تعریف", "پیچیدگی", "حافظه", "زمان", "درس",
+    "و", "در", "به", "از", "که", "این", "را", "با", "است", "می‌شود",
+)
+
+# --------------------------- شکل پاسخ ---------------------------
+
+def _finish(name):
+    return SimpleNamespace(name=name) if name else None
+
+
+def _chunk(parts, finish_reason=None):
+    return SimpleNamespace(candidates=[SimpleNamespace(
+        content=SimpleNamespace(parts=parts),
+        finish_reason=_finish(finish_reason),
+    )])
+
+
+class FakeResponse:
+    """پاسخ کامل؛ مثل SDK ویژگی text دارد و روی پاسخ مسدودشده خطا می‌دهد."""
+
+    def __init__(self, text, finish_reason="STOP"):
+        self.candidates = [SimpleNamespace(
+            content=SimpleNamespace(parts=[SimpleNamespace(text=text)] if text else []),
+            finish_reason=_finish(finish_reason),
+        )]
+
+    @property
+    def text(self):
+        parts = self.candidates[0].content.parts
+        if not parts:
+            raise ValueError("The response has no text parts (finish_reason=SAFETY).")
+        return "".join(p.text for p in parts)
+
+# --------------------------- صدای مصنوعی ---------------------------
+
+_tone = None
+
+
+def _tone_period() -> bytes:
+    """یک ثانیه بوق 440Hz با دامنه‌ی کم؛ یک بار ساخته و تکرار می‌شود."""
+    global _tone
+    if _tone is None:
+        _tone = b"".join(
+            struct.pack("<h", int(3000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)))
+            for i in range(SAMPLE_RATE)
+        )
+    return _tone
+
+
+def synthetic_pcm(seconds: float) -> bytes:
+    size = int(seconds * SAMPLE_RATE) * 2
+    tone = _tone_period()
+    return (tone * (size // len(tone) + 1))[:size]
+
+# --------------------------- مدل ---------------------------
+
+def _prompt_text(contents) -> str:
+    """متن پرامپت از هر شکلی از contents (رشته، لیست، dictهای role/parts)."""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        if "text" in contents:
+            return contents["text"]
+        return _prompt_text(contents.get("parts", ""))
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_prompt_text(c) for c in contents)
+    return str(getattr(contents, "text", contents))
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name="gemini-fake", system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self._calls = 0
+        self._rng = random.Random(FAKE_GEMINI_SEED)
+
+    # ---- تزریق خطا ----
+
+    async def _maybe_fail(self):
+        self._calls += 1
+        if FAKE_GEMINI_ERROR_RATE <= 0 or self._rng.random() >= FAKE_GEMINI_ERROR_RATE:
+            return
+        kind = FAKE_GEMINI_ERROR_KIND
+        if kind == "hang":
+            await asyncio.sleep(3600)
+        if kind == "503":
+            raise google_exceptions.ServiceUnavailable("fake: service unavailable")
+        if kind == "500":
+            raise google_exceptions.InternalServerError("fake: internal error")
+        raise google_exceptions.ResourceExhausted("fake: quota exceeded")
+
+    # ---- تولید متن ----
+
+    def _reply_words(self, prompt: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed ^ FAKE_GEMINI_SEED)
+        return [rng.choice(_WORDS) for _ in range(FAKE_GEMINI_REPLY_TOKENS)]
+
+    async def _text_stream(self, prompt: str, blocked: bool):
+        words = self._reply_words(prompt)
+        step = max(1, FAKE_GEMINI_CHUNK_TOKENS)
+        for i in range(0, len(words), step):
+            if blocked and i >= len(words) // 2:
+                # مسدود شدن وسط استریم
+                yield _chunk([], "SAFETY")
+                return
+            await asyncio.sleep(step / FAKE_GEMINI_TOKENS_PER_SEC)
+            last = i + step >= len(words)
+            text = " ".join(words[i:i + step]) + ("" if last else " ")
+            yield _chunk([SimpleNamespace(text=text)], "STOP" if last else None)
+
+    # ---- تولید صدا ----
+
+    async def _audio_stream(self, text: str):
+        total = len(text) * FAKE_GEMINI_AUDIO_SEC_PER_CHAR
+        chunk_sec = FAKE_GEMINI_AUDIO_CHUNK_MS / 1000
+        sent = 0.0
+        while sent < total:
+            seconds = min(chunk_sec, total - sent)
+            await asyncio.sleep(seconds / FAKE_GEMINI_AUDIO_SPEEDUP)
+            sent += seconds
+            data = base64.b64encode(synthetic_pcm(seconds))
+            yield _chunk([SimpleNamespace(inline_data=SimpleNamespace(
+                mime_type=f"audio/L16;rate={SAMPLE_RATE}", data=data))],
+                "STOP" if sent >= total else None)
+
+    # ---- رابط GenerativeModel ----
+
+    async def generate_content_async(self, contents, *, generation_config=None,
+                                     stream=False, **kwargs):
+        await asyncio.sleep(FAKE_GEMINI_LATENCY)
+        await self._maybe_fail()
+
+        prompt = _prompt_text(contents)
+        is_audio = "AUDIO" in ((generation_config or {}).get("response_modalities") or ())
+        blocked = FAKE_GEMINI_SAFETY_TRIGGER in prompt
+
+        if is_audio:
+            chunks = self._audio_stream(prompt)
+        else:
+            chunks = self._text_stream(prompt, blocked)
+        if stream:
+            return chunks
+
+        # پاسخ کامل: همان تکه‌ها (با همان زمان تولید) یکجا جمع می‌شوند
+        parts = []
+        finish_reason = "STOP"
+        async for chunk in chunks:
+            candidate = chunk.candidates[0]
+            parts.extend(candidate.content.parts)
+            if candidate.finish_reason:
+                finish_reason = candidate.finish_reason.name
+        if finish_reason == "SAFETY":
+            return FakeResponse("", "SAFETY")
+        return FakeResponse("".join(getattr(p, "text", "") for p in parts), finish_reason)
+
+    def generate_content(self, contents, **kwargs):
+        return asyncio.run(self.generate_content_async(contents, **kwargs))
+
+    async def count_tokens_async(self, contents, **kwargs):
+        return SimpleNamespace(total_tokens=len(_prompt_text(contents)) // 3 + 1)
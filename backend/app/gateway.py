@@ -0,0 +1,369 @@
+# ---------------------------- gateway.py ----------------------------
+# کنترل پذیرش درخواست‌های بالادستی.
+#   - سطل توکن سراسری به اندازه‌ی سهمیه‌ی Gemini (در scheduler.py و به ترتیب اولویت مصرف می‌شود)
+#   - سطل توکن جدا برای هر کاربر (IP، و جلسه علاوه بر IP) تا یک کاربر پرمصرف سهم بقیه را نخورد
+#   - صف انتظار محدود؛ وقتی پر باشد یا انتظار از مهلت درخواست بیشتر شود، 429 با Retry-After
+#   - مهلت کل درخواست (deadline) که تلاش‌های مجدد و انتظارها باید در آن جا شوند؛
+#     برای هر مسیر قابل تنظیم است و کلاینت می‌تواند با هدر X-Request-Timeout کوتاه‌ترش کند
+#   - لغو کار بالادستی وقتی کلاینت اتصال را قطع می‌کند یا مهلت درخواست تمام می‌شود
+# کاربر، مهلت و کلاس کار (chat/summarize/tts/batch) از طریق contextvar به لایه‌ی gemini_client می‌رسند.
+
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import OrderedDict
+
+from .metrics import Counter
+from .settings import get_settings
+
+# --------------------------- تنظیمات ---------------------------
+
+# سهمیه‌ی سراسری، طول صف بالادستی و مهلت پیش‌فرض درخواست در settings.py هستند
+# سهم هر کاربر: فراخوانی در دقیقه و حداکثر انفجار
+CLIENT_RATE_PER_MIN = float(os.getenv("CLIENT_RATE_PER_MIN", "60"))
+CLIENT_RATE_BURST = float(os.getenv("CLIENT_RATE_BURST", "20"))
+# تعداد پروکسی‌های مورد اعتماد جلوی سرور (مثلاً 1 برای Render)؛ IP کاربر همان مقدار
+# X-Forwarded-For است که آخرین پروکسی مورد اعتماد اضافه کرده. 0 یعنی هدر نادیده گرفته شود
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+# مهلت مسیرهای طولانی (ثانیه)؛ ROUTE_DEADLINES مثل "/summarize=300,/reply=60" این‌ها را تغییر می‌دهد
+TTS_REQUEST_DEADLINE = float(os.getenv("TTS_REQUEST_DEADLINE", "600"))
+REPLY_BATCH_DEADLINE = float(os.getenv("REPLY_BATCH_DEADLINE", "600"))
+# فرصت اضافه بعد از مهلت، قبل از لغو اجباری درخواست
+REQUEST_DEADLINE_GRACE = float(os.getenv("REQUEST_DEADLINE_GRACE", "5"))
+
+_MAX_CLIENTS = 10000
+
+# --------------------------- خطاها ---------------------------
+
+class UpstreamBusy(Exception):
+    """درخواست به خاطر ظرفیت بالادستی رد شد؛ کلاینت باید بعد از retry_after دوباره تلاش کند."""
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Overloaded(UpstreamBusy):
+    """صف انتظار پر است یا نوبت این کاربر در مهلت درخواست نمی‌رسد."""
+    status_code = 429
+
+
+class UpstreamUnavailable(UpstreamBusy):
+    """Gemini بعد از همه‌ی تلاش‌های مجدد هنوز 429/503 برمی‌گرداند."""
+    status_code = 503
+
+
+class UpstreamTimeout(Exception):
+    """فراخوانی Gemini در مهلت تعیین‌شده پاسخ نداد یا مهلت درخواست تمام شد (504)."""
+    status_code = 504
+
+# --------------------------- زمینه‌ی درخواست ---------------------------
+
+# کلیدهای سهم کاربر؛ هر فراخوانی از سطل همه‌ی آن‌ها برداشت می‌کند
+_client = contextvars.ContextVar("upstream_client", default=("anonymous",))
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+_job_class = contextvars.ContextVar("upstream_job_class", default="chat")
+
+
+def set_client(client: str):
+    _client.set((client,))
+
+
+def client_keys() -> tuple:
+    return _client.get()
+
+
+def restore_clients(keys: tuple):
+    """کلیدهای سهم را به مقدار قبلی (از client_keys) برمی‌گرداند؛ برای اتصال‌های چندنوبتی."""
+    _client.set(keys)
+
+
+def add_client(client: str):
+    """کلید سهم دیگری (مثل جلسه) که علاوه بر کلیدهای فعلی شارژ می‌شود، نه به جای آن‌ها."""
+    keys = _client.get()
+    if client not in keys:
+        _client.set(keys + (client,))
+
+
+def _parse_route_deadlines(text: str) -> dict:
+    deadlines = {}
+    for item in text.split(","):
+        path, _, seconds = item.partition("=")
+        if path.strip() and seconds.strip():
+            deadlines[path.strip().rstrip("/") or "/"] = float(seconds)
+    return deadlines
+
+
+ROUTE_DEADLINES = {
+    "/tts": TTS_REQUEST_DEADLINE,
+    "/ws/voice": TTS_REQUEST_DEADLINE,
+    "/reply/batch": REPLY_BATCH_DEADLINE,
+    **_parse_route_deadlines(os.getenv("ROUTE_DEADLINES", "")),
+}
+
+# کلاس کار هر مسیر برای زمان‌بند؛ گفتگوی صوتی هم تعاملی حساب می‌شود
+ROUTE_JOB_CLASSES = {
+    "/reply": "chat",
+    "/ws/voice": "chat",
+    "/reply/batch": "batch",
+    "/summarize": "summarize",
+    "/tts": "tts",
+}
+
+
+def _route_lookup(table: dict, path: str, default):
+    """مقدار طولانی‌ترین پیشوند تعریف‌شده‌ی مسیر در table، وگرنه default."""
+    path = path.rstrip("/") or "/"
+    while True:
+        if path in table:
+            return table[path]
+        if path == "/":
+            return default
+        path = path.rsplit("/", 1)[0] or "/"
+
+
+def route_deadline(path: str) -> float:
+    """مهلت مسیر: طولانی‌ترین پیشوند تعریف‌شده، وگرنه مهلت پیش‌فرض درخواست."""
+    return _route_lookup(ROUTE_DEADLINES, path, get_settings().request_deadline)
+
+
+def route_job_class(path: str) -> str:
+    return _route_lookup(ROUTE_JOB_CLASSES, path, "chat")
+
+
+def set_job_class(name: str):
+    _job_class.set(name)
+
+
+def job_class() -> str:
+    return _job_class.get()
+
+
+def set_deadline(seconds: float = None):
+    _deadline.set(time.monotonic() + (seconds or get_settings().request_deadline))
+
+
+def clear_deadline():
+    """مهلت context فعلی را برمی‌دارد (برای کارهای مشترکی که هر منتظر مهلت خودش را دارد)."""
+    _deadline.set(None)
+
+
+def remaining() -> float:
+    """ثانیه‌های باقی‌مانده از مهلت درخواست فعلی (بی‌نهایت اگر مهلتی تعیین نشده باشد)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return math.inf
+    return deadline - time.monotonic()
+
+# --------------------------- سطل توکن ---------------------------
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, max_wait: float):
+        """
+        یک توکن رزرو می‌کند و زمان انتظار تا آماده شدنش را برمی‌گرداند.
+        اگر انتظار از max_wait بیشتر باشد چیزی رزرو نمی‌شود و (False, انتظار) برمی‌گردد.
+        """
+        if self.rate <= 0:
+            return True, 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return False, wait
+        self.tokens -= 1
+        return True, wait
+
+    def refund(self):
+        """توکن رزروشده‌ای را که استفاده نشد برمی‌گرداند."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+# --------------------------- دروازه ---------------------------
+
+class Gateway:
+    def __init__(self, rate=None, burst=None,
+                 client_rate_per_min=CLIENT_RATE_PER_MIN, client_burst=CLIENT_RATE_BURST,
+                 queue_size=None):
+        settings = get_settings()
+        # پیش‌فرض: سهم همین worker از سهمیه‌ی سراسری
+        worker_rate, worker_burst = settings.per_worker_rate()
+        self.bucket = TokenBucket(worker_rate if rate is None else rate,
+                                  worker_burst if burst is None else burst)
+        self.client_rate = client_rate_per_min / 60
+        self.client_burst = client_burst
+        self.queue_size = settings.upstream_queue_size if queue_size is None else queue_size
+        self.waiting = 0
+        self._clients = OrderedDict()
+
+    def _client_bucket(self, client: str) -> TokenBucket:
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.client_rate, self.client_burst)
+            self._clients[client] = bucket
+            if len(self._clients) > _MAX_CLIENTS:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        return bucket
+
+    async def admit(self):
+        """
+        تا رسیدن نوبت این کاربر (سهم کاربر) صبر می‌کند؛ سهمیه‌ی سراسری را زمان‌بند
+        هنگام دادن جای خالی مصرف می‌کند. اگر صف پر باشد یا انتظار از مهلت درخواست
+        بگذرد Overloaded می‌دهد.
+        """
+        if self.waiting >= self.queue_size:
+            raise Overloaded("Upstream queue is full", retry_after=1 / max(self.bucket.rate, 0.1))
+
+        # همه یا هیچ: اگر یکی از سطل‌ها جا نداشته باشد، برداشت از قبلی‌ها برگردانده می‌شود
+        reserved, wait = [], 0.0
+        for key in _client.get():
+            bucket = self._client_bucket(key)
+            ok, bucket_wait = bucket.reserve(remaining())
+            if not ok:
+                for previous in reserved:
+                    previous.refund()
+                raise Overloaded("Client rate limit exceeded", retry_after=bucket_wait)
+            reserved.append(bucket)
+            wait = max(wait, bucket_wait)
+
+        if wait > 0:
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.waiting -= 1
+
+    def stats(self) -> dict:
+        return {"waiting": self.waiting, "clients": len(self._clients),
+                "tokens": round(self.bucket.tokens, 2)}
+
+
+gateway = Gateway()
+
+# --------------------------- middleware ---------------------------
+
+client_disconnects = Counter(
+    "client_disconnects_total", "Requests cancelled because the client disconnected.")
+deadline_cancels = Counter(
+    "request_deadline_cancels_total", "Requests cancelled after their deadline passed.")
+
+
+def _request_deadline(scope) -> float:
+    # کلاینت می‌تواند مهلت را کوتاه‌تر کند، ولی نه بیشتر از سقف مسیر
+    seconds = route_deadline(scope.get("path", "/"))
+    for name, value in scope.get("headers", ()):
+        if name == b"x-request-timeout":
+            try:
+                requested = float(value)
+            except ValueError:
+                break
+            if requested > 0:
+                seconds = min(seconds, requested)
+            break
+    return seconds
+
+
+class UpstreamContextMiddleware:
+    """
+    برای هر درخواست کاربر (IP)، کلاس کار و مهلت را در contextvarها قرار می‌دهد و درخواست HTTP را
+    در یک task جدا اجرا می‌کند تا اگر کلاینت قطع شد یا مهلت (به اضافه‌ی فرصت) تمام شد،
+    handler و فراخوانی‌های بالادستی‌اش لغو شوند و جای آن‌ها در زمان‌بند آزاد شود.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        set_client(_client_ip(scope))
+        set_job_class(route_job_class(scope.get("path", "/")))
+        seconds = _request_deadline(scope)
+        set_deadline(seconds)
+        if scope["type"] == "websocket":
+            await self.app(scope, receive, send)
+            return
+
+        # فقط این middleware از receive اصلی می‌خواند؛ handler پیام‌ها را از صف می‌گیرد
+        messages = asyncio.Queue()
+        state = {"started": False, "complete": False, "timed_out": False}
+
+        async def app_receive():
+            message = await messages.get()
+            if message["type"] == "http.disconnect":
+                messages.put_nowait(message)
+            return message
+
+        async def app_send(message):
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                state["complete"] = True
+            await send(message)
+
+        task = asyncio.ensure_future(self.app(scope, app_receive, app_send))
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    if not state["complete"] and not task.done():
+                        scope["client_disconnected"] = True
+                        client_disconnects.inc()
+                        task.cancel()
+                    return
+
+        def expire():
+            if not task.done():
+                state["timed_out"] = True
+                deadline_cancels.inc()
+                task.cancel()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        timer = asyncio.get_running_loop().call_later(seconds + REQUEST_DEADLINE_GRACE, expire)
+        try:
+            await asyncio.wait({task})
+        finally:
+            watcher.cancel()
+            timer.cancel()
+            if not task.done():
+                # خود این middleware لغو شده (مثلاً خاموش شدن سرور)
+                task.cancel()
+
+        if not task.cancelled():
+            task.result()
+        elif state["timed_out"] and not state["started"]:
+            await send({"type": "http.response.start", "status": 504,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body",
+                        "body": b'{"detail": "Request deadline exceeded"}'})
+
+
+def _client_ip(scope, trusted_hops: int = None) -> str:
+    """
+    IP کاربر: همتای واقعی اتصال، یا پشت TRUSTED_PROXY_HOPS پروکسی، مقداری از
+    X-Forwarded-For که آخرین پروکسی مورد اعتماد اضافه کرده (از سمت راست). مقدارهای
+    سمت چپ را خود کاربر می‌تواند بنویسد و هرگز استفاده نمی‌شوند.
+    """
+    hops = TRUSTED_PROXY_HOPS if trusted_hops is None else trusted_hops
+    if hops > 0:
+        forwarded = []
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                forwarded.extend(v.strip() for v in value.decode("latin-1").split(","))
+        if len(forwarded) >= hops and forwarded[-hops]:
+            return forwarded[-hops]
+    client = scope.get("client")
+    return client[0] if client else "anonymous"
@@ -0,0 +1,182 @@
+# ---------------------------- gemini_client.py ----------------------------
+# لایه‌ی فراخوانی async برای Gemini.
+# همه‌ی درخواست‌های بالادستی (چت، خلاصه‌سازی، TTS) از این ماژول عبور می‌کنند تا
+# حلقه‌ی رویداد هیچ‌وقت پشت یک فراخوانی blocking گیر نکند و تعداد فراخوانی‌های
+# هم‌زمان به Gemini محدود و قابل تنظیم باشد. پذیرش (سهم کاربر و صف) در gateway.py،
+# ترتیب نوبت‌ها بر اساس کلاس کار و هزینه در scheduler.py انجام می‌شود و خطاهای موقت
+# 429/503 با backoff نمایی تصادفی دوباره تلاش می‌شوند.
+
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+from .gateway import UpstreamTimeout, UpstreamUnavailable, gateway, remaining
+from .metrics import upstream_duration, upstream_errors, upstream_inflight
+from .scheduler import Scheduler, job_cost
+from .settings import get_settings
+
+load_dotenv()
+
+# --------------------------- تنظیمات ---------------------------
+
+# هم‌زمانی و مهلت‌ها (GEMINI_MAX_CONCURRENCY، GEMINI_TIMEOUT، GEMINI_STREAM_CHUNK_TIMEOUT)
+# در settings.py هستند
+# تلاش مجدد برای خطاهای موقت
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+
+
+# خطاهایی که تلاش مجدد برایشان معنی دارد
+RETRYABLE_ERRORS = (
+    UpstreamTimeout,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+)
+
+# جای‌های هم‌زمانی و سهمیه‌ی سراسری به ترتیب کلاس کار و هزینه داده می‌شوند
+scheduler = Scheduler(get_settings().upstream_concurrency, gateway.bucket)
+
+
+def _request_options(timeout):
+    return {"timeout": timeout}
+
+
+def _attempt_timeout(timeout: float = None) -> float:
+    """مهلت یک تلاش: کمترین مقدار بین مهلت فراخوانی و باقی‌مانده‌ی مهلت درخواست."""
+    attempt_timeout = min(timeout or get_settings().upstream_timeout, remaining())
+    if attempt_timeout <= 0:
+        raise UpstreamTimeout("Request deadline exceeded")
+    return attempt_timeout
+
+# --------------------------- پذیرش و تلاش مجدد ---------------------------
+
+@asynccontextmanager
+async def _upstream_slot(cost: int):
+    """پذیرش از gateway و سپس نوبت در زمان‌بند (بر اساس کلاس کار و هزینه)."""
+    await gateway.admit()
+    gateway.waiting += 1
+    try:
+        job_class = await scheduler.acquire(cost=cost)
+    finally:
+        gateway.waiting -= 1
+    upstream_inflight.inc()
+    try:
+        yield
+    finally:
+        upstream_inflight.dec()
+        scheduler.release(job_class)
+
+
+def _record_attempt(call: str, start: float, error: Exception = None):
+    if error is not None:
+        upstream_errors.inc(type(error).__name__)
+    upstream_duration.observe(call, "ok" if error is None else "error",
+                              value=time.perf_counter() - start)
+
+
+async def _backoff(attempt: int, error: Exception):
+    """قبل از تلاش بعدی صبر می‌کند؛ اگر تلاش‌ها یا مهلت تمام شده باشد خطا می‌دهد."""
+    delay = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** (attempt - 1)))
+    if attempt > GEMINI_MAX_RETRIES or delay >= remaining():
+        if isinstance(error, UpstreamTimeout):
+            raise error
+        raise UpstreamUnavailable(f"Gemini unavailable: {error}",
+                                  retry_after=GEMINI_BACKOFF_MAX) from error
+    await asyncio.sleep(delay)
+
+# --------------------------- فراخوانی ساده ---------------------------
+
+async def generate(model, contents, timeout: float = None, **kwargs):
+    """
+    نسخه‌ی async از model.generate_content.
+    تا زمان پذیرش و رسیدن نوبت در زمان‌بند صبر می‌کند و بعد پاسخ کامل را برمی‌گرداند.
+    """
+    cost = job_cost(contents)
+    attempt = 0
+    while True:
+        async with _upstream_slot(cost):
+            attempt_timeout = _attempt_timeout(timeout)
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(
+                        contents, request_options=_request_options(attempt_timeout), **kwargs
+                    ),
+                    attempt_timeout,
+                )
+                _record_attempt("generate", start)
+                return response
+            except asyncio.TimeoutError:
+                error = UpstreamTimeout(f"Gemini did not respond within {attempt_timeout:.0f}s")
+                _record_attempt("generate", start, error)
+            except RETRYABLE_ERRORS as e:
+                error = e
+                _record_attempt("generate", start, error)
+            except Exception as e:
+                _record_attempt("generate", start, e)
+                raise
+        attempt += 1
+        await _backoff(attempt, error)
+
+# --------------------------- فراخوانی استریم ---------------------------
+
+async def generate_stream(model, contents, timeout: float = None,
+                          chunk_timeout: float = None, **kwargs):
+    """
+    نسخه‌ی استریم async از model.generate_content.
+    تکه‌ها را به محض رسیدن yield می‌کند؛ نوبت زمان‌بند تا پایان استریم نگه داشته می‌شود.
+    تلاش مجدد فقط تا قبل از رسیدن اولین تکه انجام می‌شود.
+    """
+    chunk_timeout = chunk_timeout or get_settings().stream_chunk_timeout
+    cost = job_cost(contents)
+    attempt = 0
+    while True:
+        async with _upstream_slot(cost):
+            started = False
+            start = time.perf_counter()
+            try:
+                attempt_timeout = _attempt_timeout(timeout)
+                try:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(
+                            contents, stream=True,
+                            request_options=_request_options(attempt_timeout), **kwargs
+                        ),
+                        attempt_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    raise UpstreamTimeout(f"Gemini did not respond within {attempt_timeout:.0f}s")
+
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(), min(chunk_timeout, max(remaining(), 0.001))
+                        )
+                    except StopAsyncIteration:
+                        _record_attempt("stream", start)
+                        return
+                    except asyncio.TimeoutError:
+                        raise UpstreamTimeout(f"Gemini stream stalled for {chunk_timeout:.0f}s")
+                    started = True
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                _record_attempt("stream", start, e)
+                if started:
+                    raise
+                error = e
+            except Exception as e:
+                _record_attempt("stream", start, e)
+                raise
+        attempt += 1
+        await _backoff(attempt, error)
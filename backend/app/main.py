@@ -1,173 +1,662 @@
 # ---------------------------- main.py (نسخه‌ی اصلاح‌شده کامل) ----------------------------
 # این نسخه شامل اصلاح کامل TTS، رفع خطاهای generationConfig، و سازگاری با Gemini API جدید است.
 
-import os
+# زمان import ماژول‌های اپ برای اندازه‌گیری شروع سرد (در /health/live و /health/ready)
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from .orchestrator import get_reply_user
-import base64
-import io
-import struct
-import google.generativeai as genai
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from .orchestrator import REPLY_MAX_INPUT_TOKENS, batch_reply_user, get_reply_user, stream_reply_user
+from .tts import (SAMPLE_RATE, TTS_MAX_INPUT_TOKENS, SentenceStream, stream_segments,
+                  stream_speech)
+from .audio_cache import audio_cache, cache_key, cached_audio_response
+from .audio_profiles import DEFAULT_PROFILE, PROFILES, AudioEncoder
+from .response_cache import document_key, reply_cache, summary_cache
+from .sessions import session_store, valid_session_id
+from .summarizer import (SUMMARIZE_MAX_INPUT_TOKENS, SUMMARY_CHUNK_TOKENS, SummarySafetyBlocked,
+                         summarize)
+from .tokens import (TOKEN_CALIBRATION, InputTooLarge, calibrate, calibration, estimate_tokens,
+                     govern_input, register_input_policy, trim_to_tokens)
+from .static_assets import static_assets
+from .gemini_client import scheduler
+from .semantic_cache import save_snapshot, semantic_cache
+from .settings import Settings, configure, get_settings
+from .model_backend import ModelUnavailable, client_state, get_model, register_model, warmup
+from .gateway import (UpstreamBusy, UpstreamContextMiddleware, UpstreamTimeout, add_client,
+                      client_keys, gateway, restore_clients, route_deadline, set_deadline)
+from .metrics import (Counter, InstrumentedThreadPool, MetricsMiddleware, audio_bytes,
+                      first_chunk, render_all, safety_blocks, sample_loop_lag)
+from anyio.to_thread import current_default_thread_limiter
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+from typing import List, Optional
 
 load_dotenv()
 
+# محدودیت‌های /reply/batch
+REPLY_BATCH_MAX_ITEMS = int(os.getenv("REPLY_BATCH_MAX_ITEMS", "100"))
+
 # --------------------------- مدل‌های ورودی ---------------------------
 
 class UserMessage(BaseModel):
     user_message: str
+    # شناسه‌ی جلسه برای گفتگوی چندنوبتی؛ بدون آن هر پیام مستقل است
+    session_id: Optional[str] = None
+
+class VoiceRequest(UserMessage):
+    voice: str = "Kore"
+
+class BatchRequest(BaseModel):
+    # هر پیام مستقل و بدون تاریخچه جواب داده می‌شود
+    messages: List[str]
 
 class TTSRequest(BaseModel):
     text: str
     voice: str = "Kore"
+    # پروفایل خروجی (نرخ نمونه و کدگذاری)؛ فهرست در audio_profiles.PROFILES
+    profile: str = DEFAULT_PROFILE
 
 class SummarizeRequest(BaseModel):
     text_to_summarize: str
 
 # --------------------------- تنظیم Gemini ---------------------------
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-tts_model_client = None
-chat_model_client = None
-SETUP_ERROR = None
+# مدل‌ها در رجیستری مشترک ثبت می‌شوند و در warmup (یا اولین استفاده) ساخته می‌شوند
+register_model("tts", 'gemini-2.5-flash-preview-tts')
+register_model("summarize", 'gemini-2.5-flash')
+
+# سیاست اندازه‌ی ورودی هر مسیر (tokens.py)؛ قبل از هر فراخوانی بالادستی اعمال می‌شود
+for _route in ("/reply", "/reply/stream", "/reply/batch", "/ws/voice"):
+    register_input_policy(_route, "reject", REPLY_MAX_INPUT_TOKENS)
+for _route in ("/summarize", "/summarize/stream"):
+    # متن بزرگ‌تر از یک تکه به مسیر map-reduce می‌رود
+    register_input_policy(_route, "chunk", SUMMARY_CHUNK_TOKENS, SUMMARIZE_MAX_INPUT_TOKENS)
+register_input_policy("/tts", "trim", TTS_MAX_INPUT_TOKENS)
 
-if GEMINI_API_KEY:
+
+def _require_model(alias: str):
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        tts_model_client = genai.GenerativeModel('gemini-2.5-flash-preview-tts')
-        chat_model_client = genai.GenerativeModel('gemini-2.5-flash')
-        print("✅ Gemini API initialized.")
-    except Exception as e:
-        print("⚠️ خطا در مقداردهی Gemini:", e)
-        SETUP_ERROR = str(e)
-else:
-    SETUP_ERROR = "GEMINI_API_KEY یافت نشد."
-    print("⚠️ ", SETUP_ERROR)
-
-# --------------------------- تبدیل PCM به WAV ---------------------------
-
-def pcm_to_wav(pcm_data: bytes, sample_rate=24000):
-    wav_file = io.BytesIO()
-    num_channels = 1
-    sample_width = 2
-    byte_rate = sample_rate * num_channels * sample_width
-    data_size = len(pcm_data)
-
-    wav_file.write(b'RIFF')
-    wav_file.write(struct.pack('<I', 36 + data_size))
-    wav_file.write(b'WAVE')
-
-    wav_file.write(b'fmt ')
-    wav_file.write(struct.pack('<I', 16))
-    wav_file.write(struct.pack('<H', 1))
-    wav_file.write(struct.pack('<H', num_channels))
-    wav_file.write(struct.pack('<I', sample_rate))
-    wav_file.write(struct.pack('<I', byte_rate))
-    wav_file.write(struct.pack('<H', num_channels * sample_width))
-    wav_file.write(struct.pack('<H', sample_width * 8))
-
-    wav_file.write(b'data')
-    wav_file.write(struct.pack('<I', data_size))
-    wav_file.write(pcm_data)
-
-    wav_file.seek(0)
-    return wav_file.read()
+        return get_model(alias)
+    except ModelUnavailable as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+SUMMARY_SAFETY_MESSAGE = "⚠️ به دلیل خط‌مشی‌های ایمنی، امکان خلاصه‌سازی این متن وجود ندارد."
 
 # --------------------------- اپ اصلی ---------------------------
 
-app = FastAPI()
+router = APIRouter()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # هر worker threadpool خودش را دارد؛ to_thread و کارهای sync هر دو محدود می‌شوند
+    threads = app.state.settings.threadpool_size
+    # executor شمارش‌دار تا اشباع آن در /metrics (threadpool_threads) دیده شود
+    asyncio.get_running_loop().set_default_executor(
+        InstrumentedThreadPool(max_workers=threads, thread_name_prefix="app"))
+    current_default_thread_limiter().total_tokens = threads
+    # نمونه‌بردار تأخیر حلقه‌ی رویداد در تمام عمر سرور اجرا می‌شود
+    lag_task = asyncio.create_task(sample_loop_lag())
+    # فایل‌های frontend یک بار خوانده و فشرده می‌شوند
+    static_assets.load()
+    # کش معنایی (در صورت فعال بودن) از دیسک بازیابی و هنگام خاموش شدن ذخیره می‌شود
+    if semantic_cache is not None:
+        await asyncio.to_thread(semantic_cache.load)
+    # ساخت و گرم کردن کلاینت‌ها در پس‌زمینه؛ /health/ready تا پایان آن 503 برمی‌گرداند
+    warmup_task = asyncio.create_task(_start_clients())
+    try:
+        yield
+    finally:
+        warmup_task.cancel()
+        lag_task.cancel()
+        if semantic_cache is not None:
+            try:
+                await asyncio.to_thread(save_snapshot, semantic_cache.snapshot())
+            except Exception as e:
+                print("⚠️ خطا در ذخیره‌ی کش معنایی:", e)
+
+async def _start_clients():
+    await warmup()
+    if client_state.ready and TOKEN_CALIBRATION:
+        # ضرایب تخمین توکن با count_tokens خود مدل تنظیم می‌شوند
+        await calibrate(get_model("chat"))
+
+def _configure(settings: Settings):
+    """تنظیمات را روی singletonهای پروسه اعمال می‌کند (با چند بار فراخوانی هم همان نتیجه)."""
+    # مهلت‌ها و سقف‌های موازی‌سازی هنگام هر فراخوانی از get_settings خوانده می‌شوند؛
+    # singletonها با تنظیمات env ساخته شده‌اند و فقط اندازه‌هایشان به‌روز می‌شود
+    configure(settings)
+    scheduler.resize(settings.upstream_concurrency)
+    gateway.queue_size = settings.upstream_queue_size
+    gateway.bucket.rate, gateway.bucket.capacity = settings.per_worker_rate()
+    gateway.bucket.tokens = min(gateway.bucket.tokens, gateway.bucket.capacity)
+
+    for cache in (reply_cache, summary_cache):
+        cache.maxsize = settings.response_cache_size
+        cache.ttl = settings.response_cache_ttl
+    audio_cache.memory_bytes = int(settings.tts_cache_memory_mb * 1024 * 1024)
+    audio_cache.disk_bytes = int(settings.tts_cache_disk_mb * 1024 * 1024)
+    session_store.max_total_bytes = int(settings.session_memory_mb * 1024 * 1024)
+
+def create_app(settings: Settings = None) -> FastAPI:
+    """
+    اپ را با تنظیمات داده‌شده (پیش‌فرض تنظیمات env همین پروسه) می‌سازد. کلاینت‌ها، کش‌ها و
+    زمان‌بند مال کل پروسه هستند، پس در هر پروسه (هر worker) یک اپ ساخته می‌شود؛
+    کلاینت‌ها در lifespan همان worker ساخته و گرم می‌شوند.
+    """
+    settings = settings or get_settings()
+    _configure(settings)
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(UpstreamContextMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.add_exception_handler(UpstreamBusy, upstream_busy_handler)
+    app.add_exception_handler(InputTooLarge, input_too_large_handler)
+    app.add_exception_handler(UpstreamTimeout, upstream_timeout_handler)
+    app.include_router(router)
+    return app
+
+async def upstream_busy_handler(request: Request, exc: UpstreamBusy):
+    # کمبود ظرفیت: کلاینت باید بعد از Retry-After دوباره تلاش کند
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+async def upstream_timeout_handler(request: Request, exc: UpstreamTimeout):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)})
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def input_too_large_handler(request: Request, exc: InputTooLarge):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "input_tokens": exc.tokens, "max_tokens": exc.max_tokens},
+    )
 
-app.mount("/static_files", StaticFiles(directory="frontend"), name="frontend_static")
+# فایل‌های frontend از حافظه و به صورت از قبل فشرده سرو می‌شوند (static_assets.py)
+@router.api_route("/static_files/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_static(path: str, request: Request):
+    return static_assets.response(request, path)
 
-@app.get("/", response_class=HTMLResponse)
-async def serve_frontend():
-    with open("frontend/index.html", "r", encoding="utf-8") as f:
-        return HTMLResponse(f.read())
+@router.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def serve_frontend(request: Request):
+    return static_assets.response(request, "index.html")
 
 # --------------------------- چت ---------------------------
 
-@app.post("/reply")
-def reply(data: UserMessage):
-    return {"response": get_reply_user(data.user_message)}
+def _session_id(data: UserMessage):
+    if data.session_id is None:
+        return None
+    if not valid_session_id(data.session_id):
+        raise HTTPException(status_code=422, detail="Invalid session_id.")
+    # سهم جلسه علاوه بر سهم IP شارژ می‌شود؛ جلسه‌ی تازه سهم IP را دور نمی‌زند
+    add_client(f"session:{data.session_id}")
+    return data.session_id
+
+@router.post("/reply")
+async def reply(data: UserMessage):
+    admitted = govern_input("/reply", data.user_message)
+    session_id = _session_id(data)
+    return {
+        "response": await get_reply_user(data.user_message, session_id),
+        "session_id": session_id,
+        "input_tokens": admitted.tokens,
+    }
+
+@router.post("/reply/stream")
+async def reply_stream(data: UserMessage):
+    """
+    پاسخ چت به صورت Server-Sent Events؛ هر رویداد یک خط `data: {json}` است.
+    """
+    start = time.perf_counter()
+    admitted = govern_input("/reply/stream", data.user_message)
+    session_id = _session_id(data)
+    stream = stream_reply_user(data.user_message, session_id)
+    # رویداد اول قبل از شروع پاسخ گرفته می‌شود تا کمبود ظرفیت به صورت 429 برگردد
+    try:
+        first_event = await stream.__anext__()
+    except StopAsyncIteration:
+        first_event = None
+    first_chunk.observe("chat", value=time.perf_counter() - start)
+
+    async def events():
+        try:
+            if first_event is None:
+                return
+            yield f"data: {json.dumps(first_event, ensure_ascii=False)}\n\n"
+            async for event in stream:
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            # قطع اتصال: استریم Gemini همین حالا بسته می‌شود، نه هنگام جمع‌آوری زباله
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                 "X-Input-Tokens": str(admitted.tokens)},
+    )
+
+@router.post("/reply/batch")
+async def reply_batch(data: BatchRequest):
+    """
+    چند سوال در یک درخواست؛ نتیجه‌ها به صورت NDJSON و به ترتیب آماده شدن (نه ترتیب ورودی)
+    برمی‌گردند و هر خط اندیس سوال را دارد. خط آخر {"type": "done", ...} است.
+    """
+    if not data.messages:
+        raise HTTPException(status_code=422, detail="messages must not be empty.")
+    if len(data.messages) > REPLY_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422,
+                            detail=f"At most {REPLY_BATCH_MAX_ITEMS} messages per batch.")
+    tokens = 0
+    for index, message in enumerate(data.messages):
+        try:
+            tokens += govern_input("/reply/batch", message).tokens
+        except InputTooLarge as e:
+            raise InputTooLarge(f"messages[{index}]: {e}", e.tokens, e.max_tokens)
+
+    # کل دسته یک مهلت مشترک دارد (ROUTE_DEADLINES در gateway.py)
+    start = time.perf_counter()
+
+    async def events():
+        counts = {"ok": 0, "blocked": 0, "error": 0}
+        async for result in batch_reply_user(data.messages):
+            counts[result["status"]] += 1
+            yield json.dumps({"type": "result", **result}, ensure_ascii=False) + "\n"
+        done = {"type": "done", "count": len(data.messages), **counts, "input_tokens": tokens,
+                "seconds": round(time.perf_counter() - start, 3)}
+        yield json.dumps(done, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # --------------------------- TTS ---------------------------
 
-from fastapi.responses import StreamingResponse
-import base64
+@router.post("/tts")
+async def generate_tts_stream(data: TTSRequest, request: Request):
+    if data.profile not in PROFILES:
+        raise HTTPException(status_code=422,
+                            detail=f"Unknown profile; choose one of: {', '.join(PROFILES)}")
+    sample_rate, codec = PROFILES[data.profile]
+    # متن بلندتر از سقف توکن TTS در مرز جمله کوتاه می‌شود
+    admitted = govern_input("/tts", data.text)
+    text = admitted.text
 
-@app.post("/tts")
-async def generate_tts_stream(data: TTSRequest):
-    global tts_model_client, SETUP_ERROR
-    
-    if not tts_model_client or SETUP_ERROR:
-        raise HTTPException(status_code=500, detail=str(SETUP_ERROR))
+    # صدای تکراری مستقیم از کش سرو می‌شود
+    key = cache_key(text, data.voice, sample_rate, codec)
+    cached = await cached_audio_response(request, key)
+    if cached is not None:
+        return cached
 
-    text_to_speak = data.text[:400]
+    tts_model = _require_model("tts")
 
-    try:
-        response_stream = tts_model_client.generate_content(
-            contents=[{"parts": [{"text": text_to_speak}]}],
-            generation_config={
-                "response_modalities": ["AUDIO"],
-                "speech_config": {
-                    "voice_config": {
-                        "prebuilt_voice_config": {
-                            "voice_name": data.voice
-                        }
-                    }
-                }
-            },
-            stream=True
-        )
+    start = time.perf_counter()
+    audio = stream_speech(tts_model, text, data.voice)
 
-        async def stream_audio():
-            for chunk in response_stream:
-                if not chunk.candidates:
-                    continue
-                
-                parts = chunk.candidates[0].content.parts
-                for p in parts:
-                    if hasattr(p, "inline_data") and p.inline_data:
-                        pcm_bytes = base64.b64decode(p.inline_data.data)
-                        wav_bytes = pcm_to_wav(pcm_bytes, sample_rate=24000)
-                        yield wav_bytes
-
-        return StreamingResponse(stream_audio(), media_type="audio/wav")
-    
+    try:
+        # تکه‌ی اول صدا را قبل از شروع پاسخ می‌گیریم تا خطای بالادستی به صورت 500 برگردد
+        first_pcm = await audio.__anext__()
+    except StopAsyncIteration:
+        first_pcm = b""
+    except (UpstreamBusy, UpstreamTimeout):
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"TTS Stream failed: {e}")
+    first_chunk.observe("tts", value=time.perf_counter() - start)
+
+    encoder = AudioEncoder(data.profile)
+
+    async def encode(pcm: bytes) -> bytes:
+        if encoder.passthrough:
+            return pcm
+        # تبدیل NumPy در threadpool تا حلقه‌ی رویداد برای بقیه‌ی شنونده‌ها آزاد بماند
+        return await asyncio.to_thread(encoder.encode, pcm)
+
+    async def stream_audio():
+        # یک هدر WAV و بعد داده‌ی صوتی پروفایل انتخاب‌شده، تکه‌به‌تکه
+        yield encoder.header()
+        if not first_pcm:
+            return
+        chunks = []
+        pcm = first_pcm
+        try:
+            while True:
+                encoded = await encode(pcm)
+                if encoded:
+                    chunks.append(encoded)
+                    audio_bytes.inc("upstream", amount=len(encoded))
+                    yield encoded
+                try:
+                    pcm = await audio.__anext__()
+                except StopAsyncIteration:
+                    break
+        finally:
+            # قطع اتصال: سنتز تکه‌های باقی‌مانده همین حالا لغو می‌شود
+            await audio.aclose()
+        tail = encoder.flush()
+        if tail:
+            chunks.append(tail)
+            audio_bytes.inc("upstream", amount=len(tail))
+            yield tail
+        # فقط صدای کامل و بدون خطا در کش ذخیره می‌شود
+        await audio_cache.put_async(key, encoder.to_wav(b"".join(chunks)))
+
+    return StreamingResponse(stream_audio(), media_type="audio/wav",
+                             headers={"X-TTS-Audio-Id": key, "X-TTS-Cache": "miss",
+                                      "X-TTS-Profile": data.profile,
+                                      "X-Input-Tokens": str(admitted.tokens),
+                                      "X-Input-Trimmed": str(int(admitted.action == "trimmed"))})
+
+@router.get("/tts/audio/{audio_id}")
+async def get_cached_audio(audio_id: str, request: Request):
+    """صدای کش‌شده با پشتیبانی از ETag و Range، برای پخش‌کننده‌هایی که جابه‌جا می‌شوند."""
+    if len(audio_id) != 64 or not all(c in "0123456789abcdef" for c in audio_id):
+        raise HTTPException(status_code=404, detail="Audio not found.")
+    cached = await cached_audio_response(request, audio_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Audio not found.")
+    return cached
+
+# --------------------------- حالت صوتی ---------------------------
+
+@router.websocket("/ws/voice")
+async def voice_mode(websocket: WebSocket):
+    """
+    حالت صوتی: پاسخ چت استریم می‌شود و هر جمله‌ی کامل همان لحظه به TTS می‌رود.
+    هر پیام کلاینت یک JSON مثل {"user_message", "session_id"?, "voice"?} است و پاسخ
+    روی همان اتصال فرستاده می‌شود:
+      متن   {"type": "delta", "text"}                              تکه‌ی متن پاسخ
+      متن   {"type": "audio", "segment", "text", "sample_rate"}    شروع صدای یک جمله
+      باینری PCM خام 16 بیتی mono                                  صدای همان جمله
+      متن   {"type": "done", "finish_reason", "segments"} یا {"type": "error", ...}
+    """
+    await websocket.accept()
+    # کلیدهای سهم اتصال (IP)؛ کلید جلسه‌ی هر نوبت روی همین‌ها اضافه می‌شود، نه روی نوبت قبلی
+    clients = client_keys()
+    try:
+        while True:
+            restore_clients(clients)
+            try:
+                data = VoiceRequest(**await websocket.receive_json())
+                govern_input("/ws/voice", data.user_message)
+                session_id = _session_id(data)
+            except KeyError:
+                # فریم باینری: receive_json فقط فریم متنی را می‌خواند
+                await _send_event(websocket, {"type": "error", "status": 400,
+                                              "message": "Invalid message: expected JSON text"})
+                continue
+            except (ValueError, TypeError, ValidationError) as e:
+                await _send_event(websocket, {"type": "error", "status": 400,
+                                              "message": f"Invalid message: {e}"})
+                continue
+            except HTTPException as e:
+                await _send_event(websocket, {"type": "error", "status": e.status_code,
+                                              "message": e.detail})
+                continue
+            except InputTooLarge as e:
+                await _send_event(websocket, {"type": "error", "status": e.status_code,
+                                              "message": str(e), "input_tokens": e.tokens,
+                                              "max_tokens": e.max_tokens})
+                continue
+            await _voice_turn(websocket, data, session_id)
+    except WebSocketDisconnect:
+        pass
+
+async def _send_event(websocket: WebSocket, event: dict):
+    await websocket.send_text(json.dumps(event, ensure_ascii=False))
+
+async def _voice_turn(websocket: WebSocket, data: VoiceRequest, session_id):
+    # اتصال WebSocket طولانی است؛ هر نوبت مهلت تازه‌ی خودش را دارد
+    set_deadline(route_deadline("/ws/voice"))
+    try:
+        tts_model = get_model("tts")
+    except ModelUnavailable as e:
+        await _send_event(websocket, {"type": "error", "message": str(e)})
+        return
+
+    start = time.perf_counter()
+    sentences = asyncio.Queue()
+    # هر دو تولیدکننده (متن و صدا) در یک صف می‌نویسند و فقط این تابع روی سوکت می‌فرستد
+    outbox = asyncio.Queue()
+    result = {"chat": None, "tts": None}
+
+    async def chat():
+        splitter = SentenceStream()
+        budget = TTS_MAX_INPUT_TOKENS
+
+        def speak(segments):
+            nonlocal budget
+            for segment in segments:
+                if budget <= 0:
+                    return
+                sentences.put_nowait(trim_to_tokens(segment, budget))
+                budget -= estimate_tokens(segment)
+
+        try:
+            async for event in stream_reply_user(data.user_message, session_id):
+                if event["type"] == "delta":
+                    outbox.put_nowait(event)
+                    speak(splitter.feed(event["text"]))
+                    continue
+                result["chat"] = event
+                if event["type"] == "done" and event.get("text"):
+                    # مسدود شدن ایمنی: به جای باقی متن، پیام ایمنی خوانده می‌شود
+                    splitter.flush()
+                    speak([event["text"]])
+            speak(splitter.flush())
+        except UpstreamBusy as e:
+            result["chat"] = {"type": "error", "status": e.status_code, "message": str(e),
+                              "retry_after": e.retry_after}
+        except UpstreamTimeout as e:
+            # مهلت نوبت قبل از اولین تکه تمام شد (در /reply/stream همان 504)
+            result["chat"] = {"type": "error", "status": e.status_code, "message": str(e)}
+        except Exception as e:
+            result["chat"] = {"type": "error", "status": 502,
+                              "message": f"خطا در گرفتن پاسخ از Gemini: {e}"}
+        finally:
+            sentences.put_nowait(None)
+
+    async def next_sentences():
+        while True:
+            segment = await sentences.get()
+            if segment is None:
+                return
+            yield segment
+
+    async def audio():
+        current = -1
+        try:
+            async for index, segment, pcm in stream_segments(tts_model, next_sentences(), data.voice):
+                if index != current:
+                    if current < 0:
+                        first_chunk.observe("voice", value=time.perf_counter() - start)
+                    current = index
+                    outbox.put_nowait({"type": "audio", "segment": index, "text": segment,
+                                       "sample_rate": SAMPLE_RATE})
+                audio_bytes.inc("upstream", amount=len(pcm))
+                outbox.put_nowait(pcm)
+        except UpstreamBusy as e:
+            result["tts"] = {"type": "error", "stage": "tts", "message": str(e),
+                             "retry_after": e.retry_after}
+        except Exception as e:
+            result["tts"] = {"type": "error", "stage": "tts", "message": f"TTS failed: {e}"}
+        result["segments"] = current + 1
+
+    tasks = [asyncio.create_task(chat()), asyncio.create_task(audio())]
+    # return_exceptions: خطای هر تولیدکننده همین‌جا خوانده می‌شود و هیچ‌کدام بی‌صاحب نمی‌ماند
+    producers = asyncio.gather(*tasks, return_exceptions=True)
+    producers.add_done_callback(lambda _: outbox.put_nowait(None))
+    try:
+        while True:
+            item = await outbox.get()
+            if item is None:
+                break
+            if isinstance(item, bytes):
+                await websocket.send_bytes(item)
+            else:
+                await _send_event(websocket, item)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    for stage, outcome in zip(("chat", "tts"), producers.result()):
+        if isinstance(outcome, Exception):
+            print(f"⚠️ خطای پیش‌بینی‌نشده در حالت صوتی ({stage}):", repr(outcome))
+            result[stage] = result[stage] or {"type": "error", "stage": stage, "status": 500,
+                                              "message": f"Voice turn failed: {outcome}"}
+    if result["tts"]:
+        await _send_event(websocket, result["tts"])
+    final = result["chat"] or {"type": "done", "finish_reason": "STOP"}
+    if final["type"] == "done":
+        final = {**final, "segments": result.get("segments", 0)}
+    await _send_event(websocket, final)
 
 # --------------------------- خلاصه‌سازی ---------------------------
 
-@app.post("/summarize")
+@router.post("/summarize")
 async def summarize_text(data: SummarizeRequest):
-    global chat_model_client, SETUP_ERROR
+    admitted = govern_input("/summarize", data.text_to_summarize)
+    summary_model = _require_model("summarize")
 
-    if not chat_model_client or SETUP_ERROR:
-        raise HTTPException(status_code=500, detail=str(SETUP_ERROR))
-
-    prompt = (
-        "متن زیر را کوتاه و خلاصه کن:\n\n"
-        f"{data.text_to_summarize}"
-    )
+    async def compute():
+        try:
+            summary = await summarize(summary_model, data.text_to_summarize)
+        except SummarySafetyBlocked:
+            safety_blocks.inc("summarize")
+            return SUMMARY_SAFETY_MESSAGE, False
+        return summary, bool(summary)
 
     try:
-        resp = chat_model_client.generate_content(prompt, tools=[])
-        return {"summary": resp.text.strip()}
+        # کلید هش متن است تا کش و نگاشت درخواست‌های در حال اجرا کپی سند را نگه ندارند
+        summary, _ = await summary_cache.get_or_compute(document_key(data.text_to_summarize), compute)
+        return {"summary": summary, "input_tokens": admitted.tokens,
+                "chunked": admitted.action == "chunked"}
 
+    except (UpstreamBusy, UpstreamTimeout):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Summarization failed: {e}")
+
+@router.post("/summarize/stream")
+async def summarize_text_stream(data: SummarizeRequest):
+    """
+    خلاصه‌سازی با گزارش پیشرفت به صورت NDJSON (هر خط یک رویداد JSON):
+    progress برای هر تکه‌ی تمام‌شده، و در پایان done با خلاصه یا error.
+    """
+    admitted = govern_input("/summarize/stream", data.text_to_summarize)
+    summary_model = _require_model("summarize")
+
+    key = document_key(data.text_to_summarize)
+
+    async def events():
+        cached = summary_cache.lookup(key)
+        if cached is not None:
+            yield json.dumps({"type": "done", "summary": cached, "cached": True}, ensure_ascii=False) + "\n"
+            return
+
+        queue = asyncio.Queue()
+        task = asyncio.ensure_future(
+            summarize(summary_model, data.text_to_summarize, progress=queue.put)
+        )
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+
+            try:
+                summary = task.result()
+                if summary:
+                    summary_cache.set(key, summary)
+                event = {"type": "done", "summary": summary}
+            except SummarySafetyBlocked:
+                safety_blocks.inc("summarize")
+                event = {"type": "done", "summary": SUMMARY_SAFETY_MESSAGE}
+            except UpstreamBusy as e:
+                event = {"type": "error", "message": str(e), "retry_after": e.retry_after}
+            except Exception as e:
+                event = {"type": "error", "message": f"Summarization failed: {e}"}
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            task.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                                      "X-Input-Tokens": str(admitted.tokens)})
+
+# --------------------------- آمار کش ---------------------------
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {
+        "reply": reply_cache.stats(),
+        "summarize": summary_cache.stats(),
+        "sessions": session_store.stats(),
+        "gateway": gateway.stats(),
+        "scheduler": scheduler.stats(),
+        "static": static_assets.stats(),
+        "tokens": calibration.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+    }
+
+# --------------------------- متریک‌ها ---------------------------
+
+def _cache_counters():
+    values = {}
+    for name, cache in (("reply", reply_cache), ("summarize", summary_cache)):
+        stats = cache.stats()
+        for field in ("hits", "misses", "coalesced"):
+            values[(name, field)] = stats[field]
+    if semantic_cache is not None:
+        values[("semantic", "hits")] = semantic_cache.hits
+        values[("semantic", "misses")] = semantic_cache.misses
+    return values
+
+Counter("response_cache_lookups_total", "Response cache lookups by result.",
+      ("cache", "result"), collect=_cache_counters)
+
+@router.get("/metrics")
+async def metrics():
+    """متریک‌ها با فرمت متنی Prometheus."""
+    return PlainTextResponse(render_all(), media_type="text/plain; version=0.0.4")
+
+# --------------------------- سلامت ---------------------------
+
+@router.get("/health/live")
+async def health_live():
+    """زنده بودن پروسه؛ اگر حلقه‌ی رویداد جواب بدهد یعنی زنده است."""
+    return {"status": "ok", "import_seconds": IMPORT_SECONDS}
+
+@router.get("/health/ready")
+async def health_ready():
+    """آمادگی برای ترافیک: فقط بعد از ساخت و گرم شدن کلاینت‌های مدل 200 برمی‌گرداند."""
+    state = client_state.snapshot()
+    state["import_seconds"] = IMPORT_SECONDS
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+def __getattr__(name):
+    # `uvicorn backend.app.main:app`: اپ در اولین دسترسی ساخته می‌شود، نه هنگام import،
+    # تا backend/serve.py (factory=True) در هر worker فقط یک بار create_app را اجرا کند
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+IMPORT_SECONDS = round(time.perf_counter() - _IMPORT_STARTED, 3)
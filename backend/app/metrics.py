@@ -0,0 +1,233 @@
+# ---------------------------- metrics.py ----------------------------
+# متریک‌های داخلی با خروجی متنی Prometheus، بدون وابستگی خارجی.
+# ثبت هر نمونه فقط یک جستجوی dict و یک bisect است تا بتوان آن را همیشه روشن گذاشت.
+
+import asyncio
+import bisect
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# مرزهای پیش‌فرض هیستوگرام (ثانیه)؛ از چند میلی‌ثانیه تا چند دقیقه
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=(), collect=None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        # collect (اختیاری) هنگام خواندن یک dict از برچسب‌ها (tuple) به مقدار برمی‌گرداند
+        self._collect = collect
+        _registry.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        if self._collect:
+            self._values = self._collect()
+        lines = self.header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels_text(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+
+class Gauge(_Metric):
+    """مقدار لحظه‌ای؛ یا با set/inc/dec یا با تابع collect هنگام خواندن."""
+    kind = "gauge"
+
+    def set(self, *labels, value):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        entry = self._values.get(labels)
+        if entry is None:
+            # [شمارش هر سطل (غیرتجمعی)، مجموع، تعداد]
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                names = self.label_names + ("le",)
+                lines.append(f"{self.name}_bucket{_labels_text(names, labels + (bound,))} {cumulative}")
+            base = _labels_text(self.label_names, labels)
+            lines.append(f"{self.name}_sum{base} {total}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+def render_all() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --------------------------- متریک‌های سرویس ---------------------------
+
+http_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request duration until the response body ends.",
+    ("route", "method", "status"))
+upstream_duration = Histogram(
+    "gemini_request_duration_seconds", "Duration of a single Gemini call attempt.",
+    ("call", "outcome"))
+first_chunk = Histogram(
+    "stream_first_chunk_seconds", "Time from request start to the first streamed chunk.",
+    ("stream",))
+audio_bytes = Counter(
+    "tts_audio_bytes_total", "Bytes of audio streamed to clients.", ("source",))
+upstream_inflight = Gauge(
+    "gemini_inflight_requests", "Gemini calls currently holding a concurrency slot.")
+upstream_errors = Counter(
+    "gemini_errors_total", "Gemini call errors by exception type.", ("type",))
+safety_blocks = Counter(
+    "safety_blocks_total", "Responses blocked by Gemini safety filters.", ("route",))
+loop_lag = Histogram(
+    "event_loop_lag_seconds", "Event-loop scheduling delay measured by a periodic sampler.",
+    buckets=LAG_BUCKETS)
+
+
+class InstrumentedThreadPool(ThreadPoolExecutor):
+    """
+    executor پیش‌فرض حلقه (asyncio.to_thread و run_in_executor) که کارهای در حال اجرا و
+    در صف را می‌شمارد؛ اشباع آن با busy == total و queued > 0 دیده می‌شود.
+    """
+    _instances = weakref.WeakSet()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._count_lock = threading.Lock()
+        self.busy = 0
+        self.queued = 0
+        InstrumentedThreadPool._instances.add(self)
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._count_lock:
+            self.queued += 1
+        try:
+            return super().submit(self._run, fn, args, kwargs)
+        except BaseException:
+            with self._count_lock:
+                self.queued -= 1
+            raise
+
+    def _run(self, fn, args, kwargs):
+        with self._count_lock:
+            self.queued -= 1
+            self.busy += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._count_lock:
+                self.busy -= 1
+
+
+def _threadpool_usage():
+    values = {}
+    for pool in list(InstrumentedThreadPool._instances):
+        for state, value in (("busy", pool.busy), ("queued", pool.queued),
+                             ("total", pool._max_workers)):
+            values[("default", state)] = values.get(("default", state), 0) + value
+    # threadpool جدای anyio که Starlette برای endpointها و وابستگی‌های sync استفاده می‌کند
+    try:
+        from anyio.to_thread import current_default_thread_limiter
+        limiter = current_default_thread_limiter()
+    except Exception:
+        return values
+    values[("anyio", "busy")] = limiter.borrowed_tokens
+    values[("anyio", "total")] = limiter.total_tokens
+    return values
+
+
+threadpool = Gauge(
+    "threadpool_threads", "Worker threadpool usage: the event loop's default executor "
+    "(asyncio.to_thread) and anyio's limiter (sync endpoints).", ("pool", "state"),
+    collect=_threadpool_usage)
+
+# --------------------------- نمونه‌بردار تأخیر حلقه ---------------------------
+
+LAG_SAMPLE_INTERVAL = 0.5
+
+
+async def sample_loop_lag(interval: float = LAG_SAMPLE_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(value=max(0.0, loop.time() - start - interval))
+
+# --------------------------- middleware ---------------------------
+
+class MetricsMiddleware:
+    """مدت هر درخواست HTTP را تا پایان بدنه‌ی پاسخ (شامل استریم‌ها) ثبت می‌کند."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if scope.get("client_disconnected"):
+                # قرارداد nginx برای درخواستی که کلاینتش قبل از پاسخ رفت
+                status = 499
+            route = scope.get("route")
+            # مسیر الگو (مثل /tts/audio/{audio_id}) تا تعداد سری‌ها محدود بماند
+            path = getattr(route, "path", None) or "unmatched"
+            http_duration.observe(path, scope["method"], status,
+                                  value=time.perf_counter() - start)
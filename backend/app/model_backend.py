@@ -0,0 +1,156 @@
+# ---------------------------- model_backend.py ----------------------------
+# انتخاب پیاده‌سازی مدل: Gemini واقعی یا جایگزین محلی (fake_gemini.py).
+#   GEMINI_BACKEND=google  (پیش‌فرض) نیاز به GEMINI_API_KEY دارد
+#   GEMINI_BACKEND=fake    بدون کلید و بدون شبکه، برای بنچمارک و تست
+#
+# مدل‌ها در یک رجیستری مشترک با نام مستعار ثبت می‌شوند و فقط در اولین استفاده (یا در
+# warmup هنگام شروع سرور) ساخته می‌شوند؛ import سنگین google.generativeai هم تا همان
+# لحظه عقب می‌افتد تا شروع سرد پروسه سریع باشد.
+
+import asyncio
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "google").lower()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# warmup: یک درخواست کوچک (count_tokens) برای باز کردن اتصال قبل از اولین کاربر
+WARMUP_PRIME = os.getenv("GEMINI_WARMUP_PRIME", "1").lower() in ("1", "true", "yes")
+WARMUP_TIMEOUT = float(os.getenv("GEMINI_WARMUP_TIMEOUT", "15"))
+# فاصله‌ی تلاش مجدد warmup ناموفق (ثانیه)
+WARMUP_RETRY = float(os.getenv("GEMINI_WARMUP_RETRY", "10"))
+
+_configured = False
+
+
+def setup_error():
+    """پیام خطای تنظیمات، یا None اگر بک‌اند قابل استفاده باشد."""
+    if GEMINI_BACKEND == "fake":
+        return None
+    if GEMINI_BACKEND != "google":
+        return f"GEMINI_BACKEND نامعتبر است: {GEMINI_BACKEND}"
+    if not GEMINI_API_KEY:
+        return "کلید API (GEMINI_API_KEY) در فایل‌های محیطی (مثل .env) یافت نشد."
+    return None
+
+
+def create_model(model_name: str, **kwargs):
+    """یک GenerativeModel (یا معادل fake آن) می‌سازد."""
+    global _configured
+    if GEMINI_BACKEND == "fake":
+        from .fake_gemini import FakeGenerativeModel
+        return FakeGenerativeModel(model_name, **kwargs)
+
+    import google.generativeai as genai
+    if not _configured:
+        genai.configure(api_key=GEMINI_API_KEY)
+        _configured = True
+    return genai.GenerativeModel(model_name, **kwargs)
+
+# --------------------------- رجیستری مدل‌ها ---------------------------
+
+class ModelUnavailable(Exception):
+    """مدل به خاطر خطای تنظیمات یا ساخت قابل استفاده نیست."""
+
+
+_specs = {}
+_models = {}
+_lock = threading.Lock()
+
+
+def register_model(alias: str, model_name: str, **kwargs):
+    """یک مدل را با نام مستعار ثبت می‌کند؛ ساخت آن تا اولین get_model عقب می‌افتد."""
+    _specs[alias] = (model_name, kwargs)
+
+
+def get_model(alias: str):
+    """مدل ثبت‌شده را (یک بار برای کل پروسه) می‌سازد و برمی‌گرداند."""
+    model = _models.get(alias)
+    if model is not None:
+        return model
+    error = setup_error()
+    if error:
+        raise ModelUnavailable(error)
+    with _lock:
+        model = _models.get(alias)
+        if model is None:
+            model_name, kwargs = _specs[alias]
+            try:
+                model = create_model(model_name, **kwargs)
+            except Exception as e:
+                raise ModelUnavailable(f"خطا در ساخت مدل {model_name}: {e}") from e
+            _models[alias] = model
+    return model
+
+# --------------------------- warmup و آمادگی ---------------------------
+
+class ClientState:
+    """وضعیت واقعی کلاینت‌ها برای endpointهای آمادگی."""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.attempts = 0
+        self.warmup_seconds = None
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "backend": GEMINI_BACKEND,
+            "error": self.error,
+            "warmup_attempts": self.attempts,
+            "warmup_seconds": self.warmup_seconds,
+            "models": sorted(_models),
+        }
+
+
+client_state = ClientState()
+
+
+async def _warmup_once(prime: bool):
+    # ساخت مدل‌ها (و import کتابخانه) در thread تا حلقه‌ی رویداد آزاد بماند
+    models = {}
+    for alias in _specs:
+        models[alias] = await asyncio.to_thread(get_model, alias)
+    if not prime:
+        return
+    # برای هر نام مدل یک درخواست کوچک کافی است
+    primed = set()
+    for alias, model in models.items():
+        model_name = _specs[alias][0]
+        if model_name in primed:
+            continue
+        await asyncio.wait_for(model.count_tokens_async("ping"), WARMUP_TIMEOUT)
+        primed.add(model_name)
+
+
+async def warmup(prime: bool = None):
+    """
+    همه‌ی مدل‌های ثبت‌شده را می‌سازد و (اختیاری) اتصال را با یک درخواست کوچک گرم می‌کند.
+    تا موفق نشود هر WARMUP_RETRY ثانیه دوباره تلاش می‌کند؛ خطای تنظیمات دائمی است.
+    """
+    prime = WARMUP_PRIME if prime is None else prime
+    while True:
+        client_state.attempts += 1
+        start = time.perf_counter()
+        try:
+            await _warmup_once(prime)
+        except ModelUnavailable as e:
+            client_state.error = str(e)
+            if setup_error():
+                print("⚠️ ", client_state.error)
+                return
+        except Exception as e:
+            client_state.error = f"warmup failed: {e}"
+        else:
+            client_state.ready = True
+            client_state.error = None
+            client_state.warmup_seconds = round(time.perf_counter() - start, 3)
+            print(f"✅ Gemini clients ready ({GEMINI_BACKEND}) in {client_state.warmup_seconds}s.")
+            return
+        print("⚠️ ", client_state.error)
+        await asyncio.sleep(WARMUP_RETRY)
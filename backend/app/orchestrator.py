@@ -1,26 +1,23 @@
+import asyncio
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 
-load_dotenv()  # بارگذاری متغیرهای محیطی از فایل .env
+from .gateway import UpstreamBusy, UpstreamTimeout, set_deadline, set_job_class
+from .gemini_client import generate, generate_stream
+from .metrics import safety_blocks
+from .model_backend import ModelUnavailable, get_model, register_model
+from .response_cache import normalize_prompt, reply_cache
+from .semantic_cache import semantic_cache
+from .sessions import fold_prompt, session_store, truncate_summary
+from .settings import get_settings
 
-# بررسی کلید API به صورت سراسری
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-model = None # تعریف اولیه مدل
-SETUP_ERROR = None # متغیر جدید برای نگهداری پیام خطای تنظیمات
+load_dotenv()  # بارگذاری متغیرهای محیطی از فایل .env
 
-if not GEMINI_API_KEY:
-    print("⚠️ خطا: متغیر محیطی GEMINI_API_KEY تنظیم نشده است!")
-    SETUP_ERROR = "کلید API (GEMINI_API_KEY) در فایل‌های محیطی (مثل .env) یافت نشد."
-else:
-    try:
-        # تنظیم کلاینت Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
+# سقف طول هر پیام کاربر (توکن تخمینی)؛ بیشتر از این قبل از هر فراخوانی با 413 رد می‌شود
+REPLY_MAX_INPUT_TOKENS = int(os.getenv("REPLY_MAX_INPUT_TOKENS", "8000"))
 
-        # ساخت مدل با دستورالعمل دقیق
-        model = genai.GenerativeModel(
-            'gemini-2.5-flash',
-            system_instruction="""تو یک دستیار هوشمند و دلسوز دانشجویان هستی که به زبان فارسی پاسخ می‌دهی.
+# دستورالعمل سیستمی مدل چت
+SYSTEM_INSTRUCTION = """تو یک دستیار هوشمند و دلسوز دانشجویان هستی که به زبان فارسی پاسخ می‌دهی.
 وظیفه اصلی تو پاسخ دادن به سوالات درسی، پروژه‌ای، برنامه‌نویسی و ارائه راهنمایی‌های تحصیلی است.
 
 قواعد پاسخگویی مهم:
@@ -28,29 +25,269 @@ else:
 2.  **پاسخ به سوالات سازنده:** اگر کاربر در مورد «سازنده»، «توسعه‌دهنده»، «نویسنده» یا «چه کسی تو را ساخته» پرسید، دقیقاً این متن را به او بگو:
     «من توسط **محمدحسین تاجیک** با استفاده از هوش مصنوعی گوگل (Gemini) توسعه داده شده‌ام. هدف من کمک به رشد تحصیلی شماست. می‌تونی محمدحسین رو در اینستاگرام دنبال کنی: https://www.instagram.com/mohmels/»
 """
-        )
-    except Exception as e:
-        print(f"⚠️ خطا در تنظیم Gemini API: {str(e)}")
-        SETUP_ERROR = f"خطا در تنظیمات اولیه مدل: {str(e)}"
 
-def get_reply_user(user_text: str) -> str:
+# مدل چت در رجیستری مشترک ثبت می‌شود و در اولین استفاده (یا warmup) ساخته می‌شود
+register_model("chat", 'gemini-2.5-flash', system_instruction=SYSTEM_INSTRUCTION)
+
+SAFETY_MESSAGE = "⚠️ به دلیل خط‌مشی‌های ایمنی، امکان پاسخگویی به این سوال وجود ندارد."
+
+# حلقه‌ی رویداد فقط ارجاع ضعیف به taskها نگه می‌دارد؛ خلاصه‌سازی‌های پس‌زمینه تا
+# پایانشان این‌جا می‌مانند تا وسط کار جمع‌آوری نشوند
+_background_tasks = set()
+
+
+def _setup_error_message(error=None) -> str:
+    detailed_error = error if error else "خطای نامشخص در تنظیمات."
+    return f"⚠️ خطای تنظیمات بک‌اند: {detailed_error} لطفاً فایل‌های پیکربندی و کلید API را بررسی کنید."
+
+
+async def get_reply_user(user_text: str, session_id: str = None) -> str:
     """
     این تابع متن کاربر رو می‌گیره و از Google Gemini پاسخ واقعی می‌گیره.
+    فراخوانی async است و حلقه‌ی رویداد یا threadpool را اشغال نمی‌کند.
+    سؤال‌های تکراری از کش جواب داده می‌شوند و سؤال‌های یکسان هم‌زمان یک فراخوانی مشترک دارند؛
+    با SEMANTIC_CACHE_ENABLED سؤال‌های هم‌معنا با جمله‌بندی دیگر هم از کش معنایی می‌آیند.
+    با session_id، تاریخچه‌ی گفتگو (در بودجه‌ی توکن) همراه پیام فرستاده می‌شود.
     """
     # بررسی مدل قبل از استفاده
-    if model is None:
-        detailed_error = SETUP_ERROR if SETUP_ERROR else "خطای نامشخص در تنظیمات."
-        return f"⚠️ خطای تنظیمات بک‌اند: {detailed_error} لطفاً فایل‌های پیکربندی و کلید API را بررسی کنید."
+    try:
+        get_model("chat")
+    except ModelUnavailable as e:
+        return _setup_error_message(e)
 
+    if not session_id:
+        text, _ = await reply_cache.get_or_compute(
+            normalize_prompt(user_text), lambda: _answer(user_text)
+        )
+        return text
+
+    session = session_store.get(session_id)
+    async with session.lock:
+        if session.is_empty():
+            # پیام اول جلسه مستقل از تاریخچه است و می‌تواند از کش بیاید
+            text, ok = await reply_cache.get_or_compute(
+                normalize_prompt(user_text), lambda: _answer(user_text)
+            )
+        else:
+            text, ok = await _fetch_reply(session.contents(user_text))
+        if ok:
+            _record_turn(session, user_text, text)
+    return text
+
+
+def _record_turn(session, user_text: str, reply_text: str):
+    """نوبت را به جلسه اضافه و در صورت عبور از بودجه، نوبت‌های قدیمی را در پس‌زمینه خلاصه می‌کند."""
+    session.add_turn("user", user_text)
+    session.add_turn("model", reply_text)
+    folded = session.overflow(session_store.max_session_bytes)
+    if folded:
+        task = asyncio.create_task(_fold_turns(session, folded))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    session_store.enforce_global_cap(keep=session.id)
+
+
+async def _fold_turns(session, folded: list):
+    # خلاصه‌سازی‌های یک جلسه به ترتیب اجرا می‌شوند تا هیچ نوبتی گم نشود
+    max_summary = session_store.max_session_bytes // 4
+    # خلاصه‌سازی پس‌زمینه نباید از سهم چت‌های تعاملی بخورد (context این task جداست)
+    set_job_class("summarize")
+    async with session.fold_lock:
+        # مهلت درخواستی که این نوبت را ساخته به ارث نمی‌رسد (ممکن است تقریباً تمام شده
+        # باشد)؛ خلاصه‌سازی از وقتی نوبتش رسید مهلت کامل خودش را دارد
+        set_deadline()
+        try:
+            response = await generate(get_model("chat"), fold_prompt(session.summary, folded))
+            summary = response.text.strip()
+            if len(summary.encode("utf-8")) > max_summary:
+                summary = truncate_summary("", [("model", summary)], max_summary)
+        except Exception as e:
+            print(f"⚠️ خطا در خلاصه‌سازی تاریخچه‌ی جلسه: {e}")
+            summary = truncate_summary(session.summary, folded, max_summary)
+        session.apply_summary(summary, folded)
+
+
+async def _answer(user_text: str):
+    """پاسخ یک سوال مستقل از تاریخچه؛ اول کش معنایی (اگر فعال باشد) و بعد Gemini."""
+    if semantic_cache is not None:
+        cached = semantic_cache.lookup(user_text)
+        if cached is not None:
+            return cached, True
+    text, ok = await _fetch_reply(user_text)
+    if ok and semantic_cache is not None:
+        semantic_cache.add(user_text, text)
+    return text, ok
+
+
+async def _fetch_reply(contents):
+    """(متن پاسخ، موفق بودن) — پیام‌های خطا و ایمنی هرگز کش یا در تاریخچه ثبت نمی‌شوند."""
     try:
         # 🟢 نسخه صحیح بدون ابزار جستجو
-        response = model.generate_content(user_text) 
+        response = await generate(get_model("chat"), contents)
         
         # بررسی محتوای پاسخ
         if response.candidates and response.candidates[0].finish_reason.name == 'SAFETY':
-             return "⚠️ به دلیل خط‌مشی‌های ایمنی، امکان پاسخگویی به این سوال وجود ندارد."
+             safety_blocks.inc("reply")
+             return SAFETY_MESSAGE, False
         
-        return response.text.strip()
+        text = response.text.strip()
+        return text, bool(text)
     
+    except (UpstreamBusy, UpstreamTimeout):
+        # کمبود ظرفیت (429/503) و تمام شدن مهلت (504) به صورت وضعیت HTTP به کلاینت می‌رسند،
+        # نه به عنوان متن پاسخ
+        raise
+    except Exception as e:
+        return f"خطا در گرفتن پاسخ از Gemini: {str(e)}", False
+
+
+def _chunk_text(chunk) -> str:
+    # chunk.text روی تکه‌های بدون part خطا می‌دهد، پس مستقیم از partها می‌خوانیم
+    if not chunk.candidates or not chunk.candidates[0].content:
+        return ""
+    return "".join(getattr(p, "text", "") for p in chunk.candidates[0].content.parts)
+
+
+async def stream_reply_user(user_text: str, session_id: str = None):
+    """
+    نسخه‌ی استریم get_reply_user.
+    رویدادها را به شکل dict برمی‌گرداند:
+      {"type": "delta", "text": ...}       تکه‌ی جدید متن
+      {"type": "done", "finish_reason": ...} پایان عادی یا مسدود شدن ایمنی
+      {"type": "error", "message": ...}    خطای تنظیمات یا بالادستی
+    """
+    try:
+        get_model("chat")
+    except ModelUnavailable as e:
+        yield {"type": "error", "message": _setup_error_message(e)}
+        return
+
+    if not session_id:
+        async for event in _stream_reply(user_text, normalize_prompt(user_text)):
+            yield event
+        return
+
+    session = session_store.get(session_id)
+    async with session.lock:
+        if session.is_empty():
+            contents, key = user_text, normalize_prompt(user_text)
+        else:
+            contents, key = session.contents(user_text), None
+        async for event in _stream_reply(
+            contents, key, on_complete=lambda answer: _record_turn(session, user_text, answer)
+        ):
+            yield event
+
+
+async def _stream_reply(contents, key: str = None, on_complete=None):
+    """
+    استریم یک پاسخ؛ key (در صورت وجود) کلید کش است و on_complete با متن کامل
+    پاسخ‌های موفق صدا زده می‌شود.
+    """
+    if key is not None:
+        cached = reply_cache.lookup(key)
+        semantic = False
+        if cached is None and semantic_cache is not None:
+            # key فقط برای سوال‌های مستقل از تاریخچه ست می‌شود، پس contents همان متن سوال است
+            cached = semantic_cache.lookup(contents)
+            semantic = cached is not None
+        if cached is not None:
+            yield {"type": "delta", "text": cached}
+            if on_complete:
+                on_complete(cached)
+            done = {"type": "done", "finish_reason": "STOP", "cached": True}
+            if semantic:
+                reply_cache.set(key, cached)
+                done["semantic"] = True
+            yield done
+            return
+
+    finish_reason = None
+    parts = []
+    try:
+        async for chunk in generate_stream(get_model("chat"), contents):
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield {"type": "delta", "text": text}
+
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason.name
+                # مسدود شدن وسط استریم: متن نیمه‌کاره را با پیام ایمنی جایگزین می‌کنیم
+                if finish_reason == 'SAFETY':
+                    safety_blocks.inc("reply_stream")
+                    yield {"type": "done", "finish_reason": finish_reason, "text": SAFETY_MESSAGE}
+                    return
+
+    except UpstreamBusy:
+        raise
+    except UpstreamTimeout as e:
+        # قبل از اولین تکه هنوز می‌شود 504 برگرداند؛ بعد از آن فقط رویداد خطا
+        if not parts:
+            raise
+        yield {"type": "error", "message": f"خطا در گرفتن پاسخ از Gemini: {str(e)}"}
+        return
     except Exception as e:
-        return f"خطا در گرفتن پاسخ از Gemini: {str(e)}"
\ No newline at end of file
+        yield {"type": "error", "message": f"خطا در گرفتن پاسخ از Gemini: {str(e)}"}
+        return
+
+    finish_reason = finish_reason or "STOP"
+    answer = "".join(parts).strip()
+    if finish_reason == "STOP" and answer:
+        if key is not None:
+            reply_cache.set(key, answer)
+            if semantic_cache is not None:
+                semantic_cache.add(contents, answer)
+        if on_complete:
+            on_complete(answer)
+    yield {"type": "done", "finish_reason": finish_reason}
+
+
+async def batch_reply_user(messages: list, concurrency: int = None):
+    """
+    چند سوال مستقل را هم‌زمان (حداکثر concurrency تا) جواب می‌دهد و هر نتیجه را
+    به محض آماده شدن، همراه با اندیس ورودی، yield می‌کند:
+      {"index": i, "status": "ok", "response": ...}
+      {"index": i, "status": "blocked", "response": SAFETY_MESSAGE}
+      {"index": i, "status": "error", "error": ..., "retry_after"?: ...}
+    خطای یک سوال بقیه‌ی دسته را متوقف نمی‌کند؛ سوال‌های تکراری از کش یا فراخوانی مشترک می‌آیند.
+    """
+    try:
+        get_model("chat")
+    except ModelUnavailable as e:
+        message = _setup_error_message(e)
+        for index in range(len(messages)):
+            yield {"index": index, "status": "error", "error": message}
+        return
+
+    semaphore = asyncio.Semaphore(concurrency or get_settings().batch_concurrency)
+    results = asyncio.Queue()
+
+    async def answer(index: int, user_text: str):
+        async with semaphore:
+            try:
+                text, ok = await reply_cache.get_or_compute(
+                    normalize_prompt(user_text), lambda: _answer(user_text)
+                )
+            except UpstreamBusy as e:
+                result = {"index": index, "status": "error", "error": str(e),
+                          "retry_after": e.retry_after}
+            except Exception as e:
+                result = {"index": index, "status": "error", "error": str(e)}
+            else:
+                if ok:
+                    result = {"index": index, "status": "ok", "response": text}
+                elif text == SAFETY_MESSAGE:
+                    result = {"index": index, "status": "blocked", "response": text}
+                else:
+                    result = {"index": index, "status": "error", "error": text}
+        results.put_nowait(result)
+
+    tasks = [asyncio.ensure_future(answer(i, text)) for i, text in enumerate(messages)]
+    try:
+        for _ in tasks:
+            yield await results.get()
+    finally:
+        # قطع اتصال کلاینت: سوال‌های باقی‌مانده لغو می‌شوند
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,157 @@
+# ---------------------------- response_cache.py ----------------------------
+# کش پاسخ‌های متنی (چت و خلاصه‌سازی) با TTL و حذف LRU.
+# درخواست‌های هم‌زمان با کلید یکسان فقط یک فراخوانی بالادستی انجام می‌دهند
+# (single-flight) و بقیه منتظر همان نتیجه می‌مانند؛ فراخوانی مشترک مهلت هیچ درخواستی
+# را به ارث نمی‌برد و هر منتظر فقط در مهلت خودش کنار می‌رود.
+
+import asyncio
+import hashlib
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .gateway import UpstreamTimeout, clear_deadline, remaining
+from .settings import get_settings
+
+# --------------------------- نرمال‌سازی متن ---------------------------
+
+# حروف عربی و فارسی هم‌شکل، ارقام فارسی/عربی و حذف کشیده
+_CHAR_MAP = str.maketrans({
+    "ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "أ": "ا", "إ": "ا", "ٱ": "ا",
+    "ؤ": "و", "ـ": None,
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+})
+# اعراب (فتحه، کسره، تنوین، تشدید، ...)
+_DIACRITICS = re.compile(r'[\u064B-\u065F\u0670]')
+# فاصله‌ها شامل نیم‌فاصله (ZWNJ) که کاربران ناهمگون استفاده می‌کنند
+_SPACES = re.compile(r'[\s\u200c\u200e\u200f]+')
+
+
+def normalize_prompt(text: str) -> str:
+    """متن را طوری یکدست می‌کند که سؤال‌های یکسان با نگارش متفاوت هم‌کلید شوند."""
+    text = unicodedata.normalize("NFKC", text)
+    text = text.translate(_CHAR_MAP)
+    text = _DIACRITICS.sub("", text)
+    text = _SPACES.sub(" ", text)
+    return text.strip().lower()
+
+
+def document_key(text: str) -> str:
+    """کلید کش برای متن‌های بلند (خلاصه‌سازی): هش متن نرمال‌شده به جای خود متن."""
+    return hashlib.sha256(normalize_prompt(text).encode("utf-8")).hexdigest()
+
+# --------------------------- کش ---------------------------
+
+class ResponseCache:
+    def __init__(self, maxsize=None, ttl=None):
+        settings = get_settings()
+        self.maxsize = settings.response_cache_size if maxsize is None else maxsize
+        self.ttl = settings.response_cache_ttl if ttl is None else ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}            # key -> asyncio.Task
+        self._waiters = {}             # asyncio.Task -> تعداد درخواست‌های منتظر
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def lookup(self, key):
+        """مثل get، ولی در شمارنده‌های hit/miss هم ثبت می‌شود."""
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key, compute):
+        """
+        (value, cacheable) را از کش یا با اجرای compute (فقط یک بار برای هر کلید) برمی‌گرداند.
+        compute باید (value, cacheable) برگرداند؛ مقادیر cacheable=False فقط
+        به منتظرهای همان لحظه داده می‌شوند و ذخیره نمی‌شوند.
+        """
+        if self.maxsize <= 0:
+            return await compute()
+
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._run_shared(compute))
+            self._inflight[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._finish(key, t))
+
+        # shield: لغو شدن یک درخواست نباید فراخوانی مشترک بقیه را لغو کند،
+        # ولی وقتی آخرین منتظر هم رفت (مثلاً قطع اتصال) ادامه‌ی آن فقط سهمیه هدر می‌دهد
+        # هر منتظر در مهلت خودش (504) کنار می‌رود؛ فراخوانی مشترک تا رفتن آخرین منتظر ادامه دارد
+        self._waiters[task] += 1
+        wait = remaining()
+        try:
+            return await asyncio.wait_for(asyncio.shield(task),
+                                          None if wait == math.inf else max(wait, 0))
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            if self._waiters.get(task) == 1 and not task.done():
+                task.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise UpstreamTimeout("Request deadline exceeded") from None
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+
+    @staticmethod
+    async def _run_shared(compute):
+        # context این task کپی context اولین درخواست است؛ مهلت آن برداشته می‌شود تا
+        # مهلت کوتاه یک درخواست کار بقیه را از بین نبرد
+        clear_deadline()
+        return await compute()
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        self._waiters.pop(task, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        value, cacheable = task.result()
+        if cacheable:
+            self.set(key, value)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round((self.hits + self.coalesced) / total, 4) if total else 0.0,
+        }
+
+
+reply_cache = ResponseCache()
+summary_cache = ResponseCache()
@@ -0,0 +1,214 @@
+# ---------------------------- scheduler.py ----------------------------
+# زمان‌بند نوبت فراخوانی‌های Gemini بر اساس کلاس کار، به جای یک سمافور FIFO.
+#   - صف جدا برای هر کلاس (chat، summarize، tts، batch) با وزن قابل تنظیم؛ جای خالی
+#     بعدی به کلاسی می‌رسد که کمترین «زمان مجازی» را دارد و زمان مجازی هر کلاس به
+#     اندازه‌ی هزینه/وزن کارهایش جلو می‌رود (weighted fair queuing)، پس کارهای حجیم
+#     بیشتر از سهم وزنشان ظرفیت نمی‌گیرند و چت پشت آن‌ها نمی‌ماند
+#   - هزینه‌ی هر کار از طول ورودی تخمین زده می‌شود و داخل هر کلاس کار کوتاه‌تر زودتر
+#     پذیرفته می‌شود؛ با گذشت زمان انتظار اولویت کارهای بلند بالا می‌رود تا گرسنه نمانند
+#   - سهمیه‌ی سراسری (سطل توکن gateway) هم هنگام دادن جای خالی مصرف می‌شود تا
+#     کارهای حجیم نتوانند توکن‌های آینده را از قبل رزرو کنند
+# عمق صف و زمان انتظار هر کلاس در /cache/stats و /metrics دیده می‌شود.
+
+import asyncio
+import heapq
+import math
+import os
+import time
+
+from dotenv import load_dotenv
+
+from .gateway import Overloaded, job_class, remaining
+from .metrics import Gauge, Histogram
+from .tokens import estimate_tokens
+
+load_dotenv()
+
+# --------------------------- تنظیمات ---------------------------
+
+# کلاس‌های کار و وزن پیش‌فرض سهمشان از ظرفیت؛ SCHEDULER_WEIGHTS این‌ها را تغییر می‌دهد
+DEFAULT_WEIGHTS = {"chat": 8, "summarize": 2, "tts": 2, "batch": 1}
+# هر ثانیه انتظار، اولویت کار را به اندازه‌ی این تعداد توکن هزینه بالا می‌برد
+SCHEDULER_AGING = float(os.getenv("SCHEDULER_AGING", "500"))
+
+
+def _parse_weights(text: str) -> dict:
+    # مثل "chat=8,summarize=2,tts=2,batch=1"
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() in weights and weight.strip():
+            weights[name.strip()] = max(float(weight), 0.01)
+    return weights
+
+
+SCHEDULER_WEIGHTS = _parse_weights(os.getenv("SCHEDULER_WEIGHTS", ""))
+
+queue_depth = Gauge(
+    "scheduler_queue_depth", "Upstream calls waiting for a slot, by job class.", ("class",))
+queue_wait = Histogram(
+    "scheduler_wait_seconds", "Time upstream calls waited for a slot, by job class.", ("class",))
+
+# --------------------------- هزینه ---------------------------
+
+def _text(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        return _text(contents.get("parts") or contents.get("text") or "")
+    if isinstance(contents, (list, tuple)):
+        return " ".join(_text(c) for c in contents)
+    return getattr(contents, "text", "") or ""
+
+
+def job_cost(contents) -> int:
+    """هزینه‌ی تخمینی یک فراخوانی (توکن ورودی)."""
+    return estimate_tokens(_text(contents))
+
+# --------------------------- زمان‌بند ---------------------------
+
+class _Job:
+    __slots__ = ("key", "seq", "cost", "job_class", "future", "enqueued")
+
+    def __init__(self, key, seq, cost, job_class, future):
+        self.key = key
+        self.seq = seq
+        self.cost = cost
+        self.job_class = job_class
+        self.future = future
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.key, self.seq) < (other.key, other.seq)
+
+
+class Scheduler:
+    def __init__(self, concurrency: int, bucket, weights: dict = None,
+                 aging: float = SCHEDULER_AGING):
+        self.concurrency = concurrency
+        self.free = concurrency
+        self.bucket = bucket
+        self.weights = dict(weights or SCHEDULER_WEIGHTS)
+        self.aging = aging
+        self._queues = {name: [] for name in self.weights}
+        self._depth = dict.fromkeys(self.weights, 0)
+        self._running = dict.fromkeys(self.weights, 0)
+        self._dispatched = dict.fromkeys(self.weights, 0)
+        self._wait_total = dict.fromkeys(self.weights, 0.0)
+        self._pass = dict.fromkeys(self.weights, 0.0)   # زمان مجازی هر کلاس
+        self._vtime = 0.0                               # زمان مجازی سیستم
+        self._seq = 0
+        self._timer = None
+
+    async def acquire(self, name: str = None, cost: int = 1) -> str:
+        """
+        تا رسیدن نوبت صبر می‌کند و کلاس نهایی را برمی‌گرداند که باید به release داده شود.
+        اگر نوبت در مهلت درخواست نرسد Overloaded می‌دهد.
+        """
+        name = name or job_class()
+        if name not in self._queues:
+            name = "chat"
+        cost = max(1, cost)
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        # اولویت با گذر زمان خطی بالا می‌رود: cost - aging*(now - t) ترتیبی برابر با
+        # cost + aging*t دارد، پس کلید ثابت می‌ماند و heap معتبر است
+        job = _Job(cost + self.aging * time.monotonic(), self._seq, cost, name, future)
+        queue = self._queues[name]
+        if not self._depth[name]:
+            # کلاسی که بیکار بوده اعتبار جمع‌شده ندارد
+            self._pass[name] = max(self._pass[name], self._vtime)
+        heapq.heappush(queue, job)
+        self._set_depth(name, 1)
+        self._dispatch()
+
+        try:
+            if not future.done():
+                wait = remaining()
+                await asyncio.wait_for(future, None if wait == math.inf else max(wait, 0))
+        except asyncio.TimeoutError:
+            self._abandon(job)
+            raise Overloaded("Timed out waiting for an upstream slot",
+                             retry_after=self._retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # نوبت همزمان با لغو رسید؛ جای گرفته‌شده آزاد می‌شود
+                self.release(name)
+            else:
+                self._abandon(job)
+            raise
+        return name
+
+    def release(self, name: str):
+        self._running[name] -= 1
+        self.free += 1
+        self._dispatch()
+
+    def resize(self, concurrency: int):
+        """تعداد جای هم‌زمان را عوض می‌کند؛ کارهای در حال اجرا قطع نمی‌شوند."""
+        self.free += concurrency - self.concurrency
+        self.concurrency = concurrency
+        self._dispatch()
+
+    def _abandon(self, job: _Job):
+        # کار در صف می‌ماند و هنگام رسیدن به سر صف کنار گذاشته می‌شود
+        if not job.future.done():
+            job.future.cancel()
+        self._set_depth(job.job_class, -1)
+
+    def _set_depth(self, name: str, delta: int):
+        self._depth[name] += delta
+        queue_depth.set(name, value=self._depth[name])
+
+    def _next_class(self):
+        best = None
+        for name, queue in self._queues.items():
+            while queue and queue[0].future.done():
+                heapq.heappop(queue)
+            if queue and (best is None or self._pass[name] < self._pass[best]):
+                best = name
+        return best
+
+    def _dispatch(self):
+        while self.free > 0:
+            name = self._next_class()
+            if name is None:
+                return
+            ok, wait = self.bucket.reserve(0)
+            if not ok:
+                # سهمیه‌ی سراسری تمام است؛ انتخاب بعدی وقتی توکن برسد انجام می‌شود
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            job = heapq.heappop(self._queues[name])
+            self._vtime = self._pass[name]
+            self._pass[name] += job.cost / self.weights[name]
+            self.free -= 1
+            self._running[name] += 1
+            self._dispatched[name] += 1
+            self._set_depth(name, -1)
+            waited = time.monotonic() - job.enqueued
+            self._wait_total[name] += waited
+            queue_wait.observe(name, value=waited)
+            job.future.set_result(None)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _retry_after(self) -> float:
+        backlog = sum(self._depth.values())
+        return backlog / self.bucket.rate if self.bucket.rate > 0 else 1.0
+
+    def stats(self) -> dict:
+        classes = {}
+        for name in self._queues:
+            dispatched = self._dispatched[name]
+            classes[name] = {
+                "weight": self.weights[name],
+                "queued": self._depth[name],
+                "running": self._running[name],
+                "dispatched": dispatched,
+                "avg_wait": round(self._wait_total[name] / dispatched, 4) if dispatched else 0.0,
+            }
+        return {"concurrency": self.concurrency, "free": self.free, "classes": classes}
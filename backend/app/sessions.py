@@ -0,0 +1,166 @@
+# ---------------------------- sessions.py ----------------------------
+# جلسه‌های گفتگوی چندنوبتی در حافظه‌ی پروسه.
+# هر جلسه چند نوبت آخر را عیناً نگه می‌دارد و نوبت‌های قدیمی‌تر را در یک خلاصه‌ی
+# در حال اجرا جمع می‌کند تا حجم پرامپت (و تأخیر بالادستی) هر چقدر هم گفتگو طول
+# بکشد محدود بماند. حجم هر جلسه و کل جلسه‌ها سقف دارد و جلسه‌های بیکار حذف می‌شوند.
+
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict, deque
+
+from .settings import get_settings
+from .tokens import estimate_tokens
+
+# --------------------------- تنظیمات ---------------------------
+
+# بودجه‌ی توکن تاریخچه (خلاصه + نوبت‌های عینی) که همراه هر پیام فرستاده می‌شود
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "3000"))
+# حداقل تعداد نوبت‌های آخر که هیچ‌وقت خلاصه نمی‌شوند
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "4"))
+# سقف حجم یک جلسه (کیلوبایت متن UTF-8)؛ سقف کل جلسه‌ها (SESSION_GLOBAL_MAX_MB) در settings.py است
+SESSION_MAX_KB = float(os.getenv("SESSION_MAX_KB", "64"))
+# جلسه‌ای که این مدت (ثانیه) استفاده نشود حذف می‌شود
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+
+_SESSION_ID = re.compile(r'[A-Za-z0-9_-]{8,64}')
+
+
+def valid_session_id(session_id) -> bool:
+    return bool(session_id) and bool(_SESSION_ID.fullmatch(session_id))
+
+
+# --------------------------- جلسه ---------------------------
+
+class Session:
+    __slots__ = ("id", "turns", "pending", "summary", "size", "tokens",
+                 "last_access", "lock", "fold_lock")
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.turns = deque()   # (role, text, tokens)
+        # نوبت‌هایی که از پنجره خارج شده‌اند ولی هنوز در خلاصه جمع نشده‌اند
+        self.pending = []      # (role, text)
+        self.summary = ""
+        self.size = 0          # بایت‌های UTF-8 نوبت‌ها و خلاصه
+        self.tokens = 0        # توکن‌های نوبت‌های عینی
+        self.last_access = time.monotonic()
+        # پیام‌های هم‌زمان یک جلسه باید به ترتیب پردازش شوند
+        self.lock = asyncio.Lock()
+        self.fold_lock = asyncio.Lock()
+
+    def is_empty(self) -> bool:
+        return not self.turns and not self.pending and not self.summary
+
+    def contents(self, user_text: str) -> list:
+        """تاریخچه‌ی جلسه به علاوه‌ی پیام جدید، به شکل contents در Gemini."""
+        contents = []
+        if self.summary:
+            contents.append({"role": "user", "parts": [
+                f"خلاصه‌ی گفتگوی قبلی ما (برای یادآوری):\n{self.summary}"]})
+            contents.append({"role": "model", "parts": ["متوجه شدم."]})
+        for role, text in self.pending:
+            contents.append({"role": role, "parts": [text]})
+        for role, text, _ in self.turns:
+            contents.append({"role": role, "parts": [text]})
+        contents.append({"role": "user", "parts": [user_text]})
+        return contents
+
+    def add_turn(self, role: str, text: str):
+        tokens = estimate_tokens(text)
+        self.turns.append((role, text, tokens))
+        self.tokens += tokens
+        self.size += len(text.encode("utf-8"))
+
+    def overflow(self, max_bytes: int) -> list:
+        """
+        نوبت‌هایی را که باید در خلاصه جمع شوند از پنجره به pending منتقل و برمی‌گرداند
+        تا جلسه در بودجه‌ی توکن و سقف حجم بماند.
+        نوبت‌های اخیر (SESSION_RECENT_TURNS) همیشه عینی می‌مانند.
+        """
+        budget = SESSION_TOKEN_BUDGET - estimate_tokens(self.summary)
+        folded = []
+        while len(self.turns) > SESSION_RECENT_TURNS and (
+            self.tokens > budget or self.size > max_bytes
+        ):
+            role, text, tokens = self.turns.popleft()
+            self.tokens -= tokens
+            folded.append((role, text))
+        self.pending.extend(folded)
+        return folded
+
+    def apply_summary(self, summary: str, folded: list):
+        """خلاصه‌ی تازه را جایگزین و نوبت‌های جمع‌شده را از pending حذف می‌کند."""
+        removed = sum(len(text.encode("utf-8")) for _, text in folded)
+        self.size += len(summary.encode("utf-8")) - len(self.summary.encode("utf-8")) - removed
+        self.summary = summary
+        del self.pending[:len(folded)]
+
+# --------------------------- انبار جلسه‌ها ---------------------------
+
+class SessionStore:
+    def __init__(self, max_session_bytes=int(SESSION_MAX_KB * 1024),
+                 max_total_bytes=None, idle_ttl=SESSION_IDLE_TTL):
+        self.max_session_bytes = max_session_bytes
+        self.max_total_bytes = (int(get_settings().session_memory_mb * 1024 * 1024)
+                                if max_total_bytes is None else max_total_bytes)
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()  # به ترتیب آخرین استفاده
+
+    def get(self, session_id: str) -> Session:
+        """جلسه را برمی‌گرداند و در صورت نبود (یا منقضی شدن) جلسه‌ی تازه می‌سازد."""
+        self.evict_idle()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._sessions[session_id] = session
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def total_bytes(self) -> int:
+        return sum(s.size for s in self._sessions.values())
+
+    def evict_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_access >= deadline:
+                break
+            self._sessions.popitem(last=False)
+
+    def enforce_global_cap(self, keep: str = None):
+        """قدیمی‌ترین جلسه‌ها را تا رسیدن به سقف کل حذف می‌کند (به جز جلسه‌ی keep)."""
+        total = self.total_bytes()
+        for session_id in list(self._sessions):
+            if total <= self.max_total_bytes:
+                break
+            if session_id == keep:
+                continue
+            total -= self._sessions.pop(session_id).size
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "bytes": self.total_bytes()}
+
+
+session_store = SessionStore()
+
+# --------------------------- خلاصه‌ی در حال اجرا ---------------------------
+
+def fold_prompt(summary: str, turns: list) -> str:
+    lines = [f"{'کاربر' if role == 'user' else 'دستیار'}: {text}" for role, text in turns]
+    return (
+        "خلاصه‌ی فعلی یک گفتگو و چند نوبت تازه‌ی آن را می‌بینی. یک خلاصه‌ی به‌روز، "
+        "کوتاه و فارسی بنویس که نکات و اطلاعات مهم برای ادامه‌ی گفتگو را نگه دارد.\n\n"
+        f"خلاصه‌ی فعلی:\n{summary or '-'}\n\nنوبت‌های تازه:\n" + "\n".join(lines)
+    )
+
+
+def truncate_summary(summary: str, turns: list, max_bytes: int) -> str:
+    """جایگزین بدون فراخوانی بالادستی: متن نوبت‌ها را اضافه و از ابتدا کوتاه می‌کند."""
+    text = "\n".join([summary] + [text for _, text in turns]).strip()
+    data = text.encode("utf-8")
+    if len(data) > max_bytes:
+        text = data[-max_bytes:].decode("utf-8", errors="ignore")
+    return text
@@ -0,0 +1,113 @@
+# ---------------------------- settings.py ----------------------------
+# تنظیمات کارایی سرور در یک شیء تایپ‌دار و تنها جای نام و پیش‌فرض متغیرهای محیطی آن‌ها.
+# ماژول‌ها مقدارها را هنگام استفاده از get_settings() می‌خوانند؛ create_app در main.py
+# تنظیمات داده‌شده را با configure جایگزین و روی کلاینت‌ها، کش‌ها و زمان‌بند همان پروسه
+# اعمال می‌کند، و backend/serve.py بخش سرور (worker، keep-alive، خاموش شدن تدریجی) را
+# به uvicorn می‌دهد. این ماژول عمداً چیزی از اپ import نمی‌کند تا پروسه‌ی ناظر
+# launcher کلاینت‌ها را نسازد.
+
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _cpu_workers() -> int:
+    # WEB_CONCURRENCY=0 یعنی یک worker برای هر هسته‌ی قابل استفاده
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+@dataclass(frozen=True)
+class Settings:
+    # مهلت‌ها (ثانیه)
+    upstream_timeout: float = 60.0
+    stream_chunk_timeout: float = 30.0
+    request_deadline: float = 120.0
+
+    # محدودیت‌های هم‌زمانی (هر worker)
+    upstream_concurrency: int = 8
+    upstream_queue_size: int = 100
+    batch_concurrency: int = 8
+    summary_parallelism: int = 4
+    tts_segment_parallelism: int = 3
+    # سهمیه‌ی سراسری Gemini برای کل ماشین؛ بین workerها تقسیم می‌شود
+    upstream_rate_limit: float = 10.0
+    upstream_rate_burst: float = 20.0
+
+    # اندازه‌ی کش‌ها (هر worker)
+    response_cache_size: int = 1024
+    response_cache_ttl: float = 3600.0
+    tts_cache_memory_mb: float = 64.0
+    tts_cache_disk_mb: float = 1024.0
+    session_memory_mb: float = 64.0
+
+    # threadpool پیش‌فرض (asyncio.to_thread و کارهای sync در Starlette)
+    threadpool_size: int = 40
+
+    # سرور
+    host: str = "0.0.0.0"
+    port: int = 8000
+    workers: int = 1
+    # باید از مهلت بیکاری proxy جلوی سرور بیشتر باشد تا اتصال نیمه‌بسته 502 ندهد
+    keep_alive: float = 75.0
+    # مهلت تمام شدن درخواست‌ها و استریم‌های در حال اجرا بعد از SIGTERM
+    graceful_shutdown_timeout: float = 30.0
+    backlog: int = 2048
+    # سقف اتصال‌های هم‌زمان هر worker (0 یعنی بدون سقف)؛ بیشتر از آن 503 می‌گیرد
+    limit_concurrency: int = 0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        return cls(
+            upstream_timeout=float(os.getenv("GEMINI_TIMEOUT", "60")),
+            stream_chunk_timeout=float(os.getenv("GEMINI_STREAM_CHUNK_TIMEOUT", "30")),
+            request_deadline=float(os.getenv("REQUEST_DEADLINE", "120")),
+            upstream_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+            upstream_queue_size=int(os.getenv("UPSTREAM_QUEUE_SIZE", "100")),
+            batch_concurrency=int(os.getenv("REPLY_BATCH_CONCURRENCY", "8")),
+            summary_parallelism=int(os.getenv("SUMMARY_PARALLELISM", "4")),
+            tts_segment_parallelism=int(os.getenv("TTS_SEGMENT_PARALLELISM", "3")),
+            upstream_rate_limit=float(os.getenv("GEMINI_RATE_LIMIT", "10")),
+            upstream_rate_burst=float(os.getenv("GEMINI_RATE_BURST", "20")),
+            response_cache_size=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+            response_cache_ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            tts_cache_memory_mb=float(os.getenv("TTS_CACHE_MEMORY_MB", "64")),
+            tts_cache_disk_mb=float(os.getenv("TTS_CACHE_DISK_MB", "1024")),
+            session_memory_mb=float(os.getenv("SESSION_GLOBAL_MAX_MB", "64")),
+            threadpool_size=int(os.getenv("THREADPOOL_SIZE", "40")),
+            host=os.getenv("HOST", "0.0.0.0"),
+            port=int(os.getenv("PORT", "8000")),
+            workers=workers if workers > 0 else _cpu_workers(),
+            keep_alive=float(os.getenv("KEEP_ALIVE_TIMEOUT", "75")),
+            graceful_shutdown_timeout=float(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+            backlog=int(os.getenv("SERVER_BACKLOG", "2048")),
+            limit_concurrency=int(os.getenv("SERVER_LIMIT_CONCURRENCY", "0")),
+        )
+
+    def per_worker_rate(self) -> tuple:
+        """(نرخ، ظرفیت) سطل توکن سراسری هر worker، تا جمع workerها از سهمیه‌ی کلید نگذرد."""
+        workers = max(1, self.workers)
+        return self.upstream_rate_limit / workers, max(1.0, self.upstream_rate_burst / workers)
+
+
+_current = None
+
+
+def get_settings() -> Settings:
+    """تنظیمات همین پروسه؛ بار اول از env خوانده می‌شود."""
+    global _current
+    if _current is None:
+        _current = Settings.from_env()
+    return _current
+
+
+def configure(settings: Settings):
+    """تنظیمات پروسه را عوض می‌کند؛ مقدارهایی که هنگام استفاده خوانده می‌شوند فوراً اثر دارند."""
+    global _current
+    _current = settings
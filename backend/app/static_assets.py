@@ -0,0 +1,192 @@
+# ---------------------------- static_assets.py ----------------------------
+# سرو فایل‌های frontend از حافظه، به جای خواندن از دیسک در هر درخواست.
+# همه‌ی فایل‌ها هنگام شروع یک بار خوانده و از قبل فشرده می‌شوند (gzip، و brotli اگر
+# پکیج brotli نصب باشد) و با ETag قوی، پاسخ 304 و Cache-Control مناسب برگردانده می‌شوند:
+#   - فایل‌های دارای هش در نام (مثل app.3f9a1c2e.js): کش یک‌ساله و immutable
+#   - بقیه (مثل index.html): no-cache، یعنی همیشه با ETag اعتبارسنجی می‌شوند
+# با STATIC_DEV_RELOAD=1 تغییر فایل‌ها روی دیسک بدون ری‌استارت دیده می‌شود.
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+# --------------------------- تنظیمات ---------------------------
+
+STATIC_DIR = os.getenv("STATIC_DIR", "frontend")
+# بررسی تغییر فایل‌ها در هر درخواست (فقط برای توسعه)
+STATIC_DEV_RELOAD = os.getenv("STATIC_DEV_RELOAD", "0").lower() in ("1", "true", "yes")
+# فایل‌های کوچک‌تر از این (بایت) فشرده نمی‌شوند
+STATIC_MIN_COMPRESS = int(os.getenv("STATIC_MIN_COMPRESS", "256"))
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# نام‌هایی مثل app.3f9a1c2e.js یا style-3f9a1c2e.css
+_HASHED_NAME = re.compile(r"[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$")
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml",
+                 "application/xml", "application/manifest+json")
+
+# --------------------------- فایل‌ها ---------------------------
+
+class Asset:
+    __slots__ = ("media_type", "etag", "cache_control", "bodies", "mtime", "size")
+
+    def __init__(self, name: str, data: bytes, mtime: float):
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if media_type.startswith("text/"):
+            media_type += "; charset=utf-8"
+        self.media_type = media_type
+        self.mtime = mtime
+        self.size = len(data)
+        self.cache_control = IMMUTABLE_CACHE if _HASHED_NAME.search(name) else REVALIDATE_CACHE
+
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        # بدنه‌ی هر encoding؛ هر نسخه ETag جدا دارد چون بایت‌هایش متفاوت است
+        self.bodies = {"identity": data}
+        if len(data) >= STATIC_MIN_COMPRESS and media_type.startswith(_COMPRESSIBLE):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                self.bodies["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    self.bodies["br"] = compressed
+
+    def etag_for(self, encoding: str) -> str:
+        if encoding == "identity":
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    def __init__(self, directory: str = None, dev_reload: bool = None):
+        self.directory = os.path.abspath(directory or STATIC_DIR)
+        self.dev_reload = STATIC_DEV_RELOAD if dev_reload is None else dev_reload
+        self._assets = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _read(self, name: str):
+        path = os.path.join(self.directory, name)
+        try:
+            stat = os.stat(path)
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        return Asset(name, data, stat.st_mtime)
+
+    def load(self):
+        """همه‌ی فایل‌های پوشه را می‌خواند و فشرده می‌کند."""
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), self.directory)
+                name = name.replace(os.sep, "/")
+                asset = self._read(name)
+                if asset is not None:
+                    assets[name] = asset
+        with self._lock:
+            self._assets = assets
+            self._loaded = True
+
+    def _safe_name(self, name: str):
+        name = name.lstrip("/")
+        full = os.path.abspath(os.path.join(self.directory, name))
+        if not full.startswith(self.directory + os.sep):
+            return None
+        return os.path.relpath(full, self.directory).replace(os.sep, "/")
+
+    def get(self, name: str):
+        if not self._loaded:
+            self.load()
+        name = self._safe_name(name)
+        if name is None:
+            return None
+        asset = self._assets.get(name)
+        if not self.dev_reload:
+            return asset
+
+        # حالت توسعه: اگر فایل تغییر کرده یا تازه اضافه شده، دوباره خوانده می‌شود
+        try:
+            stat = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            self._assets.pop(name, None)
+            return None
+        if asset is None or asset.mtime != stat.st_mtime or asset.size != stat.st_size:
+            asset = self._read(name)
+            if asset is not None:
+                self._assets[name] = asset
+        return asset
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._assets),
+            "bytes": sum(a.size for a in self._assets.values()),
+            "compressed_bytes": sum(
+                min(len(b) for b in a.bodies.values()) for a in self._assets.values()),
+            "brotli": brotli is not None,
+            "dev_reload": self.dev_reload,
+        }
+
+    def response(self, request: Request, name: str) -> Response:
+        """پاسخ HTTP برای یک فایل با انتخاب encoding و پشتیبانی از If-None-Match."""
+        asset = self.get(name)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in asset.bodies and candidate in accepted:
+                encoding = candidate
+                break
+
+        etag = asset.etag_for(encoding)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+            if "*" in tags or etag in tags:
+                return Response(status_code=304, headers=headers)
+
+        body = asset.bodies[encoding]
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(content=body, headers=headers, media_type=asset.media_type)
+
+
+static_assets = StaticAssets()
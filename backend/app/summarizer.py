@@ -0,0 +1,128 @@
+# ---------------------------- summarizer.py ----------------------------
+# موتور خلاصه‌سازی map-reduce برای متن‌های بلند.
+# متن در مرز پاراگراف و جمله به تکه‌هایی به اندازه‌ی بودجه‌ی توکن تقسیم می‌شود،
+# تکه‌ها هم‌زمان (با موازی‌سازی محدود) خلاصه می‌شوند و خلاصه‌های جزئی در یک یا
+# چند مرحله‌ی reduce به یک پاراگراف نهایی تبدیل می‌شوند. بنابراین تأخیر با لگاریتم
+# حجم متن رشد می‌کند و متن‌های بزرگ‌تر از پنجره‌ی مدل هم قابل خلاصه‌سازی‌اند.
+
+import asyncio
+import os
+
+from .gemini_client import generate
+from .settings import get_settings
+from .tokens import chars_for_tokens, estimate_tokens
+from .tts import split_sentences
+
+# --------------------------- تنظیمات ---------------------------
+
+# حداکثر توکن هر تکه در مرحله‌ی map (و هر گروه در مرحله‌ی reduce)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+# سقف کل متن ورودی (توکن تخمینی)؛ بیشتر از این قبل از هر فراخوانی با 413 رد می‌شود
+SUMMARIZE_MAX_INPUT_TOKENS = int(os.getenv("SUMMARIZE_MAX_INPUT_TOKENS", "250000"))
+
+SUMMARY_PROMPT = "متن زیر را کوتاه و خلاصه کن:\n\n"
+MAP_PROMPT = (
+    "این بخشی از یک متن بلندتر است. نکات اصلی آن را کوتاه و به زبان فارسی خلاصه کن "
+    "و چیزی از خودت اضافه نکن:\n\n"
+)
+REDUCE_PROMPT = (
+    "این‌ها خلاصه‌های بخش‌های پشت‌سرهم یک متن هستند. آن‌ها را در حد یک پاراگراف "
+    "و به زبان فارسی در یک خلاصه‌ی منسجم ترکیب کن:\n\n"
+)
+# مرحله‌ی reduce میانی: خروجی هنوز ورودی یک reduce دیگر است
+MERGE_PROMPT = (
+    "این‌ها خلاصه‌های بخش‌های پشت‌سرهم یک متن هستند. آن‌ها را به ترتیب در یک "
+    "خلاصه‌ی کوتاه‌تر فارسی ترکیب کن و نکات مهم را نگه دار:\n\n"
+)
+
+
+class SummarySafetyBlocked(Exception):
+    """Gemini خلاصه‌سازی بخشی از متن را به دلیل خط‌مشی‌های ایمنی رد کرد."""
+
+# --------------------------- تکه‌بندی ---------------------------
+
+def split_chunks(text: str, max_tokens: int = None) -> list:
+    """
+    متن را به تکه‌هایی با حداکثر max_tokens توکن تقسیم می‌کند.
+    پاراگراف‌ها تا جای ممکن کنار هم می‌مانند و پاراگراف‌های بزرگ در مرز جمله شکسته می‌شوند.
+    """
+    max_tokens = max_tokens or SUMMARY_CHUNK_TOKENS
+    # تعداد کاراکتر متناظر با بودجه‌ی توکن، با تراکم توکن همین متن (فارسی متراکم‌تر است)
+    max_chars = chars_for_tokens(text, max_tokens)
+
+    chunks = []
+    current = []
+    current_len = 0
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= max_chars else split_sentences(paragraph, max_chars)
+        for piece in pieces:
+            if current and current_len + 2 + len(piece) > max_chars:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            current.append(piece)
+            current_len += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+# --------------------------- خلاصه‌سازی ---------------------------
+
+async def _summarize_once(model, prompt: str) -> str:
+    resp = await generate(model, prompt, tools=[])
+    if resp.candidates and resp.candidates[0].finish_reason.name == 'SAFETY':
+        raise SummarySafetyBlocked()
+    return resp.text.strip()
+
+
+async def _map(model, prompt: str, chunks: list, limiter, progress, stage: str) -> list:
+    done = 0
+
+    async def one(chunk):
+        nonlocal done
+        async with limiter:
+            summary = await _summarize_once(model, prompt + chunk)
+        done += 1
+        if progress:
+            await progress({"type": "progress", "stage": stage, "done": done, "total": len(chunks)})
+        return summary
+
+    tasks = [asyncio.ensure_future(one(chunk)) for chunk in chunks]
+    try:
+        # ترتیب خروجی همان ترتیب تکه‌هاست
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def summarize(model, text: str, progress=None,
+                    max_tokens: int = None, parallelism: int = None) -> str:
+    """
+    متن را خلاصه می‌کند. متن کوتاه با یک فراخوانی و متن بلند با map-reduce.
+    progress (اختیاری) یک تابع async است که رویدادهای پیشرفت را دریافت می‌کند.
+    """
+    max_tokens = max_tokens or SUMMARY_CHUNK_TOKENS
+    if estimate_tokens(text) <= max_tokens:
+        return await _summarize_once(model, SUMMARY_PROMPT + text)
+
+    limiter = asyncio.Semaphore(max(1, parallelism or get_settings().summary_parallelism))
+    partials = await _map(model, MAP_PROMPT, split_chunks(text, max_tokens),
+                          limiter, progress, "map")
+
+    # reduce سلسله‌مراتبی: تا وقتی خلاصه‌های جزئی در یک پنجره جا نشوند، گروه‌گروه ادغام می‌شوند
+    level = 0
+    while estimate_tokens("\n\n".join(partials)) > max_tokens and len(partials) > 1:
+        level += 1
+        groups = split_chunks("\n\n".join(partials), max_tokens)
+        if len(groups) >= len(partials):
+            # هر خلاصه‌ی جزئی به تنهایی یک گروه شده؛ ادغام جفت‌جفت پیشرفت را تضمین می‌کند
+            groups = ["\n\n".join(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+        partials = await _map(model, MERGE_PROMPT, groups, limiter, progress, f"reduce-{level}")
+
+    if progress:
+        await progress({"type": "progress", "stage": "final", "done": 0, "total": 1})
+    return await _summarize_once(model, REDUCE_PROMPT + "\n\n".join(partials))
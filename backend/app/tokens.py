@@ -0,0 +1,230 @@
+# ---------------------------- tokens.py ----------------------------
+# تخمین سریع تعداد توکن و سیاست اندازه‌ی ورودی هر مسیر.
+#   - تخمین محلی و خطی از چند شمارش که در C انجام می‌شوند (تعداد حرف، بایت‌های اضافه‌ی
+#     UTF-8 که عملاً تعداد حروف فارسی است، و فاصله‌ها)، پس تراکم متفاوت توکن در فارسی و
+#     انگلیسی دیده می‌شود و هر تخمین فقط چند میکروثانیه طول می‌کشد
+#   - ضرایب بعد از warmup با count_tokens خود مدل روی چند نمونه‌ی ثابت کالیبره می‌شوند
+#   - تخمین متن‌های کوتاه تکراری (مثل خلاصه‌ی جلسه) memoize می‌شود
+#   - سیاست هر مسیر قبل از هر فراخوانی بالادستی: رد (413)، کوتاه کردن در مرز جمله،
+#     یا فرستادن به مسیر تکه‌ای؛ تخمین در پاسخ‌ها و /metrics گزارش می‌شود
+
+import asyncio
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .metrics import Counter, Histogram
+
+load_dotenv()
+
+# --------------------------- تنظیمات ---------------------------
+
+# کالیبره کردن ضرایب با count_tokens مدل بعد از warmup
+TOKEN_CALIBRATION = os.getenv("TOKEN_CALIBRATION", "1").lower() in ("1", "true", "yes")
+TOKEN_CALIBRATION_TIMEOUT = float(os.getenv("TOKEN_CALIBRATION_TIMEOUT", "15"))
+# متن‌های کوتاه‌تر از این (کاراکتر) memoize می‌شوند؛ متن بلند را نگه داشتن نمی‌ارزد
+_MEMO_MAX_CHARS = 4096
+_MEMO_SIZE = 8192
+
+# (ثابت، هر حرف، هر بایت اضافه‌ی UTF-8، هر فاصله)؛ حدود 4 حرف انگلیسی یا 2.6 حرف فارسی در هر توکن
+DEFAULT_COEFFICIENTS = (1.0, 0.25, 0.13, 0.0)
+
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+input_tokens = Histogram(
+    "input_tokens_estimated", "Estimated input tokens per request, by route.",
+    ("route",), buckets=TOKEN_BUCKETS)
+input_actions = Counter(
+    "input_policy_actions_total", "Input size policy decisions, by route and action.",
+    ("route", "action"))
+
+# --------------------------- تخمین ---------------------------
+
+_coefficients = DEFAULT_COEFFICIENTS
+
+
+def _features(text: str):
+    chars = len(text)
+    extra = 0 if text.isascii() else len(text.encode("utf-8")) - chars
+    return chars, extra, text.count(" ") + text.count("\n")
+
+
+def _estimate(text: str) -> int:
+    c0, per_char, per_extra, per_space = _coefficients
+    chars, extra, spaces = _features(text)
+    return max(1, int(c0 + per_char * chars + per_extra * extra + per_space * spaces + 0.5))
+
+
+_estimate_memo = lru_cache(maxsize=_MEMO_SIZE)(_estimate)
+
+
+def estimate_tokens(text: str) -> int:
+    """تخمین تعداد توکن متن برای مدل‌های Gemini."""
+    if len(text) <= _MEMO_MAX_CHARS:
+        return _estimate_memo(text)
+    return _estimate(text)
+
+
+def chars_for_tokens(text: str, max_tokens: int) -> int:
+    """تعداد کاراکتر متناظر با max_tokens توکن، با تراکم توکن همین متن."""
+    if not text:
+        return max_tokens * 4
+    return max(1, int(max_tokens * len(text) / estimate_tokens(text)))
+
+# --------------------------- کالیبراسیون ---------------------------
+
+_CALIBRATION_SAMPLES = (
+    "تو یک دستیار هوشمند و دلسوز دانشجویان هستی که به زبان فارسی پاسخ می‌دهی. "
+    "وظیفه اصلی تو پاسخ دادن به سوالات درسی، پروژه‌ای، برنامه‌نویسی و ارائه راهنمایی‌های "
+    "تحصیلی است. همیشه پاسخی جامع، دقیق و متناسب با سطح دانشگاهی ارائه بده.",
+    "لیست پیوندی ساختمان داده‌ای است که در آن هر گره، داده و اشاره‌گری به گره بعدی دارد. "
+    "برخلاف آرایه، درج و حذف در وسط لیست در زمان ثابت انجام می‌شود ولی دسترسی تصادفی "
+    "به عنصر i‌ام به زمان خطی نیاز دارد.",
+    "A linked list is a data structure in which each node holds a value and a pointer "
+    "to the next node. Unlike an array, insertion and deletion in the middle take constant "
+    "time, but random access to the i-th element takes linear time.",
+    "def merge_sort(items):\n    if len(items) <= 1:\n        return items\n"
+    "    middle = len(items) // 2\n    left = merge_sort(items[:middle])\n"
+    "    right = merge_sort(items[middle:])\n    return merge(left, right)\n",
+    "پیچیدگی زمانی Quick Sort در حالت میانگین O(n log n) و در بدترین حالت O(n^2) است؛ "
+    "مثلاً برای n = 1000 حدود 10000 مقایسه در حالت میانگین لازم است.",
+)
+
+
+class _Calibration:
+    def __init__(self):
+        self.calibrated = False
+        self.samples = 0
+        self.error_before = None
+        self.error_after = None
+
+    def stats(self) -> dict:
+        return {
+            "calibrated": self.calibrated,
+            "coefficients": [round(c, 4) for c in _coefficients],
+            "samples": self.samples,
+            "mean_error_before": self.error_before,
+            "mean_error_after": self.error_after,
+        }
+
+
+calibration = _Calibration()
+
+
+def _mean_error(texts, counts, coefficients) -> float:
+    X = np.array([(1, *_features(t)) for t in texts], dtype=float)
+    predicted = X @ np.asarray(coefficients)
+    return round(float(np.mean(np.abs(predicted - counts) / counts)), 4)
+
+
+def fit_coefficients(texts: list, counts: list):
+    """ضرایب با کمترین مربعات روی (متن، تعداد واقعی توکن)؛ ضرایب منفی صفر می‌شوند."""
+    global _coefficients
+    counts = np.asarray(counts, dtype=float)
+    X = np.array([(1, *_features(t)) for t in texts], dtype=float)
+    fitted = np.clip(np.linalg.lstsq(X, counts, rcond=None)[0], 0, None)
+    calibration.error_before = _mean_error(texts, counts, _coefficients)
+    _coefficients = tuple(float(c) for c in fitted)
+    _estimate_memo.cache_clear()
+    calibration.error_after = _mean_error(texts, counts, _coefficients)
+    calibration.samples = len(texts)
+    calibration.calibrated = True
+
+
+async def calibrate(model):
+    """
+    تعداد واقعی توکن نمونه‌ها را از count_tokens مدل می‌گیرد و ضرایب را دوباره برازش می‌کند.
+    سربار ثابت (مثل system_instruction) با شمارش یک متن یک‌حرفی حذف می‌شود.
+    """
+    # هر نمونه در دو اندازه تا ثابت و ضرایب از هم جدا شوند
+    texts = [t for sample in _CALIBRATION_SAMPLES for t in (sample, " ".join([sample] * 3))]
+
+    async def count(text):
+        response = await asyncio.wait_for(model.count_tokens_async(text), TOKEN_CALIBRATION_TIMEOUT)
+        return response.total_tokens
+
+    try:
+        baseline, *counts = await asyncio.gather(count("a"), *(count(t) for t in texts))
+    except Exception as e:
+        print("⚠️ کالیبراسیون تخمین توکن انجام نشد:", e)
+        return
+    fit_coefficients(texts, [max(1, c - baseline + 1) for c in counts])
+    print(f"✅ Token estimator calibrated (mean error {calibration.error_before} -> "
+          f"{calibration.error_after}).")
+
+# --------------------------- سیاست ورودی ---------------------------
+
+InputPolicy = namedtuple("InputPolicy", "action max_tokens hard_max")
+Admitted = namedtuple("Admitted", "text tokens action")
+
+_policies = {}
+
+
+class InputTooLarge(Exception):
+    """ورودی از سقف توکن مسیر بزرگ‌تر است (413)."""
+    status_code = 413
+
+    def __init__(self, message: str, tokens: int, max_tokens: int):
+        super().__init__(message)
+        self.tokens = tokens
+        self.max_tokens = max_tokens
+
+
+def register_input_policy(route: str, action: str, max_tokens: int, hard_max: int = None):
+    """
+    action یکی از:
+      reject  بیشتر از max_tokens رد می‌شود
+      trim    بیشتر از max_tokens در مرز جمله کوتاه می‌شود
+      chunk   بیشتر از max_tokens به مسیر تکه‌ای می‌رود و بیشتر از hard_max رد می‌شود
+    """
+    if action not in ("reject", "trim", "chunk"):
+        raise ValueError(f"Unknown input policy action: {action}")
+    _policies[route] = InputPolicy(action, max_tokens, hard_max)
+
+
+def govern_input(route: str, text: str) -> Admitted:
+    """سیاست مسیر را روی متن اعمال می‌کند؛ متن نهایی، تخمین توکن و تصمیم را برمی‌گرداند."""
+    tokens = estimate_tokens(text)
+    input_tokens.observe(route, value=tokens)
+    policy = _policies.get(route)
+    action = "ok"
+    if policy is not None and tokens > policy.max_tokens:
+        if policy.action == "trim":
+            text = trim_to_tokens(text, policy.max_tokens)
+            tokens, action = estimate_tokens(text), "trimmed"
+        elif policy.action == "chunk" and (policy.hard_max is None or tokens <= policy.hard_max):
+            action = "chunked"
+        else:
+            limit = policy.max_tokens if policy.action == "reject" else policy.hard_max
+            input_actions.inc(route, "rejected")
+            raise InputTooLarge(f"Input is too large: about {tokens} tokens, limit {limit}.",
+                                tokens, limit)
+    input_actions.inc(route, action)
+    return Admitted(text, tokens, action)
+
+
+_SENTENCE_END = re.compile(r"[.!?؟…\n]")
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """ابتدای متن تا حداکثر max_tokens توکن، بریده‌شده در آخرین مرز جمله (یا کلمه)."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = chars_for_tokens(text, max_tokens)
+    while True:
+        window = text[:budget]
+        ends = [m.end() for m in _SENTENCE_END.finditer(window)]
+        if ends and ends[-1] > len(window) // 2:
+            cut = ends[-1]
+        else:
+            cut = window.rfind(" ")
+            cut = cut if cut > len(window) // 2 else len(window)
+        trimmed = text[:cut].rstrip()
+        # تراکم توکن ابتدای متن ممکن است از کل متن بیشتر باشد
+        if estimate_tokens(trimmed) <= max_tokens or budget <= 1:
+            return trimmed
+        budget = int(budget * 0.9)
@@ -0,0 +1,236 @@
+# ---------------------------- tts.py ----------------------------
+# موتور TTS استریم: متن بلند را در مرز جمله‌ها تکه می‌کند، تکه‌ها را هم‌زمان
+# سنتز می‌کند و صدای آن‌ها را به ترتیب پشت یک هدر WAV واحد می‌فرستد.
+# برای حالت صوتی، SentenceStream جمله‌های کامل را از متن در حال تولید جدا می‌کند تا
+# سنتز هر جمله قبل از پایان پاسخ چت شروع شود.
+
+import asyncio
+import base64
+import os
+import re
+import struct
+
+from .gemini_client import generate_stream
+from .settings import get_settings
+from .tokens import trim_to_tokens
+
+# --------------------------- تنظیمات ---------------------------
+
+SAMPLE_RATE = 24000
+NUM_CHANNELS = 1
+SAMPLE_WIDTH = 2
+
+# حداکثر طول کل متن قابل خواندن (توکن تخمینی)؛ متن بلندتر در مرز جمله کوتاه می‌شود
+TTS_MAX_INPUT_TOKENS = int(os.getenv("TTS_MAX_INPUT_TOKENS", "2000"))
+# اندازه‌ی تقریبی هر تکه‌ی ارسالی به Gemini (کاراکتر)
+TTS_SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", "300"))
+# حالت صوتی: تکه‌های کوتاه‌تر از این (کاراکتر) با جمله‌ی بعدی یکی می‌شوند
+VOICE_MIN_SEGMENT_CHARS = int(os.getenv("VOICE_MIN_SEGMENT_CHARS", "20"))
+
+# --------------------------- هدر WAV ---------------------------
+
+# برای استریم طول داده از قبل معلوم نیست؛ طبق عرف ابزارهایی مثل ffmpeg
+# اندازه‌ها را 0xFFFFFFFF می‌گذاریم تا پخش‌کننده تا پایان اتصال بخواند.
+STREAMING_DATA_SIZE = 0xFFFFFFFF
+
+
+def wav_header(sample_rate=SAMPLE_RATE, data_size=STREAMING_DATA_SIZE,
+               num_channels=NUM_CHANNELS, sample_width=SAMPLE_WIDTH) -> bytes:
+    byte_rate = sample_rate * num_channels * sample_width
+    riff_size = min(36 + data_size, 0xFFFFFFFF)
+    return b''.join((
+        b'RIFF', struct.pack('<I', riff_size), b'WAVE',
+        b'fmt ', struct.pack('<IHHIIHH', 16, 1, num_channels, sample_rate,
+                             byte_rate, num_channels * sample_width, sample_width * 8),
+        b'data', struct.pack('<I', data_size),
+    ))
+
+
+def pcm_to_wav(pcm_data: bytes, sample_rate=SAMPLE_RATE) -> bytes:
+    return wav_header(sample_rate, len(pcm_data)) + pcm_data
+
+# --------------------------- تکه‌بندی متن ---------------------------
+
+# پایان جمله در فارسی و انگلیسی؛ علامت‌ها همراه جمله‌ی قبلی می‌مانند
+_SENTENCE_END = re.compile(r'(?<=[.!?؟!…؛;])\s+|\n+')
+
+
+def split_sentences(text: str, max_chars: int = None) -> list:
+    """
+    متن را در مرز جمله‌ها به تکه‌هایی با طول حداکثر max_chars تقسیم می‌کند.
+    جمله‌های کوتاه کنار هم جمع می‌شوند و جمله‌های خیلی بلند در فاصله‌ها شکسته می‌شوند.
+    """
+    max_chars = max_chars or TTS_SEGMENT_CHARS
+    segments = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                segments.append(current)
+                current = ""
+            segments.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+
+    if current:
+        segments.append(current)
+    return segments
+
+
+class SentenceStream:
+    """
+    تقسیم تدریجی متن در حال تولید: feed تکه‌های جدید متن را می‌گیرد و تکه‌های
+    کاملی را که آماده‌ی سنتز هستند برمی‌گرداند؛ flush باقی‌مانده را می‌دهد.
+    مرز جمله فقط وقتی قطعی است که بعد از علامت پایان، فاصله یا خط جدید آمده باشد.
+    """
+
+    def __init__(self, max_chars: int = None, min_chars: int = None):
+        self.max_chars = max_chars or TTS_SEGMENT_CHARS
+        self.min_chars = VOICE_MIN_SEGMENT_CHARS if min_chars is None else min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> list:
+        self._buffer += text
+        end = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if match.start() >= self.min_chars:
+                end = match.end()
+                break
+        if not end:
+            if len(self._buffer) <= self.max_chars:
+                return []
+            # جمله‌ی خیلی بلند بدون علامت پایان: در آخرین فاصله شکسته می‌شود
+            end = self._buffer.rfind(' ', 0, self.max_chars)
+            if end <= 0:
+                end = self.max_chars
+        ready, self._buffer = self._buffer[:end], self._buffer[end:]
+        return split_sentences(speakable_text(ready), self.max_chars) + self.feed("")
+
+    def flush(self) -> list:
+        ready, self._buffer = self._buffer, ""
+        return split_sentences(speakable_text(ready), self.max_chars)
+
+
+_MARKDOWN_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_MARKDOWN_MARKS = re.compile(r'[*#`>|~]+|_{2,}')
+_SPACES = re.compile(r'[ \t]+')
+
+
+def speakable_text(text: str) -> str:
+    """علامت‌های markdown پاسخ چت را حذف می‌کند تا خوانده نشوند."""
+    return _SPACES.sub(' ', _MARKDOWN_MARKS.sub(' ', _MARKDOWN_LINK.sub(r'\1', text)))
+
+# --------------------------- سنتز ---------------------------
+
+def _speech_config(voice: str) -> dict:
+    return {
+        "response_modalities": ["AUDIO"],
+        "speech_config": {
+            "voice_config": {
+                "prebuilt_voice_config": {
+                    "voice_name": voice
+                }
+            }
+        }
+    }
+
+
+async def synthesize_pcm(model, text: str, voice: str):
+    """PCM خام یک تکه‌ی متن را به محض رسیدن از Gemini yield می‌کند."""
+    async for chunk in generate_stream(
+        model,
+        [{"parts": [{"text": text}]}],
+        generation_config=_speech_config(voice),
+    ):
+        if not chunk.candidates:
+            continue
+        for p in chunk.candidates[0].content.parts:
+            if hasattr(p, "inline_data") and p.inline_data:
+                yield base64.b64decode(p.inline_data.data)
+
+
+async def stream_speech(model, text: str, voice: str,
+                        parallelism: int = None):
+    """
+    PCM کل متن را به ترتیب yield می‌کند.
+    تکه‌ی اول مستقیم استریم می‌شود و تکه‌های بعدی هم‌زمان در پس‌زمینه سنتز و
+    در صف نگه داشته می‌شوند تا نوبتشان برسد. خطای هر تکه به مصرف‌کننده منتقل می‌شود.
+    """
+    segments = split_sentences(trim_to_tokens(text, TTS_MAX_INPUT_TOKENS))
+    if not segments:
+        return
+    async for _, _, pcm in stream_segments(model, _iterate(segments), voice, parallelism):
+        yield pcm
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+async def stream_segments(model, segments, voice: str,
+                          parallelism: int = None):
+    """
+    مثل stream_speech ولی تکه‌ها از یک async iterator می‌آیند (مثلاً جمله‌های یک
+    پاسخ چت در حال تولید)؛ سنتز هر تکه به محض رسیدن شروع می‌شود.
+    (اندیس تکه، متن تکه، PCM) را به ترتیب تکه‌ها yield می‌کند.
+    """
+    limiter = asyncio.Semaphore(max(1, parallelism or get_settings().tts_segment_parallelism))
+    order = asyncio.Queue()
+    done = object()
+    tasks = []
+
+    async def worker(segment, queue):
+        async with limiter:
+            try:
+                async for pcm in synthesize_pcm(model, segment, voice):
+                    queue.put_nowait(pcm)
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                queue.put_nowait(done)
+
+    async def producer():
+        try:
+            async for segment in segments:
+                queue = asyncio.Queue()
+                tasks.append(asyncio.create_task(worker(segment, queue)))
+                order.put_nowait((segment, queue))
+        except Exception as e:
+            order.put_nowait(e)
+        finally:
+            order.put_nowait(done)
+
+    tasks.append(asyncio.create_task(producer()))
+    try:
+        index = 0
+        while True:
+            entry = await order.get()
+            if entry is done:
+                return
+            if isinstance(entry, Exception):
+                raise entry
+            segment, queue = entry
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield index, segment, item
+            index += 1
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,250 @@
+# ---------------------------- benchmark.py ----------------------------
+# بنچمارک بار سرتاسری برای /reply، /reply/stream، /summarize و /tts.
+#
+# بدون --url، سرور در همین پروسه (در یک thread جدا) با بک‌اند fake بالا می‌آید تا
+# بدون مصرف سهمیه‌ی API اندازه‌گیری شود؛ تأخیر خود حلقه‌ی رویداد سرور هم نمونه‌برداری می‌شود.
+# با --url یک سرور در حال اجرا اندازه‌گیری می‌شود (در این حالت lag گزارش نمی‌شود).
+#
+# نمونه:
+#   python -m backend.benchmark --routes reply,tts --concurrency 1,8,32 --requests 200
+#   FAKE_GEMINI_ERROR_RATE=0.1 python -m backend.benchmark --routes reply
+#
+# نیاز به httpx دارد (pip install httpx).
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROUTES = ("reply", "reply-stream", "summarize", "tts")
+
+# --------------------------- آمار ---------------------------
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+class LagSampler:
+    """تأخیر حلقه‌ی رویداد: هر interval می‌خوابد و اضافه‌ی زمان بیداری را ثبت می‌کند."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self.running = True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def take(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+# --------------------------- سرور درون‌پروسه ---------------------------
+
+class InProcessServer:
+    def __init__(self):
+        # بک‌اند fake و محدودیت‌های باز، مگر این‌که کاربر خودش تعیین کرده باشد
+        os.environ.setdefault("GEMINI_BACKEND", "fake")
+        os.environ.setdefault("GEMINI_RATE_LIMIT", "0")
+        os.environ.setdefault("CLIENT_RATE_PER_MIN", "0")
+        os.environ.setdefault("UPSTREAM_QUEUE_SIZE", "100000")
+        os.environ.setdefault("TTS_CACHE_DIR", tempfile.mkdtemp(prefix="tts-bench-"))
+
+        import uvicorn
+        from backend.app.main import create_app
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(
+            create_app(), host="127.0.0.1", port=self.port, log_level="warning"))
+        self.loop = asyncio.new_event_loop()
+        self.lag = LagSampler()
+        self.thread = threading.Thread(
+            target=self.loop.run_until_complete, args=(self.server.serve(),), daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        asyncio.run_coroutine_threadsafe(self.lag.run(), self.loop)
+
+    def stop(self):
+        self.lag.running = False
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+# --------------------------- بار ---------------------------
+
+def make_request(route: str, i: int, args):
+    # پرامپت‌ها یکتا هستند تا کش پاسخ دور زده شود، مگر با --repeat
+    n = i % args.repeat if args.repeat else i
+    if route == "reply":
+        return "/reply", {"user_message": f"سوال شماره {n}: ساختار داده‌ی صف چیست؟"}
+    if route == "reply-stream":
+        return "/reply/stream", {"user_message": f"سوال شماره {n}: درخت دودویی را توضیح بده."}
+    if route == "summarize":
+        text = (f"بخش {n}. " + "این یک جمله‌ی نمونه برای خلاصه‌سازی است. " * 40 + "\n\n") * args.summary_paragraphs
+        return "/summarize", {"text_to_summarize": text}
+    return "/tts", {"text": f"پاسخ شماره {n}. " + "این یک جمله برای خواندن است. " * args.tts_sentences,
+                    "profile": args.tts_profile}
+
+
+async def one_request(client, route, i, args):
+    path, body = make_request(route, i, args)
+    start = time.perf_counter()
+    ttfb = None
+    size = 0
+    try:
+        async with client.stream("POST", path, json=body) as resp:
+            async for chunk in resp.aiter_raw():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                size += len(chunk)
+            status = resp.status_code
+    except Exception as e:
+        status = type(e).__name__
+    elapsed = time.perf_counter() - start
+    return {"status": status, "latency": elapsed, "ttfb": ttfb if ttfb is not None else elapsed,
+            "bytes": size}
+
+
+async def run_level(client, route, concurrency, args):
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+    results = []
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(await one_request(client, route, args.offset + i, args))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    args.offset += args.requests
+    return results, wall
+
+
+def summarize_level(route, concurrency, results, wall, lag):
+    ok = [r for r in results if r["status"] == 200]
+    errors = {}
+    for r in results:
+        if r["status"] != 200:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+    latencies = [r["latency"] for r in ok]
+    ttfbs = [r["ttfb"] for r in ok]
+    return {
+        "route": route,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency_ms": {p: round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)},
+        "ttfb_ms": {p: round(percentile(ttfbs, p) * 1000, 1) for p in (50, 95, 99)},
+        "mb_per_s": round(sum(r["bytes"] for r in ok) / wall / 1e6, 3) if wall else 0.0,
+        "loop_lag_ms": None if lag is None else {
+            "p99": round(percentile(lag, 99) * 1000, 2),
+            "max": round(max(lag, default=0) * 1000, 2),
+        },
+    }
+
+
+def print_row(row):
+    lag = row["loop_lag_ms"]
+    lag_text = "-" if lag is None else f"{lag['p99']:.1f}/{lag['max']:.1f}"
+    errors = ",".join(f"{k}:{v}" for k, v in row["errors"].items()) or "-"
+    print(f"{row['route']:<13}{row['concurrency']:>5}{row['ok']:>6}/{row['requests']:<6}"
+          f"{row['throughput_rps']:>9.1f}"
+          f"{row['latency_ms'][50]:>9.0f}{row['latency_ms'][95]:>9.0f}{row['latency_ms'][99]:>9.0f}"
+          f"{row['ttfb_ms'][50]:>9.0f}{row['ttfb_ms'][95]:>9.0f}"
+          f"{lag_text:>13}  {errors}")
+
+
+async def main_async(args, server):
+    import httpx
+
+    rows = []
+    print(f"{'route':<13}{'conc':>5}{'ok/total':>13}{'rps':>9}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}{'ttfb50':>9}{'ttfb95':>9}{'lag p99/max':>13}  errors")
+    for route in args.routes:
+        for concurrency in args.concurrency:
+            limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+                if server:
+                    server.lag.take()
+                results, wall = await run_level(client, route, concurrency, args)
+                lag = server.lag.take() if server else None
+            row = summarize_level(route, concurrency, results, wall, lag)
+            print_row(row)
+            rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark for the chatbot API.")
+    parser.add_argument("--url", help="base URL of a running server; default: in-process server with the fake backend")
+    parser.add_argument("--routes", default="reply,reply-stream,summarize,tts",
+                        help=f"comma-separated subset of {','.join(ROUTES)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per route and level")
+    parser.add_argument("--repeat", type=int, default=0,
+                        help="cycle through this many distinct prompts (exercises the caches); 0 = all unique")
+    parser.add_argument("--summary-paragraphs", type=int, default=3)
+    parser.add_argument("--tts-sentences", type=int, default=6)
+    parser.add_argument("--tts-profile", default="pcm24k", help="TTS output profile (see audio_profiles.py)")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    args.routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = set(args.routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.offset = 0
+
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        sys.exit("benchmark needs httpx: pip install httpx")
+
+    server = None
+    if not args.url:
+        server = InProcessServer()
+        server.start()
+        args.url = server.url
+    try:
+        rows = asyncio.run(main_async(args, server))
+    finally:
+        if server:
+            server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
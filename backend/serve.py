@@ -0,0 +1,71 @@
+# ---------------------------- serve.py ----------------------------
+# اجرای production روی یک ماشین: چند پروسه‌ی uvicorn با تنظیمات Settings.
+#   - هر worker اپ را خودش با create_app می‌سازد، پس کلاینت‌های Gemini، کش‌ها و warmup
+#     در هر پروسه جدا انجام می‌شوند (پروسه‌ی ناظر هیچ کلاینتی نمی‌سازد)
+#   - سهمیه‌ی سراسری GEMINI_RATE_LIMIT بین workerها تقسیم می‌شود؛ بقیه‌ی محدودیت‌ها و
+#     کش‌ها مال هر worker هستند (/metrics و /cache/stats هم فقط همان worker را نشان می‌دهند)
+#   - SIGTERM/SIGINT: پذیرش اتصال تازه قطع می‌شود، درخواست‌ها و استریم‌های در حال اجرا تا
+#     GRACEFUL_SHUTDOWN_TIMEOUT فرصت تمام شدن دارند و بعد lifespan (ذخیره‌ی کش معنایی) اجرا می‌شود
+#
+# نمونه:
+#   WEB_CONCURRENCY=4 python -m backend.serve
+#   python -m backend.serve --workers 0 --port 9000      # یک worker برای هر هسته
+
+import argparse
+import os
+
+import uvicorn
+
+from backend.app.settings import Settings
+
+# آرگومان‌های خط فرمان از طریق env به workerها می‌رسند، چون هر worker تنظیماتش را
+# خودش با Settings.from_env می‌خواند
+_OVERRIDES = {
+    "host": "HOST",
+    "port": "PORT",
+    "workers": "WEB_CONCURRENCY",
+    "keep_alive": "KEEP_ALIVE_TIMEOUT",
+    "graceful_shutdown_timeout": "GRACEFUL_SHUTDOWN_TIMEOUT",
+    "threadpool_size": "THREADPOOL_SIZE",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the chatbot API with multiple workers.")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--workers", type=int, help="0 = one worker per CPU core")
+    parser.add_argument("--keep-alive", dest="keep_alive", type=float)
+    parser.add_argument("--graceful-shutdown-timeout", dest="graceful_shutdown_timeout", type=float)
+    parser.add_argument("--threadpool-size", dest="threadpool_size", type=int)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    for field, env in _OVERRIDES.items():
+        value = getattr(args, field)
+        if value is not None:
+            os.environ[env] = str(value)
+    settings = Settings.from_env()
+    # تعداد نهایی (مثلاً بعد از تبدیل 0 به تعداد هسته‌ها) تا workerها سهمیه را درست تقسیم کنند
+    os.environ["WEB_CONCURRENCY"] = str(settings.workers)
+
+    print(f"🚀 Serving on {settings.host}:{settings.port} with {settings.workers} worker(s).")
+    uvicorn.run(
+        "backend.app.main:create_app",
+        factory=True,
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+        timeout_keep_alive=settings.keep_alive,
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout or None,
+        backlog=settings.backlog,
+        limit_concurrency=settings.limit_concurrency or None,
+        lifespan="on",
+        # IP کاربر را gateway با TRUSTED_PROXY_HOPS از X-Forwarded-For درمی‌آورد
+        proxy_headers=False,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
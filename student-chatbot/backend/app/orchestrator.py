@@ -1,56 +0,0 @@
-import os
-from dotenv import load_dotenv
-import google.generativeai as genai
-
-load_dotenv()  # بارگذاری متغیرهای محیطی از فایل .env
-
-# بررسی کلید API به صورت سراسری
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-model = None
-SETUP_ERROR = None
-
-if not GEMINI_API_KEY:
-    print("⚠️ خطا: متغیر محیطی GEMINI_API_KEY تنظیم نشده است!")
-    SETUP_ERROR = "کلید API (GEMINI_API_KEY) در فایل‌های محیطی (مثل .env) یافت نشد."
-else:
-    try:
-        # تنظیم کلاینت Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-
-        # ساخت مدل با دستورالعمل دقیق (شامل معرفی سازنده)
-        # ابزار جستجو حذف شده است تا از خطای FunctionDeclaration جلوگیری شود.
-        model = genai.GenerativeModel(
-            'gemini-2.5-flash',
-            system_instruction="""تو یک دستیار هوشمند و دلسوز دانشجویان هستی که به زبان فارسی پاسخ می‌دهی.
-وظیفه اصلی تو پاسخ دادن به سوالات درسی، پروژه‌ای، برنامه‌نویسی و ارائه راهنمایی‌های تحصیلی است.
-
-قواعد پاسخگویی مهم:
-1.  **پاسخ به سوالات درسی:** همیشه پاسخی جامع، دقیق و متناسب با سطح دانشگاهی ارائه بده.
-2.  **پاسخ به سوالات سازنده:** اگر کاربر در مورد «سازنده»، «توسعه‌دهنده»، «نویسنده» یا «چه کسی تو را ساخته» پرسید، دقیقاً این متن را به او بگو:
-    «من توسط **محمدحسین تاجیک** با استفاده از هوش مصنوعی گوگل (Gemini) توسعه داده شده‌ام. هدف من کمک به رشد تحصیلی شماست. می‌تونی محمدحسین رو در اینستاگرام دنبال کنی: https://www.instagram.com/mohmels/»
-"""
-        )
-    except Exception as e:
-        print(f"⚠️ خطا در تنظیم Gemini API: {str(e)}")
-        SETUP_ERROR = f"خطا در تنظیمات اولیه مدل: {str(e)}"
-
-def get_reply_user(user_text: str) -> str:
-    """
-    این تابع متن کاربر رو می‌گیره و از Google Gemini پاسخ واقعی می‌گیره.
-    """
-    # بررسی مدل قبل از استفاده
-    if model is None:
-        detailed_error = SETUP_ERROR if SETUP_ERROR else "خطای نامشخص در تنظیمات."
-        return f"⚠️ خطای تنظیمات بک‌اند: {detailed_error} لطفاً کلید API را بررسی کنید."
-
-    try:
-        # 🟢 نکته حیاتی: ابزار جستجو حذف شد
-        response = model.generate_content(user_text)
-        
-        if response.text:
-            return response.text.strip()
-        else:
-            return "پاسخی دریافت نشد."
-
-    except Exception as e:
-        return f"خطا در گرفتن پاسخ از Gemini: {str(e)}"
\ No newline at end of file
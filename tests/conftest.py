@@ -0,0 +1,9 @@
+import os
+
+# بک‌اند fake سریع، بدون کلید و بدون شبکه (model_backend.py و fake_gemini.py)؛
+# باید قبل از import ماژول‌های اپ تنظیم شود
+os.environ.setdefault("GEMINI_BACKEND", "fake")
+os.environ.setdefault("FAKE_GEMINI_LATENCY", "0.01")
+os.environ.setdefault("FAKE_GEMINI_TOKENS_PER_SEC", "100000")
+os.environ.setdefault("FAKE_GEMINI_REPLY_TOKENS", "40")
+os.environ.setdefault("FAKE_GEMINI_AUDIO_SPEEDUP", "1000")
@@ -0,0 +1,68 @@
+# تجزیه‌ی هدر Range و پاسخ 206/416 برای فایل‌های کش‌شده.
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from backend.app import audio_cache as audio_cache_module
+from backend.app.audio_cache import AudioCache, _parse_range, cached_audio_response
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-199", (100, 199)),
+    ("bytes=990-5000", (990, 999)),        # انتهای بیش از اندازه کوتاه می‌شود
+    ("bytes=500-", (500, 999)),            # باز
+    ("bytes=999-", (999, 999)),
+    ("bytes=-100", (900, 999)),            # انتهایی
+    ("bytes=-5000", (0, 999)),             # انتهایی بزرگ‌تر از فایل: کل فایل
+    (" bytes=0-0 ", (0, 0)),
+])
+def test_parse_range_satisfiable(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1200", "bytes=5-3", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    assert _parse_range(header, 1000) is False
+
+
+@pytest.mark.parametrize("header", ["bytes=-", "bytes=0-1,5-6", "items=0-1", "bytes=a-b", ""])
+def test_parse_range_unsupported_is_ignored(header):
+    assert _parse_range(header, 1000) is None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # حافظه‌ی صفر تا پاسخ از مسیر دیسک (mmap) ساخته شود
+    cache = AudioCache(str(tmp_path), memory_bytes=0, disk_bytes=1 << 20)
+    cache.put("ab12", bytes(range(256)) * 4)
+    monkeypatch.setattr(audio_cache_module, "audio_cache", cache)
+
+    async def endpoint(request):
+        return await cached_audio_response(request, request.path_params["key"])
+
+    return TestClient(Starlette(routes=[Route("/audio/{key}", endpoint)]))
+
+
+def test_cached_response_ranges(client):
+    full = client.get("/audio/ab12")
+    assert full.status_code == 200 and len(full.content) == 1024
+    assert full.headers["accept-ranges"] == "bytes"
+
+    partial = client.get("/audio/ab12", headers={"Range": "bytes=-4"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == "bytes 1020-1023/1024"
+    assert partial.content == full.content[-4:]
+
+    unsatisfiable = client.get("/audio/ab12", headers={"Range": "bytes=2000-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */1024"
+
+    # If-Range با ETag دیگر: Range نادیده گرفته می‌شود
+    stale = client.get("/audio/ab12", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert stale.status_code == 200 and len(stale.content) == 1024
+
+    etag = full.headers["etag"]
+    assert client.get("/audio/ab12", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,149 @@
+# کدک‌های G.711 و IMA-ADPCM در برابر مقادیر مرجع و دیکودر استاندارد.
+
+import struct
+
+import numpy as np
+import pytest
+
+from backend.app.audio_profiles import (
+    ADPCM_BLOCK_ALIGN, ADPCM_BLOCK_SAMPLES, AudioEncoder, encode_adpcm_blocks, encode_alaw,
+    encode_mulaw,
+)
+
+# مقادیر مرجع g711.c (همان خروجی audioop.lin2ulaw/lin2alaw)
+SAMPLES = [0, 1, -1, 8, -8, 100, -100, 1000, -1000, 5000, -5000,
+           32767, -32768, 32000, -32000, 256, -256]
+MULAW = "ffff7efe7ef272ce4eab2b80008000e767"
+ALAW = "d5d555d555d353fa7a8606aa2aaa2ac55a"
+
+
+def _mulaw_decode(code: int) -> int:
+    code = ~code & 0xFF
+    value = (((code & 0x0F) << 3) + 0x84) << ((code & 0x70) >> 4)
+    return 0x84 - value if code & 0x80 else value - 0x84
+
+
+def _alaw_decode(code: int) -> int:
+    code ^= 0x55
+    value = (code & 0x0F) << 4
+    seg = (code & 0x70) >> 4
+    if seg == 0:
+        value += 8
+    elif seg == 1:
+        value += 0x108
+    else:
+        value = (value + 0x108) << (seg - 1)
+    return value if code & 0x80 else -value
+
+
+def test_g711_reference_vectors():
+    pcm = np.array(SAMPLES, dtype=np.int16)
+    assert encode_mulaw(pcm).hex() == MULAW
+    assert encode_alaw(pcm).hex() == ALAW
+
+
+@pytest.mark.parametrize("encode, decode", [(encode_mulaw, _mulaw_decode),
+                                            (encode_alaw, _alaw_decode)])
+def test_g711_round_trip(encode, decode):
+    # هر کد 8 بیتی بعد از دیکود و انکود دوباره همان کد می‌شود (صفر منفی μ-law صفر مثبت است)
+    codes = [c for c in range(256) if not (encode is encode_mulaw and c == 0x7F)]
+    decoded = np.array([decode(c) for c in codes], dtype=np.int16)
+    assert list(encode(decoded)) == codes
+
+    # خطای کوانتیزه کردن نسبی است: حداکثر حدود 1/16 دامنه (به‌علاوه‌ی گام صفر)
+    pcm = np.arange(-32768, 32768, 7, dtype=np.int16)
+    restored = np.array([decode(c) for c in encode(pcm)])
+    assert np.all(np.abs(restored - pcm) <= np.abs(pcm.astype(np.int32)) / 16 + 16)
+
+# --------------------------- IMA-ADPCM ---------------------------
+
+_STEPS = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+]
+_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8]
+
+
+def _adpcm_decode(data: bytes) -> np.ndarray:
+    """دیکودر مرجع IMA-ADPCM در WAV (مونو): هدر 4 بایتی، نیم‌بایت پایین اول."""
+    out = []
+    for offset in range(0, len(data), ADPCM_BLOCK_ALIGN):
+        block = data[offset:offset + ADPCM_BLOCK_ALIGN]
+        predictor, index = struct.unpack("<hB", block[:3])
+        assert block[3] == 0 and 0 <= index <= 88
+        out.append(predictor)
+        for byte in block[4:]:
+            for code in (byte & 0x0F, byte >> 4):
+                step = _STEPS[index]
+                diff = step >> 3
+                if code & 4:
+                    diff += step
+                if code & 2:
+                    diff += step >> 1
+                if code & 1:
+                    diff += step >> 2
+                predictor += -diff if code & 8 else diff
+                predictor = max(-32768, min(32767, predictor))
+                index = max(0, min(88, index + _INDEX[code & 7]))
+                out.append(predictor)
+    return np.array(out)
+
+
+def _tone(seconds: float, rate: int) -> np.ndarray:
+    t = np.arange(int(seconds * rate)) / rate
+    signal = 8000 * np.sin(2 * np.pi * 440 * t) + 3000 * np.sin(2 * np.pi * 1250 * t)
+    return np.rint(signal).astype(np.int16)
+
+
+def test_adpcm_round_trip():
+    pcm = _tone(0.5, 8000)
+    pcm = pcm[:len(pcm) - len(pcm) % ADPCM_BLOCK_SAMPLES]
+    data = encode_adpcm_blocks(pcm)
+    assert len(data) == len(pcm) // ADPCM_BLOCK_SAMPLES * ADPCM_BLOCK_ALIGN
+
+    decoded = _adpcm_decode(data)
+    assert len(decoded) == len(pcm)
+    # نمونه‌ی اول هر بلوک بدون خطا در هدر است
+    assert np.array_equal(decoded[::ADPCM_BLOCK_SAMPLES], pcm[::ADPCM_BLOCK_SAMPLES])
+    noise = decoded - pcm
+    snr = 10 * np.log10(np.mean(pcm.astype(np.float64) ** 2) / np.mean(noise ** 2))
+    assert snr > 20
+
+
+def test_adpcm_silence_and_extremes():
+    for value in (0, 32767, -32768):
+        pcm = np.full(ADPCM_BLOCK_SAMPLES * 2, value, dtype=np.int16)
+        decoded = _adpcm_decode(encode_adpcm_blocks(pcm))
+        assert np.abs(decoded - value).max() <= 8
+
+
+@pytest.mark.parametrize("profile", ["adpcm8k", "adpcm16k"])
+def test_adpcm_stream_matches_single_encode(profile):
+    encoder = AudioEncoder(profile, source_rate=AudioEncoder(profile).sample_rate)
+    pcm = _tone(1.3, encoder.sample_rate)
+    raw = pcm.astype("<i2").tobytes()
+    # تکه‌های ناهم‌اندازه و نیمه‌نمونه، مثل استریم Gemini
+    out, pos, sizes = [], 0, [1, 999, 4000, 333, 80001]
+    while pos < len(raw):
+        size = sizes[len(out) % len(sizes)]
+        out.append(encoder.encode(raw[pos:pos + size]))
+        pos += size
+    out.append(encoder.flush())
+
+    padded = np.concatenate((pcm, np.zeros(-len(pcm) % ADPCM_BLOCK_SAMPLES, dtype=np.int16)))
+    assert b"".join(out) == encode_adpcm_blocks(padded)
+
+
+def test_adpcm_wav_header():
+    encoder = AudioEncoder("adpcm8k")
+    header = encoder.header(ADPCM_BLOCK_ALIGN * 10)
+    tag, channels, rate, _, align, bits, extra, per_block = struct.unpack(
+        "<HHIIHHHH", header[20:40])
+    assert (tag, channels, rate, align, bits, extra, per_block) == (
+        0x11, 1, 8000, ADPCM_BLOCK_ALIGN, 4, 2, ADPCM_BLOCK_SAMPLES)
+    assert header[-8:] == b"data" + struct.pack("<I", ADPCM_BLOCK_ALIGN * 10)
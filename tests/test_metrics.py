@@ -0,0 +1,45 @@
+# gauge threadpool_threads باید executor واقعی asyncio.to_thread را نشان دهد.
+
+import asyncio
+import threading
+
+from backend.app.metrics import InstrumentedThreadPool, render_all
+
+
+def _threadpool_lines():
+    return [line for line in render_all().splitlines()
+            if line.startswith('threadpool_threads{pool="default"')]
+
+
+def test_default_executor_saturation_is_visible():
+    release = threading.Event()
+
+    async def scenario():
+        pool = InstrumentedThreadPool(max_workers=2)
+        asyncio.get_running_loop().set_default_executor(pool)
+        jobs = [asyncio.ensure_future(asyncio.to_thread(release.wait)) for _ in range(3)]
+        for _ in range(100):
+            if pool.busy == 2:
+                break
+            await asyncio.sleep(0.01)
+        lines = _threadpool_lines()
+        assert (pool.busy, pool.queued) == (2, 1)
+        assert 'threadpool_threads{pool="default",state="busy"} 2' in lines
+        assert 'threadpool_threads{pool="default",state="queued"} 1' in lines
+
+        release.set()
+        await asyncio.gather(*jobs)
+        assert (pool.busy, pool.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_exceptions_release_the_counters():
+    def fail():
+        raise ValueError("boom")
+
+    with InstrumentedThreadPool(max_workers=1) as pool:
+        future = pool.submit(fail)
+        assert isinstance(future.exception(), ValueError)
+        assert pool.submit(sum, [1, 2]).result() == 3
+        assert (pool.busy, pool.queued) == (0, 0)
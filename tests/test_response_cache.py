@@ -0,0 +1,152 @@
+# single-flight کش پاسخ‌ها: یک فراخوانی برای درخواست‌های هم‌زمان، لغو آخرین منتظر و مهلت هر منتظر.
+
+import asyncio
+
+import pytest
+
+from backend.app.gateway import UpstreamTimeout, remaining, set_deadline
+from backend.app.response_cache import ResponseCache, document_key, normalize_prompt
+
+
+class _Upstream:
+    """compute قابل کنترل: تا release صبر می‌کند و تعداد اجرا و لغو را می‌شمارد."""
+
+    def __init__(self, value="answer", cacheable=True):
+        self.value = value
+        self.cacheable = cacheable
+        self.calls = 0
+        self.cancelled = 0
+        self.deadlines = []
+        self.gate = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        self.deadlines.append(remaining())
+        try:
+            await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.value, self.cacheable
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_requests_share_one_call():
+    async def scenario():
+        cache = ResponseCache(maxsize=8, ttl=60)
+        upstream = _Upstream()
+        tasks = [asyncio.create_task(cache.get_or_compute("k", upstream)) for _ in range(5)]
+        await _settle()
+        upstream.gate.set()
+        results = await asyncio.gather(*tasks)
+
+        assert results == [("answer", True)] * 5
+        assert upstream.calls == 1
+        assert (cache.misses, cache.coalesced) == (1, 4)
+        # بعد از تمام شدن، از کش خوانده می‌شود
+        assert await cache.get_or_compute("k", upstream) == ("answer", True)
+        assert upstream.calls == 1 and cache.hits == 1
+
+    asyncio.run(scenario())
+
+
+def test_uncacheable_result_is_shared_but_not_stored():
+    async def scenario():
+        cache = ResponseCache(maxsize=8, ttl=60)
+        upstream = _Upstream("error", cacheable=False)
+        tasks = [asyncio.create_task(cache.get_or_compute("k", upstream)) for _ in range(2)]
+        await _settle()
+        upstream.gate.set()
+        assert await asyncio.gather(*tasks) == [("error", False)] * 2
+        assert upstream.calls == 1
+        assert cache.get("k") is None
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_one_waiter_keeps_shared_call():
+    async def scenario():
+        cache = ResponseCache(maxsize=8, ttl=60)
+        upstream = _Upstream()
+        first = asyncio.create_task(cache.get_or_compute("k", upstream))
+        second = asyncio.create_task(cache.get_or_compute("k", upstream))
+        await _settle()
+
+        first.cancel()
+        await _settle()
+        assert upstream.cancelled == 0
+        upstream.gate.set()
+        assert await second == ("answer", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert cache.get("k") == "answer"
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_last_waiter_cancels_shared_call():
+    async def scenario():
+        cache = ResponseCache(maxsize=8, ttl=60)
+        upstream = _Upstream()
+        tasks = [asyncio.create_task(cache.get_or_compute("k", upstream)) for _ in range(2)]
+        await _settle()
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _settle()
+        assert upstream.cancelled == 1
+        assert cache.stats()["size"] == 0 and not cache._inflight
+
+        # درخواست بعدی فراخوانی تازه‌ای شروع می‌کند
+        upstream.gate.set()
+        assert await cache.get_or_compute("k", upstream) == ("answer", True)
+        assert upstream.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_waiter_deadline_does_not_bind_shared_call():
+    async def scenario():
+        cache = ResponseCache(maxsize=8, ttl=60)
+        upstream = _Upstream()
+
+        async def request(deadline):
+            set_deadline(deadline)
+            return await cache.get_or_compute("k", upstream)
+
+        short = asyncio.create_task(request(0.05))
+        await _settle()
+        long = asyncio.create_task(request(5))
+        with pytest.raises(UpstreamTimeout):
+            await short
+        assert upstream.cancelled == 0
+        upstream.gate.set()
+        assert await long == ("answer", True)
+        # فراخوانی مشترک مهلت اولین درخواست را به ارث نبرده است
+        assert upstream.deadlines == [float("inf")]
+
+    asyncio.run(scenario())
+
+
+def test_lru_and_ttl():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1
+
+    expired = ResponseCache(maxsize=2, ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is None
+
+
+def test_normalized_keys():
+    assert normalize_prompt("  سلام‌دنيا  ۱۲ ") == normalize_prompt("سلام دنیا 12")
+    assert document_key("متن  كامل") == document_key("متن کامل")
+    assert len(document_key("x" * 100000)) == 64
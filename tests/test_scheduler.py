@@ -0,0 +1,146 @@
+# ترتیب کلاس‌ها (weighted fair queuing)، اولویت کار کوتاه و aging، و لغو کار در صف.
+
+import asyncio
+
+import pytest
+
+from backend.app.gateway import Overloaded, set_deadline
+from backend.app.scheduler import Scheduler
+
+
+class _Bucket:
+    """سطل توکن بدون محدودیت؛ این تست‌ها فقط ترتیب نوبت را بررسی می‌کنند."""
+    rate = 10.0
+
+    def reserve(self, max_wait):
+        return True, 0.0
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _dispatch_order(scheduler, jobs, holder="chat"):
+    """
+    یک جا را نگه می‌دارد، jobs (برچسب، کلاس، هزینه) را به ترتیب در صف می‌گذارد و بعد
+    جاها را یکی‌یکی آزاد می‌کند؛ ترتیب گرفتن نوبت را برمی‌گرداند.
+    """
+    order = []
+    await scheduler.acquire(holder, 1)
+
+    async def run(label, name, cost):
+        order.append((label, await scheduler.acquire(name, cost)))
+
+    tasks = []
+    for job in jobs:
+        tasks.append(asyncio.create_task(run(*job)))
+        await _settle()
+    release = holder
+    for _ in jobs:
+        scheduler.release(release)
+        await _settle()
+        release = order[-1][1]
+    await asyncio.gather(*tasks)
+    return [label for label, _ in order]
+
+
+def test_weighted_classes_interleave():
+    scheduler = Scheduler(1, _Bucket(), weights={"chat": 8, "batch": 1}, aging=0)
+    jobs = [(f"b{i}", "batch", 100) for i in range(3)] + [(f"c{i}", "chat", 100) for i in range(3)]
+    order = asyncio.run(_dispatch_order(scheduler, jobs))
+    # batch فقط سهم وزنش را می‌گیرد: بعد از اولین کار batch همه‌ی چت‌ها جلو می‌افتند
+    assert order == ["b0", "c0", "c1", "c2", "b1", "b2"]
+    assert scheduler.free == 0
+
+
+def test_shorter_job_first_within_class():
+    scheduler = Scheduler(1, _Bucket(), weights={"chat": 1}, aging=0)
+    jobs = [("long", "chat", 1000), ("medium", "chat", 100), ("short", "chat", 10)]
+    assert asyncio.run(_dispatch_order(scheduler, jobs)) == ["short", "medium", "long"]
+
+
+def test_aging_lets_long_job_overtake():
+    async def scenario():
+        scheduler = Scheduler(1, _Bucket(), weights={"chat": 1}, aging=100000)
+        await scheduler.acquire("chat", 1)
+        order = []
+
+        async def run(label, cost):
+            await scheduler.acquire("chat", cost)
+            order.append(label)
+
+        long = asyncio.create_task(run("long", 1000))
+        await asyncio.sleep(0.05)   # 0.05s انتظار = 5000 توکن اولویت
+        short = asyncio.create_task(run("short", 10))
+        await _settle()
+        scheduler.release("chat")
+        await _settle()
+        scheduler.release("chat")
+        await asyncio.gather(long, short)
+        return order
+
+    assert asyncio.run(scenario()) == ["long", "short"]
+
+
+def test_unknown_class_falls_back_to_chat():
+    async def scenario():
+        scheduler = Scheduler(1, _Bucket(), weights={"chat": 1})
+        return await scheduler.acquire("unknown", 1)
+
+    assert asyncio.run(scenario()) == "chat"
+
+
+def test_cancel_while_queued_skips_job():
+    async def scenario():
+        scheduler = Scheduler(1, _Bucket(), weights={"chat": 1, "batch": 1})
+        await scheduler.acquire("chat", 1)
+        queued = asyncio.create_task(scheduler.acquire("batch", 1))
+        await _settle()
+        assert scheduler.stats()["classes"]["batch"]["queued"] == 1
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert scheduler.stats()["classes"]["batch"]["queued"] == 0
+
+        # جای آزادشده به کار لغوشده نمی‌رسد و کار بعدی بلافاصله نوبت می‌گیرد
+        scheduler.release("chat")
+        assert scheduler.free == 1
+        assert await asyncio.wait_for(scheduler.acquire("batch", 1), 1) == "batch"
+        assert scheduler.free == 0
+        assert scheduler.stats()["classes"]["batch"]["dispatched"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_raises_overloaded():
+    async def scenario():
+        scheduler = Scheduler(1, _Bucket(), weights={"chat": 1})
+        await scheduler.acquire("chat", 1)
+
+        async def waiter():
+            set_deadline(0.05)
+            return await scheduler.acquire("chat", 1)
+
+        with pytest.raises(Overloaded):
+            await waiter()
+        assert scheduler.stats()["classes"]["chat"]["queued"] == 0
+        scheduler.release("chat")
+        assert scheduler.free == 1
+
+    asyncio.run(scenario())
+
+
+def test_resize_dispatches_waiting_jobs():
+    async def scenario():
+        scheduler = Scheduler(1, _Bucket(), weights={"chat": 1})
+        await scheduler.acquire("chat", 1)
+        queued = asyncio.create_task(scheduler.acquire("chat", 1))
+        await _settle()
+        assert not queued.done()
+        scheduler.resize(2)
+        assert await asyncio.wait_for(queued, 1) == "chat"
+        assert scheduler.free == 0
+
+    asyncio.run(scenario())
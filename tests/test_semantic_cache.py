@@ -0,0 +1,112 @@
+# آستانه‌ی پیش‌فرض کش معنایی روی جفت سوال‌های واقعی: هم‌معناها باید برخورد کنند و
+# سوال‌هایی که پاسخ متفاوت می‌خواهند (ترتیب، عدد یا نام دیگر) هرگز.
+
+import time
+
+import numpy as np
+import pytest
+
+from backend.app.semantic_cache import SEMANTIC_CACHE_THRESHOLD, SemanticCache, embed, entities
+
+SAME = [
+    ("what is a linked list", "explain linked lists"),
+    ("What is recursion?", "explain recursion"),
+    ("define polymorphism", "what is polymorphism?"),
+    ("What is a hash table?", "what's a hash table"),
+    ("explain binary search trees", "what is a binary search tree"),
+    ("how do I reverse a string in python", "how to reverse a string in python"),
+    ("what is recursion", "what is recursoin"),
+    ("لیست پیوندی چیست؟", "لیست‌های پیوندی را توضیح بده"),
+    ("پیچیدگی زمانی جستجوی دودویی چیست", "پیچیدگی زمانی جستجوی دودویی چقدر است؟"),
+    ("بازگشت در برنامه نویسی چیست", "بازگشت در برنامه‌نویسی را توضیح بده"),
+]
+
+DIFFERENT = [
+    ("is python faster than java", "is java faster than python"),
+    ("is tcp more reliable than udp", "is udp more reliable than tcp"),
+    ("what is 12*13", "what is 12*14"),
+    ("what is the capital of France", "what is the capital of Germany"),
+    ("what is TCP", "what is UDP"),
+    ("what is a linked list", "what is a doubly linked list"),
+    ("how to sort a list in python", "how to reverse a list in python"),
+    ("convert 5 km to miles", "convert 8 km to miles"),
+    ("آیا پایتون از جاوا سریع‌تر است", "آیا جاوا از پایتون سریع‌تر است"),
+    ("۱۲ ضربدر ۱۳ چند می‌شود", "۱۲ ضربدر ۱۴ چند می‌شود"),
+    ("تفاوت TCP و UDP", "تفاوت TCP و HTTP"),
+]
+
+
+@pytest.mark.parametrize("stored, asked", SAME)
+def test_paraphrase_hits(stored, asked):
+    cache = SemanticCache(capacity=16)
+    cache.add(stored, "answer")
+    assert cache.lookup(asked) == "answer"
+
+
+@pytest.mark.parametrize("stored, asked", DIFFERENT)
+def test_different_question_misses(stored, asked):
+    cache = SemanticCache(capacity=16)
+    cache.add(stored, "answer")
+    assert cache.lookup(asked) is None
+
+
+@pytest.mark.parametrize("stored, asked", DIFFERENT)
+def test_word_order_and_entities_lower_score(stored, asked):
+    # یا شباهت زیر آستانه است یا عددها/نام‌ها فرق دارند؛ هیچ‌کدام به شانس LSH وابسته نیست
+    score = float(embed(stored) @ embed(asked))
+    assert score < SEMANTIC_CACHE_THRESHOLD or entities(stored) != entities(asked)
+
+
+def test_entities_ignore_sentence_initial_capital():
+    assert entities("What is recursion?") == entities("what is recursion")
+    assert entities("Explain Docker") != entities("explain kubernetes")
+
+
+def test_add_same_question_replaces_answer():
+    cache = SemanticCache(capacity=4)
+    cache.add("what is a linked list", "old")
+    cache.add("What is a linked list?", "new")
+    assert len(cache) == 1
+    assert cache.lookup("explain linked lists") == "new"
+
+
+def test_expired_entry_misses():
+    cache = SemanticCache(capacity=4)
+    cache.add("what is recursion", "answer", expires_at=time.time() - 1)
+    assert cache.lookup("what is recursion") is None
+
+
+def test_lru_eviction_when_full():
+    cache = SemanticCache(capacity=2)
+    cache.add("what is a linked list", "list")
+    cache.add("what is recursion", "recursion")
+    cache.lookup("what is a linked list")
+    cache.add("what is polymorphism", "polymorphism")
+    assert len(cache) == 2
+    assert cache.lookup("what is recursion") is None
+    assert cache.lookup("what is a linked list") == "list"
+
+
+def test_snapshot_round_trip(tmp_path):
+    from backend.app.semantic_cache import save_snapshot
+
+    cache = SemanticCache(capacity=8)
+    cache.add("what is 12*13", "156")
+    cache.add("لیست پیوندی چیست؟", "پاسخ")
+    path = str(tmp_path / "semantic.npz")
+    save_snapshot(cache.snapshot(), path)
+
+    loaded = SemanticCache(capacity=8)
+    loaded.load(path)
+    assert loaded.lookup("what is 12*13") == "156"
+    assert loaded.lookup("what is 12*14") is None
+    assert loaded.lookup("لیست‌های پیوندی را توضیح بده") == "پاسخ"
+
+    # snapshot قدیمی بدون entities: از روی متن دوباره حساب می‌شوند
+    old = dict(cache.snapshot())
+    del old["entities"]
+    save_snapshot(old, path)
+    loaded = SemanticCache(capacity=8)
+    loaded.load(path)
+    assert loaded.lookup("what is 12*14") is None
+    assert np.array_equal(np.sort(loaded._entities[:2]), np.sort(cache._entities[:2]))
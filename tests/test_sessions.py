@@ -0,0 +1,37 @@
+# خلاصه‌سازی پس‌زمینه‌ی تاریخچه‌ی جلسه.
+
+import asyncio
+from types import SimpleNamespace
+
+from backend.app import orchestrator
+from backend.app.gateway import job_class, remaining, set_deadline
+from backend.app.sessions import Session
+
+
+def test_fold_does_not_inherit_the_request_deadline(monkeypatch):
+    seen = {}
+
+    async def generate(model, prompt):
+        seen.update(remaining=remaining(), job_class=job_class())
+        return SimpleNamespace(text="خلاصه‌ی تازه")
+
+    monkeypatch.setattr(orchestrator, "generate", generate)
+    monkeypatch.setattr(orchestrator, "get_model", lambda alias: None)
+
+    async def scenario():
+        session = Session("session-1")
+        for i in range(8):
+            session.add_turn("user" if i % 2 == 0 else "model", f"نوبت {i}")
+        folded = session.overflow(max_bytes=10)
+        assert folded
+
+        # درخواستی که نوبت را ساخته تقریباً به مهلتش رسیده است
+        set_deadline(0.001)
+        await asyncio.sleep(0.01)
+        # مثل _record_turn: task پس‌زمینه context همان درخواست را کپی می‌کند
+        await asyncio.create_task(orchestrator._fold_turns(session, folded))
+        return session
+
+    session = asyncio.run(scenario())
+    assert session.summary == "خلاصه‌ی تازه"
+    assert seen["remaining"] > 1 and seen["job_class"] == "summarize"
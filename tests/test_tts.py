@@ -0,0 +1,28 @@
+# تکه‌بندی متن بلند برای سنتز (split_sentences).
+
+from backend.app.tts import split_sentences
+
+
+def test_short_sentences_are_merged():
+    assert split_sentences("سلام. حالت چطوره؟ خوبم!", 20) == ["سلام. حالت چطوره؟", "خوبم!"]
+    assert split_sentences("One. Two. Three.", 100) == ["One. Two. Three."]
+
+
+def test_long_sentence_breaks_at_spaces():
+    text = "one two three four five six seven"
+    segments = split_sentences(text, 10)
+    assert all(len(s) <= 10 for s in segments)
+    assert " ".join(segments) == text
+
+
+def test_word_longer_than_limit_is_cut():
+    assert split_sentences("abcdefghijklmnop", 5) == ["abcde", "fghij", "klmno", "p"]
+
+
+def test_newlines_and_empty_text():
+    assert split_sentences("first line\n\nsecond line", 12) == ["first line", "second line"]
+    assert split_sentences("  \n ", 10) == []
+
+
+def test_decimal_point_is_not_a_sentence_end():
+    assert split_sentences("Version 1.5 is out. Try it.", 20) == ["Version 1.5 is out.", "Try it."]
@@ -0,0 +1,115 @@
+# حالت صوتی (/ws/voice): تکه‌بندی تدریجی متن، پیام‌های نامعتبر، سهم جلسه و خطاهای بالادستی.
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import fake_gemini, gateway
+from backend.app.main import create_app
+from backend.app.tts import SentenceStream, speakable_text
+
+
+@pytest.fixture
+def client():
+    with TestClient(create_app()) as client:
+        yield client
+
+
+def _events(websocket):
+    """رویدادهای متنی یک نوبت تا رویداد پایانی (done یا error)؛ صدای باینری کنار می‌رود."""
+    events = []
+    while True:
+        message = websocket.receive()
+        if message.get("text") is None:
+            continue
+        events.append(json.loads(message["text"]))
+        if events[-1]["type"] in ("done", "error") and events[-1].get("stage") != "tts":
+            return events
+
+
+def test_deadline_before_first_chunk_is_504_event(client, monkeypatch):
+    monkeypatch.setattr(fake_gemini, "FAKE_GEMINI_ERROR_RATE", 1.0)
+    monkeypatch.setattr(fake_gemini, "FAKE_GEMINI_ERROR_KIND", "hang")
+    monkeypatch.setitem(gateway.ROUTE_DEADLINES, "/ws/voice", 0.3)
+
+    with client.websocket_connect("/ws/voice") as websocket:
+        websocket.send_json({"user_message": "سلام"})
+        final = _events(websocket)[-1]
+        assert final["type"] == "error" and final["status"] == 504
+
+        # اتصال باز می‌ماند و نوبت بعدی کار می‌کند
+        monkeypatch.setattr(fake_gemini, "FAKE_GEMINI_ERROR_RATE", 0.0)
+        monkeypatch.setitem(gateway.ROUTE_DEADLINES, "/ws/voice", 30)
+        websocket.send_json({"user_message": "سلام"})
+        final = _events(websocket)[-1]
+        assert final["type"] == "done", final
+
+
+def test_malformed_frames_keep_the_socket_open(client):
+    with client.websocket_connect("/ws/voice") as websocket:
+        websocket.send_bytes(b"\x00\x01")
+        assert _events(websocket) == [{"type": "error", "status": 400,
+                                       "message": "Invalid message: expected JSON text"}]
+        websocket.send_text("{not json")
+        final = _events(websocket)[-1]
+        assert final["type"] == "error" and final["status"] == 400
+        websocket.send_json({"user_message": "سلام"})
+        assert _events(websocket)[-1]["type"] == "done"
+
+
+def test_session_key_does_not_leak_into_later_turns(client, monkeypatch):
+    charged = []
+    client_bucket = gateway.gateway._client_bucket
+
+    def record(key):
+        charged.append(key)
+        return client_bucket(key)
+
+    monkeypatch.setattr(gateway.gateway, "_client_bucket", record)
+    with client.websocket_connect("/ws/voice") as websocket:
+        for session_id in ("session-aaaa", "session-bbbb", None):
+            charged.clear()
+            message = {"user_message": "سلام"}
+            if session_id:
+                message["session_id"] = session_id
+            websocket.send_json(message)
+            assert _events(websocket)[-1]["type"] == "done"
+            sessions = {key for key in charged if key.startswith("session:")}
+            assert sessions == ({f"session:{session_id}"} if session_id else set())
+
+
+def test_stream_waits_for_whitespace_after_sentence_end():
+    stream = SentenceStream(max_chars=100, min_chars=0)
+    assert stream.feed("Version 1.") == []
+    assert stream.feed("5 is out.") == []
+    assert stream.feed(" Next") == ["Version 1.5 is out."]
+    assert stream.flush() == ["Next"]
+
+
+def test_stream_merges_short_sentences():
+    stream = SentenceStream(max_chars=100, min_chars=10)
+    assert stream.feed("Hi. Yes. ") == []
+    assert stream.feed("This one is long enough. rest") == ["Hi. Yes. This one is long enough."]
+    assert stream.flush() == ["rest"]
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 7, 1000])
+def test_stream_chunking_is_independent_of_feed_size(chunk):
+    text = ("سلام! این یک **پاسخ** نسبتاً طولانی است که باید تکه شود. جمله‌ی دوم؟ "
+            "See [docs](http://x.y). Third sentence with more words to exceed the limit. پایان")
+    stream = SentenceStream(max_chars=40, min_chars=10)
+    segments = []
+    for i in range(0, len(text), chunk):
+        segments += stream.feed(text[i:i + chunk])
+    segments += stream.flush()
+
+    assert all(0 < len(s) <= 40 for s in segments)
+    assert " ".join(" ".join(segments).split()) == " ".join(speakable_text(text).split())
+
+
+def test_stream_breaks_long_text_without_punctuation():
+    stream = SentenceStream(max_chars=20, min_chars=0)
+    segments = stream.feed("word " * 10)
+    assert segments and all(len(s) <= 20 for s in segments)
+    assert " ".join(segments + stream.flush()).split() == ["word"] * 10